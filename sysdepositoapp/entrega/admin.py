@@ -1,5 +1,18 @@
 from django.contrib import admin
-from .models import Entrega, ItemEntrega, HistoricoStatus
+from .models import Entrega, ItemEntrega, HistoricoStatus, SequenciaPedido
+from .services import alterar_status_em_lote, mensagens_do_lote
+
+
+def acao_alterar_status(status, descricao):
+    """Ação do admin que leva as entregas selecionadas para `status` em uma transação"""
+    @admin.action(description=descricao)
+    def acao(modeladmin, request, queryset):
+        alteradas, erros = alterar_status_em_lote(queryset.values_list('pk', flat=True), status, usuario=request.user)
+        for nivel, texto in mensagens_do_lote(status, alteradas, erros):
+            modeladmin.message_user(request, texto, nivel)
+
+    acao.__name__ = f'marcar_{status}'
+    return acao
 
 class ItemEntregaInline(admin.TabularInline):
     model = ItemEntrega
@@ -18,6 +31,12 @@ class EntregaAdmin(admin.ModelAdmin):
     search_fields = ['numero_pedido', 'escola__nome', 'responsavel_entrega']
     readonly_fields = ['data_criacao', 'data_atualizacao']
     inlines = [ItemEntregaInline, HistoricoStatusInline]
+    actions = [
+        acao_alterar_status('preparacao', 'Marcar selecionadas como Em Preparação'),
+        acao_alterar_status('transporte', 'Marcar selecionadas como Em Transporte'),
+        acao_alterar_status('entregue', 'Finalizar selecionadas (baixa no estoque)'),
+        acao_alterar_status('cancelada', 'Cancelar selecionadas'),
+    ]
     
     # Campos a serem exibidos no formulário
     fieldsets = [
@@ -75,4 +94,8 @@ class HistoricoStatusAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not obj.usuario_id:
             obj.usuario = request.user
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+@admin.register(SequenciaPedido)
+class SequenciaPedidoAdmin(admin.ModelAdmin):
+    list_display = ['dia', 'ultimo']
+    readonly_fields = ['dia', 'ultimo']
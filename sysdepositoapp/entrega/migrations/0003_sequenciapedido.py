@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:18
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+def preencher_sequencias(apps, schema_editor):
+    # Continua a numeração dos dias que já têm pedidos no formato AAAAMMDDSSSS
+    Entrega = apps.get_model('entrega', 'Entrega')
+    SequenciaPedido = apps.get_model('entrega', 'SequenciaPedido')
+
+    ultimos = {}
+    for numero in Entrega.objects.filter(numero_pedido__regex=r'^[0-9]{12,}$').values_list('numero_pedido', flat=True):
+        try:
+            dia = datetime.strptime(numero[:8], '%Y%m%d').date()
+        except ValueError:
+            continue
+        ultimos[dia] = max(ultimos.get(dia, 0), int(numero[8:]))
+    SequenciaPedido.objects.bulk_create(
+        [SequenciaPedido(dia=dia, ultimo=ultimo) for dia, ultimo in ultimos.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrega', '0002_alter_entrega_escola_delete_escola'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaPedido',
+            fields=[
+                ('dia', models.DateField(primary_key=True, serialize=False)),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sequência de Pedidos',
+                'verbose_name_plural': 'Sequências de Pedidos',
+            },
+        ),
+        migrations.RunPython(preencher_sequencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entrega', '0003_sequenciapedido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entrega',
+            index=models.Index(fields=['-data_criacao', '-id'], name='entrega_criacao_idx'),
+        ),
+    ]
@@ -36,67 +36,23 @@ class Entrega(models.Model):
         verbose_name = 'Entrega'
         verbose_name_plural = 'Entregas'
         ordering = ['-data_criacao']
+        indexes = [
+            # Listagem paginada, da mais recente para a mais antiga
+            models.Index(fields=['-data_criacao', '-id'], name='entrega_criacao_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
-        Gera `numero_pedido` automaticamente no formato AAAAMMDDSSSS (ano+mes+dia+sequencial)
-        O sequencial reinicia a cada dia. Para evitar colisões em concorrência, tentamos
-        inserir dentro de uma transação e, em caso de IntegrityError (único), incrementamos
-        o sequencial e re-tentamos algumas vezes.
+        Gera `numero_pedido` automaticamente no formato AAAAMMDDSSSS (ano+mes+dia+sequencial).
+        O sequencial reinicia a cada dia e vem da tabela SequenciaPedido, incrementada
+        atomicamente: custo constante por pedido, sem varrer as entregas do dia nem re-tentar.
         """
         if not self.numero_pedido:
             from django.utils import timezone
-            from django.db import transaction, IntegrityError
-
-            now = timezone.now()
-            ano = now.year
-            mes = now.month
-            dia = now.day
-
-            date_filter = {
-                'data_criacao__year': ano,
-                'data_criacao__month': mes,
-                'data_criacao__day': dia,
-            }
-
-            # Tentativas para lidar com colisões concorrentes
-            max_attempts = 10
-            sequencial = 1
-
-            for attempt in range(max_attempts):
-                try:
-                    with transaction.atomic():
-                        # Bloqueia os registros do dia para reduzir condições de corrida
-                        ultimo_pedido = type(self).objects.select_for_update().filter(**date_filter).order_by('-numero_pedido').first()
-
-                        if ultimo_pedido:
-                            try:
-                                ultimo_seq = int(ultimo_pedido.numero_pedido[-4:])
-                                sequencial = ultimo_seq + 1
-                            except Exception:
-                                # fallback: contar pedidos do dia
-                                sequencial = type(self).objects.filter(**date_filter).count() + 1
-                        else:
-                            sequencial = 1
-
-                        seq_str = str(sequencial).zfill(4)
-                        candidate = f"{ano}{mes:02d}{dia:02d}{seq_str}"
-                        self.numero_pedido = candidate
-
-                        # Tenta salvar; se houver colisão de unique, IntegrityError será lançado
-                        super().save(*args, **kwargs)
-
-                        # Salvou com sucesso
-                        return
-                except IntegrityError:
-                    # Colisão: incrementa e tenta novamente
-                    sequencial += 1
-                    continue
-
-            # Se esgotarmos as tentativas, falha explícita para investigação
-            raise IntegrityError('Não foi possível gerar um número de pedido único após várias tentativas.')
-
-        # Se já possui número (edição), salva normalmente
+
+            dia = timezone.localdate()
+            self.numero_pedido = f"{dia:%Y%m%d}{SequenciaPedido.proximo(dia):04d}"
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -117,24 +73,39 @@ class Entrega(models.Model):
             return True
         return False
 
-    def finalizar_entrega(self):
-        """Finaliza a entrega e atualiza o estoque"""
+    def finalizar_entrega(self, usuario=None):
+        """Finaliza a entrega e atualiza o estoque (ver entrega.services.finalizar_entrega)"""
+        from .services import finalizar_entrega
+
         if self.status != 'entregue':
-            self.status = 'entregue'
-            self.data_entrega_real = timezone.now().date()
-            self.save()
-            
-            # Atualizar estoque para cada item
-            for item in self.itens.all():
-                MovimentacaoEstoque = apps.get_model('estoque', 'MovimentacaoEstoque')
-                MovimentacaoEstoque.objects.create(
-                    produto=item.produto,
-                    tipo='S',  # Saída
-                    quantidade=item.quantidade,
-                    motivo='entrega',
-                    observacao=f'Entrega {self.numero_pedido} - {self.escola.nome}',
-                    usuario=self.usuario
-                )
+            return finalizar_entrega(self, usuario=usuario or self.usuario)
+
+class SequenciaPedido(models.Model):
+    """Último sequencial de número de pedido usado em cada dia"""
+    dia = models.DateField(primary_key=True)
+    ultimo = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Sequência de Pedidos'
+        verbose_name_plural = 'Sequências de Pedidos'
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y}: {self.ultimo}"
+
+    @classmethod
+    def proximo(cls, dia):
+        """
+        Reserva o próximo sequencial do dia. O UPDATE ultimo = ultimo + 1 trava a linha
+        até o fim da transação, então a leitura seguinte devolve o valor desta reserva.
+        Números de pedidos que falham ao salvar ficam sem uso, como em uma sequence.
+        """
+        from django.db import transaction
+        from django.db.models import F
+
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(dia=dia)], ignore_conflicts=True)
+            cls.objects.filter(dia=dia).update(ultimo=F('ultimo') + 1)
+            return cls.objects.filter(dia=dia).values_list('ultimo', flat=True).get()
 
 class ItemEntrega(models.Model):
     entrega = models.ForeignKey(Entrega, on_delete=models.CASCADE, related_name='itens')
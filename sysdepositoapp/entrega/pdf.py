@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.utils import timezone
+
+from relatorios.cache_pdf import renderizar_com_cache
+from .models import Entrega
+
+TEMPLATE_ENTREGA = 'entrega/entrega_pdf.html'
+
+
+def buscar_entrega(entrega_id):
+    return Entrega.objects.select_related('escola', 'usuario').prefetch_related('itens__produto').get(pk=entrega_id)
+
+
+def contexto_entrega(entrega, gerado_em=None):
+    return {
+        'entrega': entrega,
+        'gerado_em': gerado_em,
+        'STATIC_ROOT': settings.STATIC_ROOT,
+    }
+
+
+def pdf_entrega(parametros, usuario):
+    """PDF do comprovante de entrega (gerado pelo worker da fila de relatórios)"""
+    entrega = buscar_entrega(parametros['entrega_id'])
+    gerado_em = timezone.now()
+
+    # Reimpressões do mesmo comprovante saem do cache de PDFs
+    conteudo = renderizar_com_cache(TEMPLATE_ENTREGA, contexto_entrega(entrega, gerado_em), parametros.get('base_url'))
+
+    filename = f"entrega_{entrega.numero_pedido}_{timezone.localtime(gerado_em).strftime('%Y%m%d_%H%M')}.pdf"
+    return filename, conteudo
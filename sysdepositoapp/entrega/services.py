@@ -0,0 +1,221 @@
+from django.contrib import messages
+from django.db import transaction
+from django.utils import timezone
+
+from estoque.models import MovimentacaoEstoque
+from estoque.services import lancar_movimentacoes
+from produto.models import Produto
+from .models import Entrega, HistoricoStatus, ItemEntrega
+
+STATUS_VALIDOS = dict(Entrega.STATUS_CHOICES)
+
+
+class StatusInvalido(Exception):
+    """A entrega não pode ir para o status pedido"""
+
+
+class EntregaJaFinalizada(StatusInvalido):
+    """A entrega já estava entregue quando foi travada para finalizar"""
+
+
+class EstoqueInsuficiente(Exception):
+    """Itens sem estoque para a baixa: `faltas` é uma lista de (produto, estoque, necessario)"""
+
+    def __init__(self, faltas):
+        self.faltas = faltas
+        super().__init__(', '.join(f'{nome} (estoque: {estoque}, necessário: {necessario})'
+                                   for nome, estoque, necessario in faltas))
+
+
+def _validar_transicao(entrega, status, itens):
+    if entrega.status == status:
+        if status == 'entregue':
+            raise EntregaJaFinalizada(f'Entrega {entrega.numero_pedido} já foi finalizada anteriormente.')
+        raise StatusInvalido(f'Entrega {entrega.numero_pedido} já está {STATUS_VALIDOS[status]}.')
+    if entrega.status == 'entregue':
+        # A baixa no estoque já foi feita: mudar o status deixaria estoque e entrega divergentes
+        raise StatusInvalido(f'Entrega {entrega.numero_pedido} já foi entregue e não pode mudar de status.')
+    if status == 'entregue' and not itens:
+        raise StatusInvalido(f'Entrega {entrega.numero_pedido} não possui itens para entregar.')
+
+
+def alterar_status_em_lote(entrega_ids, status, usuario=None):
+    """
+    Leva várias entregas para o mesmo status em uma transação, com consultas em
+    número fixo: entregas travadas, itens lidos de uma vez, produtos travados em
+    ordem de pk (a mesma em qualquer finalização, sem deadlock entre elas), um
+    UPDATE das entregas, um bulk_create do histórico e, para 'entregue', um
+    bulk_create das saídas com o UPDATE agrupado de lancar_movimentacoes.
+
+    O estoque é conferido para o lote inteiro: as entregas consomem o estoque
+    em ordem de data prevista, e as que não cabem no que sobrou são recusadas.
+    Entregas com erro ficam como estavam; as demais são gravadas.
+
+    Retorna (alteradas, erros): [(entrega, baixas)] com as baixas
+    (produto, quantidade, estoque_anterior, estoque_novo) de cada entrega
+    finalizada, e [(entrega, exceção)] das recusadas.
+    """
+    if status not in STATUS_VALIDOS:
+        raise ValueError(f'Status inválido: {status}')
+
+    with transaction.atomic():
+        entregas = list(
+            Entrega.objects.select_for_update(of=('self',)).select_related('escola')
+            .filter(pk__in=list(entrega_ids)).order_by('pk')
+        )
+        itens = {entrega.pk: {} for entrega in entregas}
+        for entrega_id, produto_id, quantidade in ItemEntrega.objects.filter(entrega__in=entregas).values_list(
+            'entrega_id', 'produto_id', 'quantidade'
+        ):
+            itens[entrega_id][produto_id] = quantidade
+
+        estoque, nomes = {}, {}
+        if status == 'entregue':
+            produto_ids = {produto_id for por_produto in itens.values() for produto_id in por_produto}
+            for pk, nome, estoque_atual in (
+                Produto.objects.select_for_update().filter(pk__in=produto_ids).order_by('pk')
+                .values_list('pk', 'nome', 'estoque_atual')
+            ):
+                estoque[pk], nomes[pk] = estoque_atual, nome
+
+        alteradas, erros = [], []
+        for entrega in sorted(entregas, key=lambda e: (e.data_entrega_prevista, e.pk)):
+            try:
+                _validar_transicao(entrega, status, itens[entrega.pk])
+                baixas = []
+                if status == 'entregue':
+                    faltas = [
+                        (nomes[pk], estoque[pk], quantidade)
+                        for pk, quantidade in itens[entrega.pk].items() if estoque[pk] < quantidade
+                    ]
+                    if faltas:
+                        raise EstoqueInsuficiente(faltas)
+                    for pk, quantidade in itens[entrega.pk].items():
+                        baixas.append((nomes[pk], quantidade, estoque[pk], estoque[pk] - quantidade))
+                        estoque[pk] -= quantidade
+            except (StatusInvalido, EstoqueInsuficiente) as erro:
+                erros.append((entrega, erro))
+            else:
+                alteradas.append((entrega, baixas))
+
+        if alteradas:
+            _gravar_lote([entrega for entrega, _baixas in alteradas], status, itens, usuario)
+
+    return alteradas, erros
+
+
+def _gravar_lote(entregas, status, itens, usuario):
+    agora = timezone.now()
+    campos = {'status': status, 'data_atualizacao': agora}
+    if status == 'entregue':
+        campos['data_entrega_real'] = timezone.localdate()
+        observacao = f'Entrega finalizada em {timezone.localtime(agora):%d/%m/%Y %H:%M}'
+    else:
+        observacao = f'Status alterado em lote em {timezone.localtime(agora):%d/%m/%Y %H:%M}'
+
+    historico = [
+        HistoricoStatus(
+            entrega=entrega, status_anterior=entrega.status, status_novo=status,
+            usuario=usuario, observacao=observacao,
+        )
+        for entrega in entregas
+    ]
+    Entrega.objects.filter(pk__in=[entrega.pk for entrega in entregas]).update(**campos)
+    for entrega in entregas:
+        for campo, valor in campos.items():
+            setattr(entrega, campo, valor)
+    HistoricoStatus.objects.bulk_create(historico)
+
+    if status == 'entregue':
+        lancar_movimentacoes(
+            MovimentacaoEstoque(
+                produto_id=produto_id,
+                tipo='S',
+                quantidade=quantidade,
+                motivo=MovimentacaoEstoque.ENTREGA,
+                observacao=f'Entrega {entrega.numero_pedido} - {entrega.escola.nome}',
+                usuario=usuario,
+            )
+            for entrega in entregas
+            for produto_id, quantidade in sorted(itens[entrega.pk].items())
+        )
+
+
+def finalizar_entrega(entrega, usuario=None):
+    """
+    Marca uma entrega como entregue e dá baixa no estoque dos itens
+    (alterar_status_em_lote com uma entrega só).
+
+    Retorna [(produto, quantidade, estoque_anterior, estoque_novo)].
+    Levanta StatusInvalido/EntregaJaFinalizada ou EstoqueInsuficiente sem alterar nada.
+    """
+    alteradas, erros = alterar_status_em_lote([entrega.pk], 'entregue', usuario)
+    if erros:
+        raise erros[0][1]
+    if not alteradas:
+        raise Entrega.DoesNotExist(f'Entrega {entrega.pk} não encontrada')
+    return alteradas[0][1]
+
+
+def compensar_itens(entrega, antes, depois, usuario=None):
+    """
+    Lança de uma vez as movimentações que compensam a edição dos itens de uma
+    entrega já baixada no estoque: saída do que aumentou, entrada do que diminuiu.
+    `antes` e `depois` são {produto_id: quantidade}. Retorna as movimentações criadas.
+
+    Os produtos com aumento são travados em ordem de pk, como na finalização, e
+    levanta EstoqueInsuficiente sem lançar nada se algum não tiver a diferença.
+    """
+    diferencas = {}
+    for produto_id in sorted(antes.keys() | depois.keys()):
+        diferenca = depois.get(produto_id, 0) - antes.get(produto_id, 0)
+        if diferenca:
+            diferencas[produto_id] = diferenca
+    if not diferencas:
+        return []
+
+    with transaction.atomic():
+        aumentos = [produto_id for produto_id, diferenca in diferencas.items() if diferenca > 0]
+        faltas = [
+            (nome, estoque_atual, diferencas[pk])
+            for pk, nome, estoque_atual in (
+                Produto.objects.select_for_update().filter(pk__in=aumentos).order_by('pk')
+                .values_list('pk', 'nome', 'estoque_atual')
+            )
+            if estoque_atual < diferencas[pk]
+        ]
+        if faltas:
+            raise EstoqueInsuficiente(faltas)
+
+        return lancar_movimentacoes(
+            MovimentacaoEstoque(
+                produto_id=produto_id,
+                tipo='S' if diferenca > 0 else 'E',
+                quantidade=abs(diferenca),
+                motivo=MovimentacaoEstoque.ENTREGA,
+                observacao=(
+                    f'Ajuste entrega {entrega.numero_pedido} '
+                    f'({"aumento" if diferenca > 0 else "redução"} de {abs(diferenca)})'
+                ),
+                usuario=usuario,
+            )
+            for produto_id, diferenca in diferencas.items()
+        )
+
+
+def mensagens_do_lote(status, alteradas, erros):
+    """Mensagens (nível, texto) com o resultado de alterar_status_em_lote, uma por entrega recusada"""
+    mensagens = []
+    if alteradas:
+        numeros = ', '.join(entrega.numero_pedido for entrega, _baixas in alteradas)
+        mensagens.append((
+            messages.SUCCESS,
+            f'{len(alteradas)} entrega(s) marcada(s) como {STATUS_VALIDOS[status]}: {numeros}',
+        ))
+    for entrega, erro in erros:
+        if isinstance(erro, EstoqueInsuficiente):
+            texto = f'Entrega {entrega.numero_pedido}: estoque insuficiente para {erro}'
+        else:
+            texto = str(erro)
+        mensagens.append((messages.ERROR, texto))
+    return mensagens
@@ -1,3 +1,185 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connections
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from escola.models import Escola
+from estoque.models import MovimentacaoEstoque
+from produto.models import Produto
+from .models import Entrega, HistoricoStatus, ItemEntrega, SequenciaPedido
+from .services import (
+    EntregaJaFinalizada, EstoqueInsuficiente, StatusInvalido, alterar_status_em_lote, compensar_itens,
+)
+
+
+class NumeroPedidoConcorrenteTest(TransactionTestCase):
+    """Pedidos criados em paralelo recebem números únicos e sem lacunas"""
+
+    THREADS = 8
+    PEDIDOS_POR_THREAD = 250
+
+    def setUp(self):
+        self.escola = Escola.objects.create(nome='Escola Teste', endereco='Rua A', bairro='Centro')
+
+    def criar_pedidos(self, _):
+        try:
+            return [
+                Entrega.objects.create(
+                    escola=self.escola, data_entrega_prevista=date.today(), responsavel_entrega='Teste'
+                ).numero_pedido
+                for _ in range(self.PEDIDOS_POR_THREAD)
+            ]
+        finally:
+            # Cada thread abre a própria conexão
+            connections.close_all()
+
+    def test_pedidos_em_paralelo(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            lotes = list(pool.map(self.criar_pedidos, range(self.THREADS)))
+
+        total = self.THREADS * self.PEDIDOS_POR_THREAD
+        numeros = [numero for lote in lotes for numero in lote]
+        prefixo = f'{timezone.localdate():%Y%m%d}'
+        self.assertEqual(len(set(numeros)), total)
+        self.assertEqual(sorted(numeros), [f'{prefixo}{seq:04d}' for seq in range(1, total + 1)])
+        self.assertEqual(Entrega.objects.count(), total)
+        self.assertEqual(SequenciaPedido.objects.get(dia=timezone.localdate()).ultimo, total)
+
+    def test_sequencial_reinicia_por_dia(self):
+        SequenciaPedido.objects.create(dia=date(2025, 3, 10), ultimo=41)
+        self.assertEqual(SequenciaPedido.proximo(date(2025, 3, 10)), 42)
+        self.assertEqual(SequenciaPedido.proximo(date(2025, 3, 11)), 1)
+
+
+class AlterarStatusEmLoteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Escola.objects.create(nome='Escola Teste', endereco='Rua A', bairro='Centro')
+
+    def setUp(self):
+        self.arroz = Produto.objects.create(nome='Arroz', sku='ARR-001', estoque_atual=5)
+
+    def entrega(self, dias, itens):
+        entrega = Entrega.objects.create(
+            escola=self.escola, data_entrega_prevista=date.today() + timedelta(days=dias), responsavel_entrega='Teste'
+        )
+        for produto, quantidade in itens:
+            ItemEntrega.objects.create(entrega=entrega, produto=produto, quantidade=quantidade)
+        return entrega
+
+    def test_entregas_disputando_o_estoque(self):
+        primeira = self.entrega(0, [(self.arroz, 3)])
+        segunda = self.entrega(1, [(self.arroz, 3)])
+
+        alteradas, erros = alterar_status_em_lote([segunda.pk, primeira.pk], 'entregue')
+
+        # A de data prevista mais próxima consome o estoque primeiro
+        self.assertEqual([(entrega.pk, baixas) for entrega, baixas in alteradas], [(primeira.pk, [('Arroz', 3, 5, 2)])])
+        self.assertEqual(len(erros), 1)
+        entrega, erro = erros[0]
+        self.assertEqual(entrega.pk, segunda.pk)
+        self.assertIsInstance(erro, EstoqueInsuficiente)
+        self.assertEqual(erro.faltas, [('Arroz', 2, 3)])
+
+        self.arroz.refresh_from_db()
+        self.assertEqual(self.arroz.estoque_atual, 2)
+        self.assertEqual(dict(Entrega.objects.values_list('pk', 'status')), {primeira.pk: 'entregue', segunda.pk: 'planejada'})
+        saida = MovimentacaoEstoque.objects.get()
+        self.assertEqual((saida.tipo, saida.quantidade, saida.motivo), ('S', 3, MovimentacaoEstoque.ENTREGA))
+        self.assertEqual(HistoricoStatus.objects.get().entrega_id, primeira.pk)
+
+    def test_recusa_entrega_ja_entregue(self):
+        entrega = self.entrega(0, [(self.arroz, 1)])
+        alterar_status_em_lote([entrega.pk], 'entregue')
+
+        for status, excecao in (('entregue', EntregaJaFinalizada), ('cancelada', StatusInvalido)):
+            alteradas, erros = alterar_status_em_lote([entrega.pk], status)
+            self.assertEqual(alteradas, [])
+            self.assertIsInstance(erros[0][1], excecao)
+
+        self.arroz.refresh_from_db()
+        self.assertEqual(self.arroz.estoque_atual, 4)
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 1)
+
+    def test_recusa_entrega_sem_itens(self):
+        vazia = self.entrega(0, [])
+        com_itens = self.entrega(0, [(self.arroz, 2)])
+
+        alteradas, erros = alterar_status_em_lote([vazia.pk, com_itens.pk], 'entregue')
+        self.assertEqual([entrega.pk for entrega, _baixas in alteradas], [com_itens.pk])
+        self.assertEqual([(entrega.pk, type(erro)) for entrega, erro in erros], [(vazia.pk, StatusInvalido)])
+        vazia.refresh_from_db()
+        self.assertEqual(vazia.status, 'planejada')
+
+    def test_outros_status_nao_movimentam_estoque(self):
+        entregas = [self.entrega(0, [(self.arroz, 10)]), self.entrega(1, [])]
+        alteradas, erros = alterar_status_em_lote([entrega.pk for entrega in entregas], 'transporte')
+        self.assertEqual((len(alteradas), erros), (2, []))
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+        self.assertEqual(HistoricoStatus.objects.filter(status_novo='transporte').count(), 2)
+
+
+class CompensarItensTest(TestCase):
+    """Edição dos itens de uma entrega já baixada no estoque"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.escola = Escola.objects.create(nome='Escola Teste', endereco='Rua A', bairro='Centro')
+
+    def setUp(self):
+        self.arroz = Produto.objects.create(nome='Arroz', sku='ARR-001', estoque_atual=10)
+        self.feijao = Produto.objects.create(nome='Feijão', sku='FEI-001', estoque_atual=1)
+        self.entrega = Entrega.objects.create(
+            escola=self.escola, data_entrega_prevista=date.today(), responsavel_entrega='Teste', status='entregue'
+        )
+
+    def estoques(self):
+        return dict(Produto.objects.values_list('nome', 'estoque_atual'))
+
+    def test_compensa_aumentos_e_reducoes(self):
+        movimentacoes = compensar_itens(
+            self.entrega, {self.arroz.pk: 4, self.feijao.pk: 3}, {self.arroz.pk: 6, self.feijao.pk: 1}
+        )
+
+        self.assertEqual(
+            sorted((m.produto_id, m.tipo, m.quantidade) for m in movimentacoes),
+            [(self.arroz.pk, 'S', 2), (self.feijao.pk, 'E', 2)],
+        )
+        self.assertEqual(self.estoques(), {'Arroz': 8, 'Feijão': 3})
+
+    def test_recusa_aumento_sem_estoque(self):
+        with self.assertRaises(EstoqueInsuficiente) as contexto:
+            compensar_itens(
+                self.entrega, {self.arroz.pk: 4, self.feijao.pk: 1}, {self.arroz.pk: 2, self.feijao.pk: 3}
+            )
+
+        self.assertEqual(contexto.exception.faltas, [('Feijão', 1, 2)])
+        # Nada é lançado, nem a redução do arroz
+        self.assertEqual(self.estoques(), {'Arroz': 10, 'Feijão': 1})
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_sem_diferencas(self):
+        self.assertEqual(compensar_itens(self.entrega, {self.arroz.pk: 4}, {self.arroz.pk: 4}), [])
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+
+class EditarEntregaViewTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('entregas', password='senha'))
+        escola = Escola.objects.create(nome='Escola Teste', endereco='Rua A', bairro='Centro')
+        self.entrega = Entrega.objects.create(
+            escola=escola, data_entrega_prevista=date.today(), responsavel_entrega='Teste'
+        )
+
+    def test_erro_ao_travar_a_entrega_propaga(self):
+        # Sem o formulário montado não há página de edição para exibir com a mensagem
+        with mock.patch.object(Entrega.objects, 'select_for_update', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('entrega:editar_entrega', args=[self.entrega.pk]), {})
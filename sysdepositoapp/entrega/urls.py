@@ -10,6 +10,7 @@ urlpatterns = [
     path('entregas/<int:pk>/', views.detalhe_entrega, name='detalhe_entrega'),
     path('entregas/<int:pk>/editar/', views.editar_entrega, name='editar_entrega'),
     path('entregas/<int:pk>/finalizar/', views.finalizar_entrega, name='finalizar_entrega'),
+    path('entregas/status-em-lote/', views.alterar_status_lote, name='alterar_status_lote'),
     path('escolas/', views.lista_escolas, name='lista_escolas'),
     path('escolas/nova/', views.nova_escola, name='nova_escola'),
     path('entregas/entregas/<int:entrega_id>/pdf/', views.gerar_pdf_entrega, name='gerar_pdf_entrega'),
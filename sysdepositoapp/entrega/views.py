@@ -2,60 +2,51 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Q, Count
-from django.http import HttpResponse
+from django.db.models import Q, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
+from django.http import HttpResponse, Http404
 from django.forms import inlineformset_factory
 from django.utils import timezone
 from datetime import datetime, timedelta
 import csv
+import logging
 from .models import Entrega, ItemEntrega, HistoricoStatus
 from .forms import EntregaForm, ItemEntregaForm, FiltroEntregaForm, ItemEntregaFormSet  # REMOVER EscolaForm
 from produto.models import Produto
 from escola.models import Escola
 
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.conf import settings
-from django.utils.timezone import now
-import os
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration
-from io import BytesIO
-from .models import Entrega
+from relatorios.cache_pdf import resposta_em_cache
+from relatorios.fila import enfileirar_pdf
+from .pdf import TEMPLATE_ENTREGA, buscar_entrega, contexto_entrega
+from .services import (
+    EntregaJaFinalizada, EstoqueInsuficiente, StatusInvalido, STATUS_VALIDOS,
+    alterar_status_em_lote, compensar_itens, finalizar_entrega as finalizar, mensagens_do_lote,
+)
 
+ENTREGAS_POR_PAGINA = 25
+
+logger = logging.getLogger(__name__)
+
+@login_required
 def gerar_pdf_entrega(request, entrega_id):
-    entrega = get_object_or_404(Entrega, id=entrega_id)
-    
-    context = {
-        'entrega': entrega,
-        'gerado_em': now(),
-        'STATIC_ROOT': settings.STATIC_ROOT,
-    }
-    
-    # Renderiza o template HTML
-    html_string = render_to_string('entrega/entrega_pdf.html', context)
-    
-    # Configuração de fontes
-    font_config = FontConfiguration()
-    
-    # Gera o PDF
-    pdf_file = HTML(
-        string=html_string,
-        base_url=request.build_absolute_uri()
-    ).write_pdf(font_config=font_config)
-    
-    # Cria a resposta
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    filename = f"entrega_{entrega.numero_pedido}_{now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    return response
+    """Comprovante de entrega: servido do cache quando já gerado, senão enfileirado"""
+    try:
+        entrega = buscar_entrega(entrega_id)
+    except Entrega.DoesNotExist:
+        raise Http404('Entrega não encontrada')
+
+    resposta = resposta_em_cache(
+        TEMPLATE_ENTREGA, contexto_entrega(entrega), f'entrega_{entrega.numero_pedido}.pdf', as_attachment=True
+    )
+    if resposta is not None:
+        return resposta
+    return enfileirar_pdf(request, 'entrega', {'entrega_id': entrega.id})
 
 @login_required
 def lista_entregas(request):
-    """Lista todas as entregas com filtros"""
-    entregas = Entrega.objects.select_related('escola').prefetch_related('itens').all()
+    """Lista paginada das entregas com filtros; contadores dos cards em uma consulta"""
+    entregas = Entrega.objects.all()
     form = FiltroEntregaForm(request.GET or None)
     
     if form.is_valid():
@@ -76,26 +67,36 @@ def lista_entregas(request):
         if data_fim:
             entregas = entregas.filter(data_entrega_prevista__lte=data_fim)
 
-    # Estatísticas
-    total_entregas = entregas.count()
-    entregas_planejadas = entregas.filter(status='planejada').count()
-    entregas_preparacao = entregas.filter(status='preparacao').count()
-    entregas_transporte = entregas.filter(status='transporte').count()
-    entregas_entregues = entregas.filter(status='entregue').count()
-    entregas_atrasadas = entregas.filter(
-        status__in=['planejada', 'preparacao', 'transporte'],
-        data_entrega_prevista__lt=timezone.now().date()
-    ).count()
+    # Estatísticas: agregação condicional em uma única consulta
+    estatisticas = entregas.aggregate(
+        total_entregas=Count('id'),
+        entregas_planejadas=Count('id', filter=Q(status='planejada')),
+        entregas_preparacao=Count('id', filter=Q(status='preparacao')),
+        entregas_transporte=Count('id', filter=Q(status='transporte')),
+        entregas_entregues=Count('id', filter=Q(status='entregue')),
+        entregas_atrasadas=Count('id', filter=Q(
+            status__in=['planejada', 'preparacao', 'transporte'],
+            data_entrega_prevista__lt=timezone.now().date(),
+        )),
+    )
+
+    # Produtos e unidades de cada entrega na própria consulta da página; subconsultas
+    # correlacionadas em vez de JOIN + GROUP BY, que agregaria o histórico inteiro antes do LIMIT
+    itens = ItemEntrega.objects.filter(entrega=OuterRef('pk')).order_by().values('entrega')
+    entregas = entregas.select_related('escola').annotate(
+        num_produtos=Coalesce(Subquery(itens.annotate(total=Count('id')).values('total')), 0),
+        num_itens=Coalesce(Subquery(itens.annotate(total=Sum('quantidade')).values('total')), 0),
+    ).order_by('-data_criacao', '-pk')
+    paginator = Paginator(entregas, ENTREGAS_POR_PAGINA)
+    paginator.count = estatisticas['total_entregas']  # já contado acima
+    page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
-        'entregas': entregas,
+        'entregas': page_obj,
+        'page_obj': page_obj,
         'form': form,
-        'total_entregas': total_entregas,
-        'entregas_planejadas': entregas_planejadas,
-        'entregas_preparacao': entregas_preparacao,
-        'entregas_transporte': entregas_transporte,
-        'entregas_entregues': entregas_entregues,
-        'entregas_atrasadas': entregas_atrasadas,
+        'status_choices': Entrega.STATUS_CHOICES,
+        **estatisticas,
     }
     return render(request, 'entrega/lista_entregas.html', context)
 
@@ -195,16 +196,19 @@ def editar_entrega(request, pk):
     )
     
     if request.method == 'POST':
-        form = EntregaForm(request.POST, instance=entrega)
-        formset = ItemEntregaFormSetInline(request.POST, instance=entrega)
-        
-        if form.is_valid() and formset.is_valid():
-            try:
-                with transaction.atomic():
-                    # Verificar se o status foi alterado
-                    status_anterior = entrega.status
+        form = formset = None
+        try:
+            with transaction.atomic():
+                # Travada antes de ler o status: uma finalização concorrente espera a edição
+                # terminar, e a edição vê o status que a finalização deixou (como em alterar_status_em_lote)
+                entrega = Entrega.objects.select_for_update().get(pk=entrega.pk)
+                status_anterior = entrega.status
+                form = EntregaForm(request.POST, instance=entrega)
+                formset = ItemEntregaFormSetInline(request.POST, instance=entrega)
+
+                if form.is_valid() and formset.is_valid():
                     entrega = form.save()
-                    
+
                     if status_anterior != entrega.status:
                         HistoricoStatus.objects.create(
                             entrega=entrega,
@@ -213,55 +217,31 @@ def editar_entrega(request, pk):
                             usuario=request.user,
                             observacao='Status alterado'
                         )
-                    
-                    # Capturar quantidades antigas antes de salvar alterações do formset
-                    old_quantities = {it.produto_id: it.quantidade for it in entrega.itens.all()}
 
+                    # Quantidades antes e depois do formset, uma consulta cada
+                    itens = ItemEntrega.objects.filter(entrega=entrega)
+                    quantidades_antes = dict(itens.values_list('produto_id', 'quantidade'))
                     formset.save()
+                    quantidades_depois = dict(itens.values_list('produto_id', 'quantidade'))
 
-                    # Depois de salvar, comparar quantidades e criar movimentações para ajustar estoque
-                    try:
-                        from estoque.models import MovimentacaoEstoque
-                        new_quantities = {it.produto_id: it.quantidade for it in entrega.itens.all()}
+                    # Só entregas já finalizadas tiveram baixa no estoque; nas demais a
+                    # finalização dá baixa nas quantidades que estiverem valendo
+                    if status_anterior == 'entregue':
+                        compensar_itens(entrega, quantidades_antes, quantidades_depois, usuario=request.user)
 
-                        product_ids = set(list(old_quantities.keys()) + list(new_quantities.keys()))
-                        for pid in product_ids:
-                            old_q = old_quantities.get(pid, 0)
-                            new_q = new_quantities.get(pid, 0)
-                            if new_q > old_q:
-                                # houve aumento -> criar saída adicional
-                                try:
-                                    MovimentacaoEstoque.objects.create(
-                                        produto_id=pid,
-                                        tipo='S',
-                                        quantidade=(new_q - old_q),
-                                        motivo='entrega',
-                                        observacao=f'Ajuste entrega {entrega.numero_pedido} (aumento de {new_q-old_q})',
-                                        usuario=request.user
-                                    )
-                                except Exception:
-                                    pass
-                            elif new_q < old_q:
-                                # houve diminuição -> devolver ao estoque (entrada)
-                                try:
-                                    MovimentacaoEstoque.objects.create(
-                                        produto_id=pid,
-                                        tipo='E',
-                                        quantidade=(old_q - new_q),
-                                        motivo='entrega',
-                                        observacao=f'Ajuste entrega {entrega.numero_pedido} (redução de {old_q-new_q})',
-                                        usuario=request.user
-                                    )
-                                except Exception:
-                                    pass
-                    except Exception:
-                        pass
-                    
                     messages.success(request, f'Entrega {entrega.numero_pedido} atualizada com sucesso!')
                     return redirect('entrega:detalhe_entrega', pk=entrega.pk)
-                    
-            except Exception as e:
-                messages.error(request, f'Erro ao atualizar entrega: {str(e)}')
+
+        except Entrega.DoesNotExist:
+            raise Http404('Entrega não encontrada')
+        except EstoqueInsuficiente as e:
+            messages.error(request, f'Estoque insuficiente para aumentar os itens desta entrega já entregue: {e}')
+        except Exception as e:
+            if form is None:
+                # Falhou a leitura travada: não há formulário para exibir de volta
+                raise
+            logger.error(f'Erro ao atualizar entrega {entrega.pk}: {str(e)}', exc_info=True)
+            messages.error(request, f'Erro ao atualizar entrega: {str(e)}')
     else:
         form = EntregaForm(instance=entrega)
         formset = ItemEntregaFormSetInline(instance=entrega)
@@ -293,94 +273,57 @@ def finalizar_entrega(request, pk):
     
     if request.method == 'POST':
         try:
-            with transaction.atomic():
-                from estoque.models import MovimentacaoEstoque
-                
-                # VERIFICAÇÃO DE ESTOQUE
-                problemas_estoque = []
-                for item in entrega.itens.all():
-                    produto = item.produto
-                    if produto.estoque_atual < item.quantidade:
-                        problemas_estoque.append(
-                            f"{produto.nome} (estoque: {produto.estoque_atual}, necessário: {item.quantidade})"
-                        )
-                
-                if problemas_estoque:
-                    messages.error(request, 
-                        f'❌ Estoque insuficiente para finalizar a entrega:<br>' + 
-                        '<br>'.join(problemas_estoque)
-                    )
-                    return redirect('entrega:detalhe_entrega', pk=entrega.pk)
-                
-                # PROCESSAR ITENS E ATUALIZAR ESTOQUE
-                itens_processados = []
-                for item in entrega.itens.all():
-                    produto = item.produto
-                    estoque_anterior = produto.estoque_atual
-                    
-                    # 1. Criar movimentação de estoque
-                    MovimentacaoEstoque.objects.create(
-                        produto=produto,
-                        tipo='SAIDA',  # Ajuste conforme seu modelo
-                        quantidade=item.quantidade,
-                        motivo='ENTREGA',  # Ajuste conforme seu modelo
-                        observacao=f'Entrega {entrega.numero_pedido} - {entrega.escola.nome}',
-                        usuario=request.user
-                    )
-                    
-                    # 2. ATUALIZAR ESTOQUE DO PRODUTO
-                    produto.estoque_atual = estoque_anterior - item.quantidade
-                    produto.save(update_fields=['estoque_atual'])  # Salva apenas o campo necessário
-                    
-                    itens_processados.append({
-                        'produto': produto.nome,
-                        'quantidade': item.quantidade,
-                        'estoque_anterior': estoque_anterior,
-                        'novo_estoque': produto.estoque_atual
-                    })
-                
-                # ✅ CORREÇÃO: ATUALIZAR STATUS E DATA DA ENTREGA
-                status_anterior = entrega.status
-                
-                # Use os valores exatos do seu modelo
-                entrega.status = 'entregue'  # Ou 'entregue' - verifique seu modelo
-                entrega.data_entrega_real = timezone.now().date()  # ✅ DATA CORRETA
-                
-                # ✅ SALVAR A ENTREGA COM TODOS OS CAMPOS ATUALIZADOS
-                entrega.save()  # Isso salva status E data_entrega_real
-                
-                # Registrar histórico
-                HistoricoStatus.objects.create(
-                    entrega=entrega,
-                    status_anterior=status_anterior,
-                    status_novo=entrega.status,
-                    usuario=request.user,
-                    observacao=f'Entrega finalizada em {timezone.now().strftime("%d/%m/%Y %H:%M")}'
-                )
-                
-                # Mensagem de sucesso detalhada
-                itens_info = '<br>'.join([
-                    f"• {item['produto']}: {item['quantidade']} un. (Estoque: {item['estoque_anterior']} → {item['novo_estoque']})"
-                    for item in itens_processados
-                ])
-                
-                messages.success(request, 
-                    f'✅ Entrega {entrega.numero_pedido} finalizada com sucesso!<br>'
-                    f'<strong>Data de entrega:</strong> {timezone.now().strftime("%d/%m/%Y")}<br><br>'
-                    f'<strong>Itens processados:</strong><br>{itens_info}'
+            itens_processados = finalizar(entrega, usuario=request.user)
+        except EntregaJaFinalizada as e:
+            messages.warning(request, str(e))
+        except StatusInvalido as e:
+            messages.error(request, str(e))
+        except EstoqueInsuficiente as e:
+            messages.error(request, 
+                f'❌ Estoque insuficiente para finalizar a entrega:<br>' + 
+                '<br>'.join(
+                    f"{nome} (estoque: {estoque}, necessário: {necessario})"
+                    for nome, estoque, necessario in e.faltas
                 )
-                return redirect('entrega:detalhe_entrega', pk=entrega.pk)
-                
+            )
         except Exception as e:
             messages.error(request, f'❌ Erro ao finalizar entrega: {str(e)}')
             # Log para debug
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f'Erro ao finalizar entrega {entrega.pk}: {str(e)}', exc_info=True)
+        else:
+            # Mensagem de sucesso detalhada
+            itens_info = '<br>'.join([
+                f"• {produto}: {quantidade} un. (Estoque: {anterior} → {novo})"
+                for produto, quantidade, anterior, novo in itens_processados
+            ])
+            
+            messages.success(request, 
+                f'✅ Entrega {entrega.numero_pedido} finalizada com sucesso!<br>'
+                f'<strong>Data de entrega:</strong> {timezone.localdate().strftime("%d/%m/%Y")}<br><br>'
+                f'<strong>Itens processados:</strong><br>{itens_info}'
+            )
     
     # Se não for POST, redirecionar para detalhes
     return redirect('entrega:detalhe_entrega', pk=entrega.pk)
 
+@login_required
+def alterar_status_lote(request):
+    """Leva as entregas marcadas na lista para um status (finalizar a rota do dia, por exemplo)"""
+    if request.method == 'POST':
+        status = request.POST.get('status')
+        entrega_ids = [pk for pk in request.POST.getlist('entregas') if pk.isdigit()]
+        
+        if status not in STATUS_VALIDOS:
+            messages.error(request, 'Escolha o novo status das entregas.')
+        elif not entrega_ids:
+            messages.warning(request, 'Nenhuma entrega selecionada.')
+        else:
+            alteradas, erros = alterar_status_em_lote(entrega_ids, status, usuario=request.user)
+            for nivel, texto in mensagens_do_lote(status, alteradas, erros):
+                messages.add_message(request, nivel, texto)
+    
+    return redirect('entrega:lista_entregas')
+
 @login_required
 def lista_escolas(request):
     """Lista todas as escolas"""
@@ -1,14 +1,14 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count, Sum, Case, When, Value, CharField
 from django.http import HttpResponse
 from django.forms import inlineformset_factory
 from django.core.paginator import Paginator
-import csv
 from .models import Escola, ContatoEscola, HistoricoEscola
 from .forms import EscolaForm, ContatoEscolaForm, HistoricoEscolaForm, EscolaSearchForm
 from entrega.models import Entrega
+from estoque.exportacao import TAMANHO_LOTE, resposta_csv, quer_gzip, rotulo_choices, texto_ou_vazio
 
 @login_required
 def lista_escolas(request):
@@ -214,35 +214,29 @@ def dashboard_escolas(request):
 
 @login_required
 def exportar_escolas_csv(request):
-    """Exportar escolas para CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="escolas.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow([
+    """Exportar escolas para CSV (streaming, opcionalmente com ?gzip=1)"""
+    cabecalho = [
         'Nome', 'Código INEP', 'Tipo', 'Nível', 'Endereço', 'Bairro', 'Cidade', 
         'Estado', 'Telefone', 'Email', 'Diretor', 'Alunos', 'Ativa'
-    ])
-    
-    escolas = Escola.objects.all().order_by('nome')
-    for escola in escolas:
-        writer.writerow([
-            escola.nome,
-            escola.codigo_inep or '',
-            escola.get_tipo_escola_display(),
-            escola.get_nivel_ensino_display(),
-            escola.endereco,
-            escola.bairro,
-            escola.cidade,
-            escola.estado,
-            escola.telefone or '',
-            escola.email or '',
-            escola.diretor or '',
-            escola.quantidade_alunos,
-            'Sim' if escola.ativo else 'Não'
-        ])
+    ]
+    
+    # Rótulos e campos opcionais resolvidos no banco, sem instanciar cada escola
+    escolas = Escola.objects.order_by('nome').annotate(
+        inep=texto_ou_vazio('codigo_inep'),
+        tipo_rotulo=rotulo_choices('tipo_escola', Escola.TIPO_ESCOLA_CHOICES),
+        nivel_rotulo=rotulo_choices('nivel_ensino', Escola.NIVEL_ESCOLA_CHOICES),
+        telefone_txt=texto_ou_vazio('telefone'),
+        email_txt=texto_ou_vazio('email'),
+        diretor_txt=texto_ou_vazio('diretor'),
+        ativa=Case(When(ativo=True, then=Value('Sim')), default=Value('Não'), output_field=CharField()),
+    ).values_list(
+        'nome', 'inep', 'tipo_rotulo', 'nivel_rotulo', 'endereco', 'bairro', 'cidade',
+        'estado', 'telefone_txt', 'email_txt', 'diretor_txt', 'quantidade_alunos', 'ativa',
+    )
     
-    return response
+    return resposta_csv(
+        cabecalho, escolas.iterator(chunk_size=TAMANHO_LOTE), 'escolas.csv', compactar=quer_gzip(request)
+    )
 
 @login_required
 def toggle_ativa_escola(request, pk):
@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import MovimentacaoEstoque, AjusteEstoque
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
+from .models import MovimentacaoEstoque, AjusteEstoque, SaldoDiarioEstoque, PrevisaoEstoque, ClassificacaoEstoque
+from .services import ConflitoEstoque, estornar_movimentacoes, registrar_ajuste
 
 @admin.register(MovimentacaoEstoque)
 class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
@@ -13,6 +15,10 @@ class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
             obj.usuario = request.user
         super().save_model(request, obj, form, change)
 
+    def delete_queryset(self, request, queryset):
+        # A exclusão em lote do admin também precisa reverter o estoque
+        estornar_movimentacoes(queryset)
+
 @admin.register(AjusteEstoque)
 class AjusteEstoqueAdmin(admin.ModelAdmin):
     list_display = ['produto', 'estoque_anterior', 'estoque_novo', 'diferenca', 'usuario', 'data_ajuste']
@@ -23,4 +29,41 @@ class AjusteEstoqueAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not obj.usuario_id:
             obj.usuario = request.user
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        if change:
+            super().save_model(request, obj, form, change)
+        else:
+            # Ajuste novo pelo admin aplica o estoque como a tela de ajuste
+            try:
+                registrar_ajuste(obj)
+            except ConflitoEstoque as erro:
+                self.message_user(request, str(erro), messages.ERROR)
+
+    def log_addition(self, request, obj, message):
+        # Ajuste recusado por conflito não foi gravado
+        if obj.pk:
+            return super().log_addition(request, obj, message)
+
+    def response_add(self, request, obj, post_url_continue=None):
+        if obj.pk is None:
+            return HttpResponseRedirect(request.path)
+        return super().response_add(request, obj, post_url_continue)
+
+@admin.register(SaldoDiarioEstoque)
+class SaldoDiarioEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'data', 'entradas', 'saidas', 'saldo']
+    list_filter = ['data']
+    search_fields = ['produto__nome']
+    readonly_fields = ['produto', 'data', 'entradas', 'saidas', 'saldo']
+
+@admin.register(PrevisaoEstoque)
+class PrevisaoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'estoque_atual', 'consumo_medio_diario', 'dias_cobertura', 'data_ruptura', 'quantidade_sugerida', 'calculado_em']
+    search_fields = ['produto__nome', 'produto__sku']
+    readonly_fields = ['produto', 'estoque_atual', 'consumo_medio_diario', 'dias_cobertura', 'data_ruptura', 'quantidade_sugerida', 'calculado_em']
+
+@admin.register(ClassificacaoEstoque)
+class ClassificacaoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'classe_abc', 'classe_xyz', 'valor_consumo', 'coeficiente_variacao', 'atualizado_em']
+    list_filter = ['classe_abc', 'classe_xyz']
+    search_fields = ['produto__nome', 'produto__sku']
+    readonly_fields = ['produto', 'valor_consumo', 'participacao_acumulada', 'coeficiente_variacao', 'classe_abc', 'classe_xyz', 'atualizado_em']
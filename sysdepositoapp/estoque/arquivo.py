@@ -0,0 +1,465 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from produto.models import Produto
+from .dashboard import (
+    CHAVE_GERACAO_ARQUIVO, geracao, invalidar_arquivo, invalidar_dashboard_apos_commit, invalidar_periodos_fechados,
+)
+from .filtros import converter_data, inicio_do_dia
+from .models import MovimentacaoEstoque
+
+logger = logging.getLogger(__name__)
+
+# Arquivo de movimentações antigas: um .npy por ano (mapeável em memória), ordenado por
+# (produto, data), mais as observações em JSON compactado. As colunas numéricas ficam
+# sem compressão justamente para o np.load(mmap_mode='r') ler só as páginas consultadas.
+
+TAMANHO_LOTE = 5000
+TEMPO_CACHE_RESUMO = 3600  # segundos; o arquivamento também invalida (geração do arquivo)
+SEM_DATA = np.iinfo(np.int64).min
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Posição gravada na coluna 'motivo': valores novos só podem entrar no final
+MOTIVOS = ('compra', 'venda', 'ajuste', 'devolucao', 'perda', 'producao', 'outro', 'saldo_abertura', 'entrega')
+
+DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('produto_id', '<i4'),
+    ('usuario_id', '<i4'),  # -1 quando sem usuário
+    ('tipo', 'S1'),
+    ('motivo', 'u1'),
+    ('quantidade', '<i4'),
+    ('data_movimentacao', '<i8'),  # microssegundos desde a época (UTC)
+    ('data_ocorrencia', '<i8'),  # SEM_DATA quando nula
+])
+
+
+def _micros(instante):
+    return (instante - EPOCA) // timedelta(microseconds=1)
+
+
+def _instante(micros):
+    return EPOCA + timedelta(microseconds=int(micros))
+
+
+def diretorio():
+    return Path(settings.ESTOQUE_ARQUIVO_DIR)
+
+
+def _caminho(ano):
+    return diretorio() / f'movimentacoes_{ano}.npy'
+
+
+def _caminho_observacoes(ano):
+    return diretorio() / f'movimentacoes_{ano}.obs.json.gz'
+
+
+def anos_arquivados():
+    return sorted(int(arquivo.stem.split('_')[1]) for arquivo in diretorio().glob('movimentacoes_*.npy'))
+
+
+def carregar(ano):
+    """Movimentações arquivadas do ano, mapeadas em memória (somente leitura)"""
+    return np.load(_caminho(ano), mmap_mode='r')
+
+
+def observacoes(ano):
+    try:
+        with gzip.open(_caminho_observacoes(ano), 'rt', encoding='utf-8') as f:
+            return {int(pk): texto for pk, texto in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def inicio_tabela():
+    """Primeiro dia que ainda está na tabela de movimentações (None se nada foi arquivado)"""
+    anos = anos_arquivados()
+    return date(anos[-1] + 1, 1, 1) if anos else None
+
+
+def data_corte(horizonte_dias=None):
+    """1º de janeiro do ano em que cai o horizonte: anos anteriores a ele são arquivados"""
+    if horizonte_dias is None:
+        horizonte_dias = settings.ESTOQUE_ARQUIVO_HORIZONTE_DIAS
+    return date((timezone.localdate() - timedelta(days=horizonte_dias)).year, 1, 1)
+
+
+# Consulta
+
+def _selecionar(ano, produto_id=None, tipo=None, data_inicio=None, data_fim=None,
+                campo_data='data_movimentacao', produto_ids=None):
+    # Mesmos filtros de filtrar_movimentacoes; devolve (linhas, máscara) sem copiar o arquivo
+    linhas = carregar(ano)
+    if produto_id:
+        produto_id = int(produto_id)
+        inicio, fim = np.searchsorted(linhas['produto_id'], [produto_id, produto_id + 1])
+        linhas = linhas[inicio:fim]
+
+    mascara = np.ones(len(linhas), dtype=bool)
+    if produto_ids is not None:
+        mascara &= np.isin(linhas['produto_id'], np.asarray(list(produto_ids), dtype=np.int64))
+    if tipo:
+        mascara &= linhas['tipo'] == tipo.encode()
+    if data_inicio or data_fim:
+        coluna = linhas[campo_data]
+        mascara &= coluna != SEM_DATA
+        if data_inicio:
+            mascara &= coluna >= _micros(inicio_do_dia(data_inicio))
+        if data_fim:
+            mascara &= coluna < _micros(inicio_do_dia(data_fim + timedelta(days=1)))
+    return linhas, mascara
+
+
+def _anos_do_periodo(data_inicio, data_fim, campo_data):
+    # Os arquivos são divididos pelo ano da data_movimentacao
+    anos = anos_arquivados()
+    if campo_data != 'data_movimentacao':
+        return anos
+    return [ano for ano in anos
+            if (not data_inicio or ano >= data_inicio.year) and (not data_fim or ano <= data_fim.year)]
+
+
+def _contar_arquivo(produto_id, tipo, data_inicio, data_fim, campo_data, produto_ids):
+    # Contagens e quantidades por produto varrendo os anos arquivados (a parte cara do resumo)
+    contagens = dict.fromkeys(('total', 'entradas', 'saidas', 'ultima_semana'), 0)
+    quantidades = {}  # produto_id -> [entradas, saidas], para valorar com os preços atuais
+    semana = _micros(timezone.now() - timedelta(days=7))
+
+    for ano in _anos_do_periodo(data_inicio, data_fim, campo_data):
+        linhas, mascara = _selecionar(ano, produto_id, tipo, data_inicio, data_fim, campo_data, produto_ids)
+        entradas = mascara & (linhas['tipo'] == b'E')
+        saidas = mascara & (linhas['tipo'] == b'S')
+        contagens['total'] += int(np.count_nonzero(mascara))
+        contagens['entradas'] += int(np.count_nonzero(entradas))
+        contagens['saidas'] += int(np.count_nonzero(saidas))
+        contagens['ultima_semana'] += int(np.count_nonzero(mascara & (linhas['data_movimentacao'] >= semana)))
+
+        produtos, posicao = np.unique(linhas['produto_id'][mascara], return_inverse=True)
+        quantidade = linhas['quantidade'][mascara].astype(np.int64)
+        por_produto_e = np.bincount(posicao, weights=quantidade * entradas[mascara], minlength=len(produtos))
+        por_produto_s = np.bincount(posicao, weights=quantidade * saidas[mascara], minlength=len(produtos))
+        for pk, qtd_e, qtd_s in zip(produtos.tolist(), por_produto_e.tolist(), por_produto_s.tolist()):
+            acumulado = quantidades.setdefault(pk, [0, 0])
+            acumulado[0] += int(qtd_e)
+            acumulado[1] += int(qtd_s)
+    return contagens, quantidades
+
+
+def resumo_arquivo(produto_id=None, tipo=None, data_inicio=None, data_fim=None,
+                   campo_data='data_movimentacao', produto_ids=None):
+    """
+    Mesmos totais de resumo_movimentacoes, calculados sobre as movimentações arquivadas.
+    A varredura dos arquivos fica em cache por combinação de filtros até o próximo
+    arquivamento; os valores são refeitos a cada chamada com os preços atuais.
+    """
+    filtros = (
+        int(produto_id) if produto_id else None, tipo or None,
+        converter_data(data_inicio), converter_data(data_fim), campo_data,
+        sorted(produto_ids) if produto_ids is not None else None,
+    )
+    chave = 'estoque:arquivo:resumo:' + hashlib.md5(
+        repr((filtros, geracao(CHAVE_GERACAO_ARQUIVO))).encode()
+    ).hexdigest()
+    contagens, quantidades = cache.get_or_set(chave, lambda: _contar_arquivo(*filtros), TEMPO_CACHE_RESUMO)
+
+    resumo = dict(contagens, quantidade_entradas=0, quantidade_saidas=0)
+    resumo['valor_entradas'] = resumo['valor_saidas'] = Decimal('0.00')
+    if not quantidades:
+        return resumo
+    precos = Produto.objects.filter(pk__in=list(quantidades)).values_list('pk', 'preco_custo', 'preco_venda')
+    for pk, preco_custo, preco_venda in precos:
+        qtd_e, qtd_s = quantidades[pk]
+        resumo['quantidade_entradas'] += qtd_e
+        resumo['quantidade_saidas'] += qtd_s
+        resumo['valor_entradas'] += qtd_e * preco_custo
+        resumo['valor_saidas'] += qtd_s * preco_venda
+    return resumo
+
+
+def registros_arquivo(produto_id=None, tipo=None, data_inicio=None, data_fim=None,
+                      campo_data='data_movimentacao', produto_ids=None):
+    """
+    Movimentações arquivadas no formato das colunas de linhas_movimentacoes
+    (data, produto, sku, tipo, quantidade, motivo, usuário, ocorrência, observação),
+    da mais recente para a mais antiga, um ano por vez.
+    """
+    data_inicio, data_fim = converter_data(data_inicio), converter_data(data_fim)
+    for ano in reversed(_anos_do_periodo(data_inicio, data_fim, campo_data)):
+        linhas, mascara = _selecionar(ano, produto_id, tipo, data_inicio, data_fim, campo_data, produto_ids)
+        linhas = linhas[mascara]
+        if not len(linhas):
+            continue
+        linhas = linhas[np.lexsort((-linhas['id'], -linhas['data_movimentacao']))]
+
+        produtos = dict(
+            (pk, (nome, sku)) for pk, nome, sku in
+            Produto.objects.filter(pk__in=np.unique(linhas['produto_id']).tolist()).values_list('pk', 'nome', 'sku')
+        )
+        usuarios = dict(User.objects.filter(pk__in=np.unique(linhas['usuario_id']).tolist()).values_list('pk', 'username'))
+        textos = observacoes(ano)
+
+        for linha in linhas.tolist():
+            pk, produto_id_linha, usuario_id, tipo_linha, motivo, quantidade, data, ocorrencia = linha
+            nome, sku = produtos.get(produto_id_linha, ('', ''))
+            yield (
+                _instante(data), nome, sku, tipo_linha.decode(), quantidade, MOTIVOS[motivo],
+                usuarios.get(usuario_id), _instante(ocorrencia) if ocorrencia != SEM_DATA else None,
+                textos.get(pk),
+            )
+
+
+def _limites_dos_dias(primeiro_dia, dias):
+    # Início (local) de cada dia e do dia seguinte ao último, para localizar instantes com searchsorted
+    return np.array([_micros(inicio_do_dia(primeiro_dia + timedelta(days=d))) for d in range(dias + 1)])
+
+
+def agrupar_arquivo(por, produto_id=None, tipo=None, data_inicio=None, data_fim=None,
+                    campo_data='data_movimentacao', produto_ids=None):
+    """
+    Movimentações arquivadas agrupadas por 'motivo', 'dia' ou 'produto':
+    {chave: [entradas, saidas, quantidade_entradas, quantidade_saidas]}
+    """
+    data_inicio, data_fim = converter_data(data_inicio), converter_data(data_fim)
+    grupos = {}
+    for ano in _anos_do_periodo(data_inicio, data_fim, campo_data):
+        linhas, mascara = _selecionar(ano, produto_id, tipo, data_inicio, data_fim, campo_data, produto_ids)
+        linhas = linhas[mascara]
+        if not len(linhas):
+            continue
+
+        if por == 'motivo':
+            chaves, rotulo = linhas['motivo'], lambda valor: MOTIVOS[valor]
+        elif por == 'produto':
+            chaves, rotulo = linhas['produto_id'], int
+        else:
+            data = linhas['data_movimentacao']
+            primeiro = timezone.localdate(_instante(data.min()))
+            dias = (timezone.localdate(_instante(data.max())) - primeiro).days + 1
+            chaves = np.searchsorted(_limites_dos_dias(primeiro, dias), data, side='right') - 1
+            rotulo = lambda valor: primeiro + timedelta(days=valor)
+
+        valores, posicao = np.unique(chaves, return_inverse=True)
+        entradas = linhas['tipo'] == b'E'
+        saidas = linhas['tipo'] == b'S'
+        quantidade = linhas['quantidade'].astype(np.int64)
+        colunas = [
+            np.bincount(posicao, weights=peso, minlength=len(valores))
+            for peso in (entradas, saidas, quantidade * entradas, quantidade * saidas)
+        ]
+        for i, valor in enumerate(valores.tolist()):
+            acumulado = grupos.setdefault(rotulo(valor), [0, 0, 0, 0])
+            for j, coluna in enumerate(colunas):
+                acumulado[j] += int(coluna[i])
+    return grupos
+
+
+def somar_saidas_arquivadas(saidas, produto_ids, data_inicio):
+    """
+    Soma na matriz (produtos x dias) as saídas arquivadas a partir de data_inicio.
+    `produto_ids` precisa estar em ordem crescente (a mesma das linhas da matriz).
+    """
+    ids = np.asarray(produto_ids, dtype=np.int64)
+    if not len(ids):
+        return saidas
+    limites = _limites_dos_dias(data_inicio, saidas.shape[1])
+
+    for ano in anos_arquivados():
+        if ano < data_inicio.year:
+            continue
+        linhas = carregar(ano)
+        data = linhas['data_movimentacao']
+        linhas = linhas[(linhas['tipo'] == b'S') & (data >= limites[0]) & (data < limites[-1])]
+
+        linha_idx = np.searchsorted(ids, linhas['produto_id'])
+        encontrado = (linha_idx < len(ids)) & (ids[np.minimum(linha_idx, len(ids) - 1)] == linhas['produto_id'])
+        coluna_idx = np.searchsorted(limites, linhas['data_movimentacao'], side='right') - 1
+        np.add.at(saidas, (linha_idx[encontrado], coluna_idx[encontrado]), linhas['quantidade'][encontrado])
+    return saidas
+
+
+# Arquivamento
+
+def _temporario(arquivo, escrever):
+    # Grava ao lado do destino, para a troca (os.replace) ser atômica
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            escrever(f)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return temporario
+
+
+def _trocar(arquivos):
+    # Roda depois do commit, quando as linhas já saíram da tabela e o temporário
+    # é a única cópia delas: uma falha só é registrada, nunca descarta o temporário
+    for temporario, destino in arquivos:
+        try:
+            os.replace(temporario, destino)
+        except OSError:
+            logger.error(f'Falha ao mover {temporario} para {destino}; restaure o arquivo manualmente', exc_info=True)
+    # Transação concluída: nada mais deve ser descartado
+    arquivos.clear()
+
+
+def _descartar(arquivos):
+    for temporario, _destino in arquivos:
+        try:
+            os.remove(temporario)
+        except FileNotFoundError:
+            pass
+
+
+def _ler(movimentacoes):
+    indice_motivo = {motivo: i for i, motivo in enumerate(MOTIVOS)}
+    textos = {}
+
+    def gerar():
+        colunas = movimentacoes.order_by('produto_id', 'data_movimentacao', 'pk').values_list(
+            'pk', 'produto_id', 'usuario_id', 'tipo', 'motivo', 'quantidade', 'data_movimentacao', 'data_ocorrencia',
+            'observacao',
+        )
+        for pk, produto_id, usuario_id, tipo, motivo, quantidade, data, ocorrencia, observacao in colunas.iterator(
+            chunk_size=TAMANHO_LOTE
+        ):
+            if motivo not in indice_motivo:
+                # Gravar como outro motivo perderia a informação; motivos novos entram no final de MOTIVOS
+                raise ValueError(f'Motivo sem posição no arquivo: {motivo!r} (movimentação {pk})')
+            if observacao:
+                textos[pk] = observacao
+            yield (
+                pk, produto_id, usuario_id or -1, tipo.encode(), indice_motivo[motivo],
+                quantidade, _micros(data), _micros(ocorrencia) if ocorrencia else SEM_DATA,
+            )
+
+    linhas = np.fromiter(gerar(), dtype=DTYPE)
+    return linhas, textos
+
+
+def _preparar(ano, linhas, textos):
+    """Grava o arquivo do ano em temporários; retorna [(temporário, destino)] para trocar após o commit"""
+    if _caminho(ano).exists():
+        # Ano já arquivado (nova rodada ou rodada interrompida): junta sem duplicar pelo id
+        anteriores = np.load(_caminho(ano))
+        anteriores = anteriores[~np.isin(anteriores['id'], linhas['id'])]
+        linhas = np.concatenate([anteriores, linhas])
+        linhas = linhas[np.lexsort((linhas['id'], linhas['data_movimentacao'], linhas['produto_id']))]
+        textos = {**observacoes(ano), **textos}
+
+    arquivos = [(_temporario(_caminho(ano), lambda f: np.save(f, linhas)), _caminho(ano))]
+    try:
+        arquivos.append((
+            _temporario(_caminho_observacoes(ano), lambda f: f.write(gzip.compress(json.dumps(textos).encode('utf-8')))),
+            _caminho_observacoes(ano),
+        ))
+    except BaseException:
+        _descartar(arquivos)
+        raise
+    return arquivos
+
+
+def _saldos_de_abertura(linhas, aberturas_antigas):
+    """
+    Saldo de cada produto no fim do ano a partir das próprias linhas arquivadas:
+    abertura anterior + entradas - saídas (não depende dos saldos diários existirem)
+    """
+    saldos = defaultdict(int)
+    for produto_id, tipo, quantidade in aberturas_antigas.values_list('produto_id', 'tipo', 'quantidade'):
+        saldos[produto_id] += quantidade if tipo == 'E' else -quantidade
+
+    quantidade = linhas['quantidade'].astype(np.int64)
+    sinal = np.where(linhas['tipo'] == b'E', 1, np.where(linhas['tipo'] == b'S', -1, 0))
+    produtos, posicao = np.unique(linhas['produto_id'], return_inverse=True)
+    for produto_id, delta in zip(produtos.tolist(), np.bincount(posicao, weights=quantidade * sinal).tolist()):
+        saldos[produto_id] += int(delta)
+    return saldos
+
+
+def arquivar_ano(ano):
+    """
+    Move as movimentações do ano para o arquivo e deixa na tabela uma movimentação
+    de saldo de abertura por produto, datada de 1º de janeiro do ano seguinte.
+    Os arquivos só substituem os anteriores depois do commit.
+    Retorna (movimentações arquivadas, saldos de abertura gravados).
+    """
+    inicio, fim = inicio_do_dia(date(ano, 1, 1)), inicio_do_dia(date(ano + 1, 1, 1))
+    saldo_abertura = MovimentacaoEstoque.SALDO_ABERTURA
+    arquivos = []
+
+    try:
+        with transaction.atomic():
+            do_ano = MovimentacaoEstoque.objects.filter(
+                data_movimentacao__gte=inicio, data_movimentacao__lt=fim
+            ).exclude(motivo=saldo_abertura)
+            linhas, textos = _ler(do_ano)
+
+            # Aberturas anteriores entram no novo saldo e são substituídas por ele
+            aberturas_antigas = MovimentacaoEstoque.objects.filter(motivo=saldo_abertura, data_movimentacao__lt=fim)
+            saldos = _saldos_de_abertura(linhas, aberturas_antigas)
+            if not saldos:
+                return 0, 0
+
+            arquivos = _preparar(ano, linhas, textos)
+            transaction.on_commit(lambda: _trocar(arquivos))
+
+            # DELETE direto: o saldo vai para a abertura (sem estorno no estoque)
+            # e as linhas não precisam ser carregadas só para disparar signals
+            removidas = MovimentacaoEstoque.objects.filter(
+                Q(data_movimentacao__gte=inicio, data_movimentacao__lt=fim) |
+                Q(motivo=saldo_abertura, data_movimentacao__lt=fim)
+            )
+            removidas._raw_delete(removidas.db)
+
+            aberturas = MovimentacaoEstoque.objects.bulk_create([
+                MovimentacaoEstoque(
+                    produto_id=produto_id,
+                    tipo='E' if saldo >= 0 else 'S',
+                    quantidade=abs(saldo),
+                    motivo=saldo_abertura,
+                    observacao=f'Saldo de abertura: movimentações até {ano} arquivadas',
+                    data_ocorrencia=fim,
+                )
+                for produto_id, saldo in sorted(saldos.items()) if saldo
+            ], batch_size=1000)
+            # auto_now_add preenche data_movimentacao com agora; a abertura fica no início do ano seguinte
+            pks = [abertura.pk for abertura in aberturas]
+            for i in range(0, len(pks), 500):
+                MovimentacaoEstoque.objects.filter(pk__in=pks[i:i + 500]).update(data_movimentacao=fim)
+
+            transaction.on_commit(invalidar_arquivo)
+            invalidar_dashboard_apos_commit()
+            transaction.on_commit(invalidar_periodos_fechados)
+    except BaseException:
+        # Sem commit os arquivos do ano continuam os anteriores
+        _descartar(arquivos)
+        raise
+    return len(linhas), len(aberturas)
+
+
+def arquivar(horizonte_dias=None):
+    """Arquiva, ano a ano e do mais antigo em diante, tudo o que está antes do corte"""
+    corte = data_corte(horizonte_dias)
+    primeira = MovimentacaoEstoque.objects.exclude(motivo=MovimentacaoEstoque.SALDO_ABERTURA).filter(
+        data_movimentacao__lt=inicio_do_dia(corte)
+    ).order_by('data_movimentacao').values_list('data_movimentacao', flat=True).first()
+    if primeira is None:
+        return []
+    return [(ano,) + arquivar_ano(ano) for ano in range(timezone.localdate(primeira).year, corte.year)]
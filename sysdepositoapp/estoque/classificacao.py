@@ -0,0 +1,95 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from produto.models import Produto
+from .models import ClassificacaoEstoque
+from .previsao import carregar_saidas_diarias
+
+DIAS_POR_PERIODO = 30
+PERIODOS = 12  # 12 períodos de 30 dias (~1 ano) para valor de consumo e variabilidade
+LIMITE_A = 0.80  # participação acumulada no valor de consumo
+LIMITE_B = 0.95
+LIMITE_X = 0.5  # coeficiente de variação da demanda por período
+LIMITE_Y = 1.0
+
+CAMPOS = ['valor_consumo', 'participacao_acumulada', 'coeficiente_variacao', 'classe_abc', 'classe_xyz']
+
+
+def classificar(saidas_por_periodo, preco_custo):
+    """
+    Classificação vetorizada do catálogo inteiro.
+    `saidas_por_periodo` é a matriz (produtos x períodos) de quantidades que saíram.
+    Retorna (valor_consumo, participacao_acumulada, coeficiente_variacao, classe_abc, classe_xyz).
+    """
+    valor = saidas_por_periodo.sum(axis=1) * preco_custo
+    total = valor.sum()
+
+    # Participação acumulada seguindo a ordem decrescente de valor
+    ordem = np.argsort(-valor, kind='stable')
+    acumulado = np.ones_like(valor)
+    anterior = np.ones_like(valor)
+    if total > 0:
+        acumulado[ordem] = np.cumsum(valor[ordem]) / total
+        anterior = acumulado - valor / total
+
+    # A classe vem da participação acumulada antes do item: o primeiro é sempre A
+    classe_abc = np.where(
+        valor <= 0, 'C', np.where(anterior < LIMITE_A, 'A', np.where(anterior < LIMITE_B, 'B', 'C'))
+    )
+
+    media = saidas_por_periodo.mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coeficiente = np.where(media > 0, saidas_por_periodo.std(axis=1) / media, np.nan)
+    # Sem demanda no período o coeficiente é NaN e o produto fica em Z
+    classe_xyz = np.where(coeficiente <= LIMITE_X, 'X', np.where(coeficiente <= LIMITE_Y, 'Y', 'Z'))
+
+    return valor, acumulado, coeficiente, classe_abc, classe_xyz
+
+
+def gerar_classificacao():
+    """
+    Recalcula a classificação ABC/XYZ de todos os produtos ativos e grava só o que mudou.
+    Retorna (criados, atualizados, removidos).
+    """
+    hoje = timezone.localdate()
+    dias = DIAS_POR_PERIODO * PERIODOS
+    data_inicio = hoje - timedelta(days=dias - 1)
+
+    produtos = list(Produto.objects.filter(ativo=True).order_by('pk').values_list('pk', 'preco_custo'))
+    produto_ids = [pk for pk, _ in produtos]
+    preco_custo = np.array([float(preco) for _, preco in produtos], dtype=np.float64)
+
+    saidas = carregar_saidas_diarias(produto_ids, data_inicio, dias)
+    saidas_por_periodo = saidas.reshape(len(produto_ids), PERIODOS, DIAS_POR_PERIODO).sum(axis=2)
+    valor, acumulado, coeficiente, classe_abc, classe_xyz = classificar(saidas_por_periodo, preco_custo)
+
+    agora = timezone.now()
+    existentes = {c.produto_id: c for c in ClassificacaoEstoque.objects.all()}
+    novos, alterados = [], []
+    for i, produto_id in enumerate(produto_ids):
+        valores = {
+            'valor_consumo': Decimal(f'{valor[i]:.2f}'),
+            'participacao_acumulada': Decimal(f'{acumulado[i]:.4f}'),
+            'coeficiente_variacao': None if np.isnan(coeficiente[i]) else Decimal(f'{coeficiente[i]:.3f}'),
+            'classe_abc': str(classe_abc[i]),
+            'classe_xyz': str(classe_xyz[i]),
+        }
+        atual = existentes.pop(produto_id, None)
+        if atual is None:
+            novos.append(ClassificacaoEstoque(produto_id=produto_id, atualizado_em=agora, **valores))
+        elif any(getattr(atual, campo) != valor_novo for campo, valor_novo in valores.items()):
+            for campo, valor_novo in valores.items():
+                setattr(atual, campo, valor_novo)
+            atual.atualizado_em = agora
+            alterados.append(atual)
+
+    # O que sobrou em `existentes` é de produto inativado
+    with transaction.atomic():
+        ClassificacaoEstoque.objects.filter(produto_id__in=list(existentes)).delete()
+        ClassificacaoEstoque.objects.bulk_create(novos, batch_size=1000)
+        ClassificacaoEstoque.objects.bulk_update(alterados, CAMPOS + ['atualizado_em'], batch_size=1000)
+    return len(novos), len(alterados), len(existentes)
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.db.models.functions import Coalesce
+
+from produto.models import Produto
+from .dashboard import invalidar_dashboard_apos_commit
+from .models import MovimentacaoEstoque
+from .saldos import registrar_saldos
+
+TAMANHO_LOTE = 1000
+OBSERVACAO_CORRECAO = 'Conciliação: movimentação que iguala o razão ao estoque registrado'
+
+
+def faixas_de_produtos(tamanho=TAMANHO_LOTE):
+    """(primeiro_pk, ultimo_pk) de cada lote, para consultar por intervalo da chave primária"""
+    pks = list(Produto.objects.order_by('pk').values_list('pk', flat=True))
+    return [(pks[i], pks[min(i + tamanho, len(pks)) - 1]) for i in range(0, len(pks), tamanho)]
+
+
+def divergencias(produtos):
+    """
+    Uma consulta agrupada: estoque registrado x soma do razão (entradas - saídas)
+    de cada produto. Retorna só os divergentes como (pk, sku, nome, estoque_atual, razao).
+    """
+    efeito = Case(
+        When(movimentacoes__tipo='E', then=F('movimentacoes__quantidade')),
+        When(movimentacoes__tipo='S', then=-F('movimentacoes__quantidade')),
+        default=0,
+        output_field=IntegerField(),
+    )
+    linhas = produtos.order_by('pk').values('pk', 'sku', 'nome', 'estoque_atual').annotate(
+        razao=Coalesce(Sum(efeito), 0)
+    ).values_list('pk', 'sku', 'nome', 'estoque_atual', 'razao')
+    return [linha for linha in linhas if linha[3] != linha[4]]
+
+
+def divergencias_da_faixa(faixa):
+    inicio, fim = faixa
+    return divergencias(Produto.objects.filter(pk__gte=inicio, pk__lte=fim))
+
+
+def _divergencias_na_thread(faixa):
+    try:
+        return divergencias_da_faixa(faixa)
+    finally:
+        # Cada thread abre a própria conexão; fecha ao terminar o lote
+        connections.close_all()
+
+
+def conciliar(tamanho_lote=TAMANHO_LOTE, threads=4):
+    """
+    Compara estoque e razão de todo o catálogo em lotes de produtos.
+    O trabalho é no banco, então os lotes rodam em threads (com threads=1, na própria thread).
+    """
+    faixas = faixas_de_produtos(tamanho_lote)
+    if threads <= 1 or len(faixas) <= 1:
+        resultados = [divergencias_da_faixa(faixa) for faixa in faixas]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            resultados = list(pool.map(_divergencias_na_thread, faixas))
+    return [linha for lote in resultados for linha in lote]
+
+
+def corrigir(produto_ids, usuario=None):
+    """
+    Lança em lote, sem alterar o estoque, as movimentações que levam o razão ao
+    estoque registrado. A diferença é recalculada com os produtos travados, para
+    não corrigir com um valor que mudou depois do relatório.
+    """
+    produto_ids = sorted(produto_ids)
+    with transaction.atomic():
+        list(Produto.objects.select_for_update().filter(pk__in=produto_ids).order_by('pk').values_list('pk'))
+        atuais = []
+        for i in range(0, len(produto_ids), TAMANHO_LOTE):
+            atuais += divergencias(Produto.objects.filter(pk__in=produto_ids[i:i + TAMANHO_LOTE]))
+
+        correcoes = MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto_id=pk,
+                tipo='E' if estoque > razao else 'S',
+                quantidade=abs(estoque - razao),
+                motivo='ajuste',
+                observacao=OBSERVACAO_CORRECAO,
+                usuario=usuario,
+            )
+            for pk, _sku, _nome, estoque, razao in atuais
+        ], batch_size=1000)
+
+        # O estoque já está no valor certo: só os saldos do dia registram as correções
+        registrar_saldos(
+            (mov.produto_id, mov.data_movimentacao, mov.tipo, mov.quantidade, 1) for mov in correcoes
+        )
+        invalidar_dashboard_apos_commit()
+    return len(correcoes)
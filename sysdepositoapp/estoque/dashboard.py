@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from produto.contadores import contagem_por_status
+from produto.models import Produto
+from .models import MovimentacaoEstoque
+
+CHAVE_CACHE_DASHBOARD = 'estoque:dashboard'
+# Rede de segurança: os signals invalidam o cache a cada alteração, o TTL cobre o que escapar
+TEMPO_CACHE_DASHBOARD = 120  # segundos
+
+# Gerações que entram na chave dos relatórios em cache: a primeira muda a cada escrita
+# no estoque; a segunda só quando a escrita cai em um dia passado (períodos fechados)
+CHAVE_GERACAO_RELATORIOS = 'estoque:relatorios:geracao'
+CHAVE_GERACAO_RETROATIVA = 'estoque:relatorios:geracao_retroativa'
+# Totais do arquivo de movimentações em cache: só mudam quando o arquivamento grava um ano
+CHAVE_GERACAO_ARQUIVO = 'estoque:arquivo:geracao'
+
+
+def calcular_dashboard():
+    """Números e listas do dashboard (contagens lidas da tabela de contadores por status)"""
+    contagem = contagem_por_status()
+    contagens = {
+        'total_produtos': contagem['total'],
+        'produtos_estoque_baixo': contagem['baixo'],
+        'produtos_esgotados': contagem['esgotado'],
+        'produtos_estoque_normal': contagem['normal'],
+    }
+
+    # Listas materializadas para poderem ir para o cache
+    contagens['movimentacoes_recentes'] = list(
+        MovimentacaoEstoque.objects.select_related('produto').order_by('-data_movimentacao')[:10]
+    )
+    contagens['produtos_alerta'] = list(
+        Produto.objects.filter(status_estoque__in=['esgotado', 'baixo']).order_by('estoque_atual')[:5]
+    )
+    return contagens
+
+
+def dados_dashboard():
+    """Dados do dashboard; em regime normal custa uma leitura de cache"""
+    return cache.get_or_set(CHAVE_CACHE_DASHBOARD, calcular_dashboard, TEMPO_CACHE_DASHBOARD)
+
+
+def geracao(chave):
+    # Leitura simples no caso comum; add só na primeira vez, sem sobrescrever quem chegou antes
+    valor = cache.get(chave)
+    if valor is None:
+        cache.add(chave, 1, None)
+        valor = cache.get(chave, 1)
+    return valor
+
+
+def _avancar_geracao(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 2, None)
+
+
+def invalidar_dashboard():
+    cache.delete(CHAVE_CACHE_DASHBOARD)
+    _avancar_geracao(CHAVE_GERACAO_RELATORIOS)
+
+
+def invalidar_periodos_fechados():
+    """Alteração com data passada: relatórios de períodos já encerrados precisam ser refeitos"""
+    _avancar_geracao(CHAVE_GERACAO_RETROATIVA)
+
+
+def invalidar_arquivo():
+    """Arquivo de movimentações regravado: os totais guardados dele deixam de valer"""
+    _avancar_geracao(CHAVE_GERACAO_ARQUIVO)
+
+
+def invalidar_dashboard_apos_commit():
+    """Invalida só depois do commit, para o próximo acesso não recalcular com dados antigos"""
+    transaction.on_commit(invalidar_dashboard)
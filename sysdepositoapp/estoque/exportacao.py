@@ -0,0 +1,116 @@
+import csv
+import itertools
+import zlib
+
+from django.db.models import Case, CharField, F, Value, When
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+TAMANHO_LOTE = 2000
+
+
+class Echo:
+    """Pseudo-buffer para o csv.writer: devolve a linha em vez de acumulá-la"""
+
+    def write(self, value):
+        return value
+
+
+def resposta_csv(cabecalho, linhas, nome_arquivo, compactar=False):
+    """
+    StreamingHttpResponse que gera o CSV linha a linha, enviando bytes
+    desde o início e mantendo a memória constante para qualquer volume.
+    Com compactar=True o fluxo sai em gzip (nome_arquivo + '.gz').
+    """
+    writer = csv.writer(Echo())
+
+    def gerar():
+        yield writer.writerow(cabecalho)
+        for linha in linhas:
+            yield writer.writerow(linha)
+
+    if compactar:
+        response = StreamingHttpResponse(_gzip(gerar()), content_type='application/gzip')
+        nome_arquivo += '.gz'
+    else:
+        response = StreamingHttpResponse(gerar(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
+def _gzip(partes, tamanho_bloco=64 * 1024):
+    # Compacta o fluxo em blocos, sem montar o arquivo inteiro em memória
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = []
+    acumulado = 0
+    for parte in partes:
+        buffer.append(parte.encode('utf-8'))
+        acumulado += len(buffer[-1])
+        if acumulado >= tamanho_bloco:
+            bloco = compressor.compress(b''.join(buffer))
+            buffer, acumulado = [], 0
+            if bloco:
+                yield bloco
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def quer_gzip(request):
+    """Indica se a exportação foi pedida compactada (?gzip=1)"""
+    return request.GET.get('gzip') in ('1', 'true', 'sim')
+
+
+def rotulo_choices(campo, choices):
+    """CASE em SQL que troca o valor do campo pelo rótulo do choices (get_FOO_display)"""
+    return Case(
+        *[When(**{campo: valor}, then=Value(rotulo)) for valor, rotulo in choices],
+        default=F(campo),
+        output_field=CharField(),
+    )
+
+
+def texto_ou_vazio(campo):
+    """Campo texto opcional com NULL convertido em '' no próprio banco"""
+    return Coalesce(campo, Value(''), output_field=CharField())
+
+
+def linhas_movimentacoes(movimentacoes, filtros_arquivo=None):
+    """
+    Lê as movimentações com values_list + iterator, sem instanciar modelos.
+    Com filtros_arquivo, continua pelas movimentações arquivadas (todas mais antigas).
+    """
+    from .arquivo import registros_arquivo
+    from .models import MovimentacaoEstoque
+
+    tipos = dict(MovimentacaoEstoque.TIPO_CHOICES)
+    motivos = dict(MovimentacaoEstoque.MOTIVO_CHOICES)
+
+    colunas = movimentacoes.order_by('-data_movimentacao', '-pk').values_list(
+        'data_movimentacao', 'produto__nome', 'produto__sku', 'tipo', 'quantidade',
+        'motivo', 'usuario__username', 'data_ocorrencia', 'observacao',
+    ).iterator(chunk_size=TAMANHO_LOTE)
+    if filtros_arquivo is not None:
+        colunas = itertools.chain(colunas, registros_arquivo(**filtros_arquivo))
+
+    for data, nome, sku, tipo, quantidade, motivo, usuario, ocorrencia, observacao in colunas:
+        yield [
+            timezone.localtime(data).strftime('%d/%m/%Y %H:%M'),
+            nome,
+            sku,
+            tipos.get(tipo, tipo),
+            quantidade,
+            motivos.get(motivo, motivo),
+            usuario or '',
+            timezone.localtime(ocorrencia).strftime('%d/%m/%Y %H:%M') if ocorrencia else '',
+            observacao or '',
+        ]
+
+
+def linhas_estoque(produtos):
+    """Produtos com categoria e status resolvidos em uma única consulta com JOIN"""
+    return produtos.order_by('nome').annotate(
+        categoria_nome=texto_ou_vazio('categoria__nome'),
+    ).values_list(
+        'nome', 'sku', 'categoria_nome', 'estoque_atual', 'estoque_minimo',
+        'status_estoque', 'preco_custo', 'preco_venda',
+    ).iterator(chunk_size=TAMANHO_LOTE)
@@ -0,0 +1,61 @@
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+def converter_data(valor):
+    """Converte 'AAAA-MM-DD' (ou date) em date; retorna None se inválido"""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return timezone.localdate(valor) if timezone.is_aware(valor) else valor.date()
+    if isinstance(valor, date):
+        return valor
+    try:
+        return parse_date(str(valor))
+    except ValueError:
+        return None
+
+
+def inicio_do_dia(dia):
+    """Meia-noite (no fuso local) do dia informado, como datetime com fuso"""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def filtro_periodo(campo, data_inicio=None, data_fim=None):
+    """
+    Monta um intervalo semiaberto [início, fim + 1 dia) sobre a coluna de data/hora,
+    em vez de campo__date__gte/lte, para que o banco possa usar o índice da coluna.
+    """
+    filtros = {}
+    data_inicio = converter_data(data_inicio)
+    data_fim = converter_data(data_fim)
+    if data_inicio:
+        filtros[f'{campo}__gte'] = inicio_do_dia(data_inicio)
+    if data_fim:
+        filtros[f'{campo}__lt'] = inicio_do_dia(data_fim + timedelta(days=1))
+    return filtros
+
+
+def filtrar_movimentacoes(movimentacoes, produto_id=None, tipo=None, data_inicio=None, data_fim=None,
+                          campo_data='data_movimentacao'):
+    """Aplica os filtros da listagem de movimentações de forma compatível com os índices"""
+    if produto_id:
+        movimentacoes = movimentacoes.filter(produto_id=produto_id)
+    if tipo:
+        movimentacoes = movimentacoes.filter(tipo=tipo)
+    return movimentacoes.filter(**filtro_periodo(campo_data, data_inicio, data_fim))
+
+
+def filtros_da_requisicao(request):
+    """Lê produto, tipo e período da query string usados nas telas de movimentação"""
+    produto_id = request.GET.get('produto') or None
+    if produto_id and not produto_id.isdigit():
+        produto_id = None
+    return {
+        'produto_id': produto_id,
+        'tipo': request.GET.get('tipo') or None,
+        'data_inicio': converter_data(request.GET.get('data_inicio')),
+        'data_fim': converter_data(request.GET.get('data_fim')),
+    }
@@ -1,5 +1,5 @@
 from django import forms
-from .models import MovimentacaoEstoque, AjusteEstoque
+from .models import MovimentacaoEstoque, AjusteEstoque, ClassificacaoEstoque
 from produto.models import Produto
 
 class MovimentacaoEstoqueForm(forms.ModelForm):
@@ -14,8 +14,16 @@ class MovimentacaoEstoqueForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['produto'].queryset = Produto.objects.filter(ativo=True)
+        # Saldo de abertura só é criado pelo arquivamento, e as baixas de entrega pelas entregas
+        self.fields['motivo'].choices = [
+            (valor, rotulo) for valor, rotulo in self.fields['motivo'].choices
+            if valor not in (MovimentacaoEstoque.SALDO_ABERTURA, MovimentacaoEstoque.ENTREGA)
+        ]
 
 class AjusteEstoqueForm(forms.ModelForm):
+    # Versão do produto quando o estoque foi exibido (preenchida pela tela)
+    versao = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = AjusteEstoque
         fields = ['produto', 'estoque_novo', 'motivo']
@@ -43,6 +51,14 @@ class RelatorioEstoqueForm(forms.Form):
         required=False,
         empty_label='Todas as categorias'
     )
+    classe_abc = forms.ChoiceField(
+        choices=[('', 'Todas as classes ABC')] + ClassificacaoEstoque.CLASSE_ABC_CHOICES,
+        required=False,
+    )
+    classe_xyz = forms.ChoiceField(
+        choices=[('', 'Todas as classes XYZ')] + ClassificacaoEstoque.CLASSE_XYZ_CHOICES,
+        required=False,
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
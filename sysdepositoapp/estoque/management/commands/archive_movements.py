@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from estoque.arquivo import arquivar, diretorio
+
+
+class Command(BaseCommand):
+    help = 'Arquiva as movimentações de anos anteriores ao horizonte e grava saldos de abertura'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizonte-dias', type=int, help='Dias mantidos na tabela (padrão: ESTOQUE_ARQUIVO_HORIZONTE_DIAS)')
+
+    def handle(self, *args, **options):
+        anos = arquivar(options['horizonte_dias'])
+        if not anos:
+            self.stdout.write('Nada a arquivar.')
+            return
+
+        for ano, arquivadas, aberturas in anos:
+            self.stdout.write(f'{ano}: {arquivadas} movimentação(ões) arquivada(s), {aberturas} saldo(s) de abertura.')
+        self.stdout.write(self.style.SUCCESS(f'Arquivo em {diretorio()}.'))
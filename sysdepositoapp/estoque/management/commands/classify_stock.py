@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from estoque.classificacao import gerar_classificacao
+
+
+class Command(BaseCommand):
+    help = 'Classifica os produtos por valor de consumo (ABC) e variabilidade da demanda (XYZ)'
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        criados, atualizados, removidos = gerar_classificacao()
+        self.stdout.write(self.style.SUCCESS(
+            f'{criados} classificação(ões) criada(s), {atualizados} atualizada(s) e {removidos} removida(s) '
+            f'em {time.perf_counter() - inicio:.1f}s.'
+        ))
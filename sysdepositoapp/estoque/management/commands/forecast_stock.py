@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from estoque.previsao import DIAS_HISTORICO, JANELA_MEDIA_DIAS, gerar_previsoes
+
+
+class Command(BaseCommand):
+    help = 'Calcula consumo médio, dias de cobertura e sugestão de compra de todos os produtos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--janela', type=int, default=JANELA_MEDIA_DIAS, help='Dias da média móvel de consumo')
+        parser.add_argument('--dias-historico', type=int, default=DIAS_HISTORICO, help='Dias de histórico carregados')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = gerar_previsoes(janela=options['janela'], dias_historico=options['dias_historico'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} previsão(ões) gravada(s) em {time.perf_counter() - inicio:.1f}s.'
+        ))
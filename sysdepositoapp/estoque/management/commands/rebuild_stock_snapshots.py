@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Sum, When
+from django.db.models.functions import TruncDate
+
+from produto.models import Produto
+from estoque.arquivo import inicio_tabela
+from estoque.models import MovimentacaoEstoque, SaldoDiarioEstoque
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela de saldos diários a partir das movimentações de estoque'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produto', type=int, action='append', help='Reconstruir apenas este produto (pode repetir)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Produtos processados por transação')
+
+    def handle(self, *args, **options):
+        produtos = Produto.objects.order_by('pk')
+        if options['produto']:
+            produtos = produtos.filter(pk__in=options['produto'])
+
+        estoques = list(produtos.values_list('pk', 'estoque_atual'))
+        # Saldos dos anos arquivados não podem ser refeitos: as movimentações saíram da tabela
+        corte = inicio_tabela()
+        tamanho = options['chunk_size']
+        total_linhas = 0
+
+        for inicio in range(0, len(estoques), tamanho):
+            lote = dict(estoques[inicio:inicio + tamanho])
+            with transaction.atomic():
+                antigos = SaldoDiarioEstoque.objects.filter(produto_id__in=lote)
+                if corte:
+                    antigos = antigos.filter(data__gte=corte)
+                antigos.delete()
+                saldos = self._saldos_do_lote(lote)
+                SaldoDiarioEstoque.objects.bulk_create(saldos, batch_size=1000)
+            total_linhas += len(saldos)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_linhas} saldos diários gerados para {len(estoques)} produtos.'
+        ))
+
+    def _saldos_do_lote(self, estoques):
+        # Um único GROUP BY (produto, dia) para o lote inteiro
+        dias = MovimentacaoEstoque.objects.filter(produto_id__in=estoques).exclude(
+            motivo=MovimentacaoEstoque.SALDO_ABERTURA
+        ).annotate(
+            dia=TruncDate('data_movimentacao')
+        ).values('produto_id', 'dia').annotate(
+            entradas=Sum(Case(When(tipo='E', then='quantidade'), default=0, output_field=IntegerField())),
+            saidas=Sum(Case(When(tipo='S', then='quantidade'), default=0, output_field=IntegerField())),
+        ).order_by('produto_id', '-dia')
+
+        # Percorre do dia mais recente para trás partindo do estoque atual
+        saldos = []
+        produto_atual, saldo = None, 0
+        for linha in dias:
+            if linha['produto_id'] != produto_atual:
+                produto_atual = linha['produto_id']
+                saldo = estoques[produto_atual]
+            saldos.append(SaldoDiarioEstoque(
+                produto_id=produto_atual,
+                data=linha['dia'],
+                entradas=linha['entradas'],
+                saidas=linha['saidas'],
+                saldo=saldo,
+            ))
+            saldo -= linha['entradas'] - linha['saidas']
+        return saldos
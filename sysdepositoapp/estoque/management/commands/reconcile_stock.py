@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from estoque.conciliacao import TAMANHO_LOTE, conciliar, corrigir
+
+
+class Command(BaseCommand):
+    help = 'Compara o estoque registrado de cada produto com a soma das movimentações (entradas - saídas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=TAMANHO_LOTE, help='Produtos por consulta agrupada')
+        parser.add_argument('--workers', type=int, default=4, help='Lotes consultados em paralelo')
+        parser.add_argument('--fix', action='store_true', help='Lança movimentações de ajuste que zeram as diferenças')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        divergentes = conciliar(options['chunk_size'], options['workers'])
+        duracao = time.perf_counter() - inicio
+
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS(f'Nenhuma divergência entre estoque e movimentações ({duracao:.1f}s).'))
+            return
+
+        self.stdout.write(f"{'SKU':<20} {'PRODUTO':<40} {'ESTOQUE':>10} {'RAZÃO':>10} {'DIFERENÇA':>10}")
+        for _pk, sku, nome, estoque, razao in divergentes:
+            self.stdout.write(f'{sku:<20} {nome[:40]:<40} {estoque:>10} {razao:>10} {estoque - razao:>+10}')
+
+        total = sum(abs(estoque - razao) for _pk, _sku, _nome, estoque, razao in divergentes)
+        self.stdout.write(self.style.WARNING(
+            f'{len(divergentes)} produto(s) divergente(s), {total} unidade(s) de diferença ({duracao:.1f}s).'
+        ))
+
+        if options['fix']:
+            corrigidos = corrigir([pk for pk, *_ in divergentes])
+            self.stdout.write(self.style.SUCCESS(f'{corrigidos} movimentação(ões) de ajuste lançada(s).'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0001_initial'),
+        ('produto', '0003_categoria_status_ativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoDiarioEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('entradas', models.IntegerField(default=0)),
+                ('saidas', models.IntegerField(default=0)),
+                ('saldo', models.IntegerField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_diarios', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'Saldo Diário de Estoque',
+                'verbose_name_plural': 'Saldos Diários de Estoque',
+                'ordering': ['-data'],
+                'constraints': [models.UniqueConstraint(fields=('produto', 'data'), name='saldo_diario_produto_data_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0002_saldodiarioestoque'),
+        ('produto', '0003_categoria_status_ativo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['produto', 'data_movimentacao'], name='mov_produto_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['tipo', 'data_movimentacao'], name='mov_tipo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_movimentacao'], name='mov_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_ocorrencia'], name='mov_ocorrencia_idx'),
+        ),
+    ]
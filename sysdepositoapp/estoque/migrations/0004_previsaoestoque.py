@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0003_indices_movimentacao'),
+        ('produto', '0004_status_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estoque_atual', models.IntegerField()),
+                ('consumo_medio_diario', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('dias_cobertura', models.DecimalField(blank=True, decimal_places=1, max_digits=12, null=True)),
+                ('data_ruptura', models.DateField(blank=True, null=True)),
+                ('quantidade_sugerida', models.IntegerField(default=0)),
+                ('calculado_em', models.DateTimeField()),
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='previsao_estoque', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'Previsão de Estoque',
+                'verbose_name_plural': 'Previsões de Estoque',
+                'ordering': ['dias_cobertura'],
+                'indexes': [models.Index(fields=['dias_cobertura'], name='previsao_cobertura_idx')],
+            },
+        ),
+    ]
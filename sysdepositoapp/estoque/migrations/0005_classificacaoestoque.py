@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_previsaoestoque'),
+        ('produto', '0004_status_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificacaoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valor_consumo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('participacao_acumulada', models.DecimalField(decimal_places=4, max_digits=7)),
+                ('coeficiente_variacao', models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True)),
+                ('classe_abc', models.CharField(choices=[('A', 'A - Alto valor'), ('B', 'B - Valor intermediário'), ('C', 'C - Baixo valor')], db_index=True, max_length=1)),
+                ('classe_xyz', models.CharField(choices=[('X', 'X - Demanda estável'), ('Y', 'Y - Demanda variável'), ('Z', 'Z - Demanda irregular')], db_index=True, max_length=1)),
+                ('atualizado_em', models.DateTimeField()),
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='classificacao', to='produto.produto')),
+            ],
+            options={
+                'verbose_name': 'Classificação ABC/XYZ',
+                'verbose_name_plural': 'Classificações ABC/XYZ',
+                'ordering': ['-valor_consumo'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_motivo_saldo_abertura'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimentacaoestoque',
+            name='motivo',
+            field=models.CharField(choices=[('compra', 'Compra'), ('venda', 'Venda'), ('ajuste', 'Ajuste de Estoque'), ('devolucao', 'Devolução'), ('perda', 'Perda/Danificado'), ('producao', 'Produção'), ('outro', 'Outro'), ('saldo_abertura', 'Saldo de Abertura'), ('entrega', 'Entrega')], default='ajuste', max_length=20),
+        ),
+    ]
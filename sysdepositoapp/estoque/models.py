@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from produto.models import Produto
 
@@ -16,8 +16,15 @@ class MovimentacaoEstoque(models.Model):
         ('perda', 'Perda/Danificado'),
         ('producao', 'Produção'),
         ('outro', 'Outro'),
+        ('saldo_abertura', 'Saldo de Abertura'),
+        ('entrega', 'Entrega'),
     ]
 
+    # Gerada pelo arquivamento no lugar das movimentações arquivadas (não entra nas estatísticas)
+    SALDO_ABERTURA = 'saldo_abertura'
+    # Baixas e ajustes lançados pela finalização e edição de entregas
+    ENTREGA = 'entrega'
+
     produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='movimentacoes')
     tipo = models.CharField(max_length=1, choices=TIPO_CHOICES)
     quantidade = models.IntegerField()
@@ -31,29 +38,51 @@ class MovimentacaoEstoque(models.Model):
         verbose_name = 'Movimentação de Estoque'
         verbose_name_plural = 'Movimentações de Estoque'
         ordering = ['-data_movimentacao']
+        indexes = [
+            models.Index(fields=['produto', 'data_movimentacao'], name='mov_produto_data_idx'),
+            models.Index(fields=['tipo', 'data_movimentacao'], name='mov_tipo_data_idx'),
+            models.Index(fields=['data_movimentacao'], name='mov_data_idx'),
+            models.Index(fields=['data_ocorrencia'], name='mov_ocorrencia_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.produto.nome} - {self.quantidade}"
 
     def save(self, *args, **kwargs):
-        # Atualizar o estoque do produto
-        if self.tipo == 'E':
-            self.produto.estoque_atual += self.quantidade
-        elif self.tipo == 'S':
-            self.produto.estoque_atual -= self.quantidade
-        
-        self.produto.save()
-        super().save(*args, **kwargs)
+        # Atualizar o estoque do produto com UPDATE atômico (estoque_atual = estoque_atual ± n)
+        from .services import postar_lancamentos
+
+        with transaction.atomic():
+            lancamentos = []
+            if not self._state.adding and self.pk:
+                # Edição: desfaz o efeito da versão gravada antes de aplicar a nova
+                anterior = type(self).objects.filter(pk=self.pk).values_list(
+                    'produto_id', 'data_movimentacao', 'tipo', 'quantidade'
+                ).first()
+                if anterior:
+                    lancamentos.append(anterior + (-1,))
+
+            super().save(*args, **kwargs)
+            lancamentos.append((self.produto_id, self.data_movimentacao, self.tipo, self.quantidade, 1))
+            postar_lancamentos(lancamentos)
+
+        self._recarregar_estoque_produto()
 
     def delete(self, *args, **kwargs):
         # Reverter o estoque ao excluir a movimentação
-        if self.tipo == 'E':
-            self.produto.estoque_atual -= self.quantidade
-        elif self.tipo == 'S':
-            self.produto.estoque_atual += self.quantidade
-        
-        self.produto.save()
-        super().delete(*args, **kwargs)
+        from .services import postar_lancamentos
+
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            postar_lancamentos([(self.produto_id, self.data_movimentacao, self.tipo, self.quantidade, -1)])
+
+        self._recarregar_estoque_produto()
+        return resultado
+
+    def _recarregar_estoque_produto(self):
+        # Mantém o produto já carregado em memória coerente com o banco
+        if type(self).produto.is_cached(self):
+            self.produto.refresh_from_db(fields=['estoque_atual', 'status_estoque', 'versao', 'data_atualizacao'])
 
 class AjusteEstoque(models.Model):
     produto = models.ForeignKey(Produto, on_delete=models.CASCADE)
@@ -73,4 +102,80 @@ class AjusteEstoque(models.Model):
 
     @property
     def diferenca(self):
-        return self.estoque_novo - self.estoque_anterior
\ No newline at end of file
+        return self.estoque_novo - self.estoque_anterior
+
+class SaldoDiarioEstoque(models.Model):
+    """Saldo de fechamento de cada produto nos dias em que houve movimentação"""
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='saldos_diarios')
+    data = models.DateField()
+    entradas = models.IntegerField(default=0)
+    saidas = models.IntegerField(default=0)
+    saldo = models.IntegerField()
+
+    class Meta:
+        verbose_name = 'Saldo Diário de Estoque'
+        verbose_name_plural = 'Saldos Diários de Estoque'
+        ordering = ['-data']
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'data'], name='saldo_diario_produto_data_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto.nome} - {self.data:%d/%m/%Y}: {self.saldo}"
+
+    @property
+    def saldo_inicial(self):
+        return self.saldo - (self.entradas - self.saidas)
+
+
+class PrevisaoEstoque(models.Model):
+    """Resultado do job de previsão de ruptura (um registro por produto)"""
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, related_name='previsao_estoque')
+    estoque_atual = models.IntegerField()
+    consumo_medio_diario = models.DecimalField(max_digits=12, decimal_places=3)
+    dias_cobertura = models.DecimalField(max_digits=12, decimal_places=1, null=True, blank=True)
+    data_ruptura = models.DateField(null=True, blank=True)
+    quantidade_sugerida = models.IntegerField(default=0)
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Previsão de Estoque'
+        verbose_name_plural = 'Previsões de Estoque'
+        ordering = ['dias_cobertura']
+        indexes = [
+            models.Index(fields=['dias_cobertura'], name='previsao_cobertura_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto.nome} - {self.dias_cobertura or '∞'} dias"
+
+
+class ClassificacaoEstoque(models.Model):
+    """Classe ABC (valor de consumo) e XYZ (variabilidade da demanda) de cada produto"""
+    CLASSE_ABC_CHOICES = [
+        ('A', 'A - Alto valor'),
+        ('B', 'B - Valor intermediário'),
+        ('C', 'C - Baixo valor'),
+    ]
+
+    CLASSE_XYZ_CHOICES = [
+        ('X', 'X - Demanda estável'),
+        ('Y', 'Y - Demanda variável'),
+        ('Z', 'Z - Demanda irregular'),
+    ]
+
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, related_name='classificacao')
+    valor_consumo = models.DecimalField(max_digits=14, decimal_places=2)
+    participacao_acumulada = models.DecimalField(max_digits=7, decimal_places=4)
+    coeficiente_variacao = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True)
+    classe_abc = models.CharField(max_length=1, choices=CLASSE_ABC_CHOICES, db_index=True)
+    classe_xyz = models.CharField(max_length=1, choices=CLASSE_XYZ_CHOICES, db_index=True)
+    atualizado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Classificação ABC/XYZ'
+        verbose_name_plural = 'Classificações ABC/XYZ'
+        ordering = ['-valor_consumo']
+
+    def __str__(self):
+        return f"{self.produto.nome} - {self.classe_abc}{self.classe_xyz}"
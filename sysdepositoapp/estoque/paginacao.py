@@ -0,0 +1,108 @@
+import hashlib
+from datetime import datetime
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+SALT_CURSOR = 'estoque.movimentacoes.cursor'
+TEMPO_CACHE_TOTAL = 300  # segundos
+
+
+def gerar_cursor(movimentacao, direcao):
+    """Token opaco (assinado) apontando para uma movimentação da listagem"""
+    return signing.dumps(
+        [movimentacao.data_movimentacao.isoformat(), movimentacao.pk, direcao],
+        salt=SALT_CURSOR,
+        compress=True,
+    )
+
+
+def ler_cursor(token):
+    """Retorna (data_movimentacao, id, direcao) ou None se o token for inválido"""
+    try:
+        data, pk, direcao = signing.loads(token, salt=SALT_CURSOR)
+        return datetime.fromisoformat(data), int(pk), direcao
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+def _chave_cache(prefixo, chave):
+    return f'estoque:{prefixo}:' + hashlib.md5(chave.encode()).hexdigest()
+
+
+def total_estimado(queryset, chave):
+    """Contagem guardada em cache por alguns minutos em vez de um COUNT(*) a cada página"""
+    return cache.get_or_set(_chave_cache('total', chave), queryset.order_by().count, TEMPO_CACHE_TOTAL)
+
+
+def estatisticas_estimadas(chave, calcular):
+    """
+    Estatísticas da listagem guardadas pelo mesmo tempo de total_estimado, para a
+    página por cursor não agregar o conjunto filtrado inteiro a cada página.
+    """
+    return cache.get_or_set(_chave_cache('estatisticas', chave), calcular, TEMPO_CACHE_TOTAL)
+
+
+class PaginaCursor:
+    """Página da paginação por cursor, ordenada por (data_movimentacao, id) decrescente"""
+
+    def __init__(self, object_list, cursor_proximo, cursor_anterior, total):
+        self.object_list = object_list
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+        self.total_estimado = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_proximo is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginar_por_cursor(queryset, token=None, por_pagina=25, chave_total=''):
+    """
+    Paginação keyset: cada página é um range no índice de data_movimentacao
+    a partir do último registro visto, então o custo não cresce com a profundidade.
+    """
+    cursor = ler_cursor(token) if token else None
+    total = total_estimado(queryset, chave_total)
+
+    if cursor and cursor[2] == 'anterior':
+        data, pk, _ = cursor
+        # data >= X delimita o range no índice; o OR só desempata registros do mesmo instante
+        linhas = list(
+            queryset.filter(data_movimentacao__gte=data)
+            .filter(Q(data_movimentacao__gt=data) | Q(pk__gt=pk))
+            .order_by('data_movimentacao', 'pk')[:por_pagina + 1]
+        )
+        tem_anterior = len(linhas) > por_pagina
+        linhas = linhas[:por_pagina][::-1]
+        tem_proximo = True
+    else:
+        if cursor:
+            data, pk, _ = cursor
+            queryset = (
+                queryset.filter(data_movimentacao__lte=data)
+                .filter(Q(data_movimentacao__lt=data) | Q(pk__lt=pk))
+            )
+        linhas = list(queryset.order_by('-data_movimentacao', '-pk')[:por_pagina + 1])
+        tem_proximo = len(linhas) > por_pagina
+        linhas = linhas[:por_pagina]
+        tem_anterior = cursor is not None
+
+    return PaginaCursor(
+        linhas,
+        cursor_proximo=gerar_cursor(linhas[-1], 'proximo') if linhas and tem_proximo else None,
+        cursor_anterior=gerar_cursor(linhas[0], 'anterior') if linhas and tem_anterior else None,
+        total=total,
+    )
@@ -0,0 +1,127 @@
+from django.utils import timezone
+
+from produto.models import Produto
+from relatorios.cache_pdf import renderizar_com_cache
+from relatorios.pdf import renderizar_relatorio_em_blocos
+from .filtros import converter_data, filtrar_movimentacoes
+from .models import MovimentacaoEstoque
+from .resumos import resumo_movimentacoes
+from .saldos import saldos_periodo
+
+# Geradores de PDF usados pelo worker da fila de relatórios.
+# Recebem os parâmetros da requisição original e devolvem (nome_arquivo, bytes).
+
+TEMPLATE_MOVIMENTACAO = 'estoque/movimentacao_pdf.html'
+TEMPLATE_RELATORIO = 'estoque/relatorio_movimentacoes_pdf.html'
+TEMPLATE_RELATORIO_CONTINUACAO = 'estoque/relatorio_movimentacoes_pdf_continuacao.html'
+
+
+def buscar_movimentacao(movimentacao_id):
+    return MovimentacaoEstoque.objects.select_related('produto__categoria', 'usuario').get(pk=movimentacao_id)
+
+
+def contexto_movimentacao(movimentacao, gerado_em=None):
+    return {
+        'movimentacao': movimentacao,
+        'gerado_em': gerado_em,
+    }
+
+
+def pdf_movimentacao(parametros, usuario):
+    """PDF de uma movimentação específica"""
+    movimentacao = buscar_movimentacao(parametros['movimentacao_id'])
+    gerado_em = timezone.now()
+
+    conteudo = renderizar_com_cache(
+        TEMPLATE_MOVIMENTACAO, contexto_movimentacao(movimentacao, gerado_em), parametros.get('base_url')
+    )
+
+    filename = f"movimentacao_{movimentacao.id}_{timezone.localtime(gerado_em).strftime('%Y%m%d_%H%M')}.pdf"
+    return filename, conteudo
+
+
+def pdf_relatorio_movimentacoes(parametros, usuario):
+    """PDF com múltiplas movimentações filtradas pela data de ocorrência"""
+    data_inicio = parametros.get('data_inicio')
+    data_fim = parametros.get('data_fim')
+    tipo = parametros.get('tipo')
+    produto_id = parametros.get('produto')
+
+    movimentacoes = filtrar_movimentacoes(
+        MovimentacaoEstoque.objects.select_related('produto', 'usuario'),
+        produto_id=produto_id,
+        tipo=tipo,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        campo_data='data_ocorrencia',
+    ).order_by('-data_ocorrencia')
+    resumo = resumo_movimentacoes(movimentacoes)
+    gerado_em = timezone.now()
+
+    context = {
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        'tipo': tipo,
+        'gerado_em': gerado_em,
+        'total_entradas': resumo['entradas'],
+        'total_saidas': resumo['saidas'],
+        'usuario': usuario,
+    }
+    filename = f"relatorio_movimentacoes_{timezone.localtime(gerado_em).strftime('%Y%m%d_%H%M')}.pdf"
+    return filename, renderizar_relatorio_em_blocos(
+        TEMPLATE_RELATORIO, TEMPLATE_RELATORIO_CONTINUACAO, context, movimentacoes, movimentacoes.count()
+    )
+
+
+def pdf_movimentacoes(parametros, usuario):
+    """PDF da listagem de movimentações com filtros, estatísticas e saldos"""
+    produto_id = parametros.get('produto')
+    tipo = parametros.get('tipo')
+    data_inicio = converter_data(parametros.get('data_inicio'))
+    data_fim = converter_data(parametros.get('data_fim'))
+
+    produto = Produto.objects.filter(pk=produto_id).first() if str(produto_id or '').isdigit() else None
+
+    movimentacoes = filtrar_movimentacoes(
+        MovimentacaoEstoque.objects.select_related('produto', 'usuario'),
+        produto_id=produto.pk if produto else None,
+        tipo=tipo,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+    ).order_by('-data_movimentacao')
+
+    # Estatísticas de entrada e saída em uma única consulta
+    resumo = resumo_movimentacoes(movimentacoes)
+    gerado_em = timezone.now()
+
+    context = {
+        # Saldos de abertura e fechamento do período (não dependem do filtro de tipo)
+        'saldos': saldos_periodo(data_inicio, data_fim, [produto.pk] if produto else None),
+        'filtros': {
+            'produto': produto.nome if produto else 'Todos',
+            'tipo': dict(MovimentacaoEstoque.TIPO_CHOICES).get(tipo, 'Todos'),
+            'data_inicio': data_inicio.strftime('%d/%m/%Y') if data_inicio else 'Início',
+            'data_fim': data_fim.strftime('%d/%m/%Y') if data_fim else 'Hoje',
+        },
+        'stats': {
+            'entradas': {
+                'total': resumo['entradas'],
+                'quantidade': resumo['quantidade_entradas'],
+                'valor': resumo['valor_entradas'],
+            },
+            'saidas': {
+                'total': resumo['saidas'],
+                'quantidade': resumo['quantidade_saidas'],
+                'valor': resumo['valor_saidas'],
+            },
+        },
+        'gerado_em': gerado_em,
+        'usuario': usuario,
+    }
+    filename = f"movimentacoes_{timezone.localtime(gerado_em).strftime('%Y%m%d_%H%M')}.pdf"
+    # Linhas renderizadas em blocos para limitar a memória em períodos longos. A contagem
+    # é do próprio queryset: o resumo não conta os saldos de abertura, que são listados
+    return filename, renderizar_relatorio_em_blocos(
+        TEMPLATE_RELATORIO, TEMPLATE_RELATORIO_CONTINUACAO, context, movimentacoes, movimentacoes.count(),
+        base_url=parametros.get('base_url'), presentational_hints=True,
+    )
@@ -0,0 +1,115 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from produto.models import Produto
+from .arquivo import somar_saidas_arquivadas
+from .filtros import inicio_do_dia
+from .models import MovimentacaoEstoque, PrevisaoEstoque
+
+JANELA_MEDIA_DIAS = 30  # média móvel do consumo diário
+DIAS_HISTORICO = 3 * 365  # série carregada (a variabilidade usa a série inteira)
+FATOR_SEGURANCA = 1.65  # ~95% de nível de serviço para o estoque de segurança
+HORIZONTE_MAXIMO_DIAS = 3650  # cobertura acima disso é tratada como sem previsão de ruptura
+
+
+def carregar_saidas_diarias(produto_ids, data_inicio, dias):
+    """
+    Matriz (produtos x dias) com a quantidade que saiu por dia, vinda de um
+    GROUP BY produto/dia no banco, mais as saídas já arquivadas.
+    Dias sem saída ficam com zero. `produto_ids` deve vir em ordem crescente.
+    """
+    indice_produto = {pk: i for i, pk in enumerate(produto_ids)}
+    saidas = np.zeros((len(produto_ids), dias), dtype=np.float64)
+    if not produto_ids:
+        return saidas
+
+    linhas = (
+        MovimentacaoEstoque.objects.filter(tipo='S', data_movimentacao__gte=inicio_do_dia(data_inicio))
+        .exclude(motivo=MovimentacaoEstoque.SALDO_ABERTURA)
+        .annotate(dia=TruncDate('data_movimentacao'))
+        .values('produto_id', 'dia')
+        .annotate(total=Sum('quantidade'))
+        .values_list('produto_id', 'dia', 'total')
+        .order_by()
+    )
+    linha_idx, coluna_idx, quantidades = [], [], []
+    for produto_id, dia, total in linhas.iterator(chunk_size=10000):
+        i = indice_produto.get(produto_id)
+        j = (dia - data_inicio).days
+        if i is None or not 0 <= j < dias:
+            continue
+        linha_idx.append(i)
+        coluna_idx.append(j)
+        quantidades.append(total)
+
+    saidas[np.array(linha_idx, dtype=np.intp), np.array(coluna_idx, dtype=np.intp)] = quantidades
+    return somar_saidas_arquivadas(saidas, produto_ids, data_inicio)
+
+
+def calcular_previsoes(saidas, estoque_atual, estoque_minimo, janela=JANELA_MEDIA_DIAS,
+                       ciclo_dias=None, prazo_entrega_dias=None):
+    """
+    Cálculo vetorizado para todos os produtos de uma vez:
+    consumo médio (média móvel dos últimos `janela` dias), dias de cobertura,
+    estoque de segurança e quantidade sugerida para cobrir o próximo ciclo de compra.
+    """
+    ciclo_dias = settings.ESTOQUE_CICLO_COMPRA_DIAS if ciclo_dias is None else ciclo_dias
+    prazo_entrega_dias = settings.ESTOQUE_PRAZO_ENTREGA_DIAS if prazo_entrega_dias is None else prazo_entrega_dias
+    janela = max(1, min(janela, saidas.shape[1]))
+
+    # Último ponto da média móvel: consumo médio dos `janela` dias mais recentes
+    consumo = saidas[:, -janela:].sum(axis=1) / janela
+
+    variabilidade = saidas.std(axis=1)
+    horizonte = ciclo_dias + prazo_entrega_dias
+    seguranca = FATOR_SEGURANCA * variabilidade * math.sqrt(horizonte)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cobertura = np.where(consumo > 0, np.maximum(estoque_atual, 0) / consumo, np.inf)
+
+    alvo = np.maximum(consumo * horizonte + seguranca, estoque_minimo)
+    sugerida = np.ceil(np.maximum(alvo - estoque_atual, 0)).astype(np.int64)
+    return consumo, cobertura, sugerida
+
+
+def gerar_previsoes(janela=JANELA_MEDIA_DIAS, dias_historico=DIAS_HISTORICO):
+    """Job em lote: recalcula a previsão de ruptura e a sugestão de compra de todos os produtos"""
+    hoje = timezone.localdate()
+    data_inicio = hoje - timedelta(days=dias_historico - 1)
+
+    produtos = list(
+        Produto.objects.filter(ativo=True).order_by('pk').values_list('pk', 'estoque_atual', 'estoque_minimo')
+    )
+    produto_ids = [pk for pk, _, _ in produtos]
+    estoque_atual = np.array([estoque for _, estoque, _ in produtos], dtype=np.float64)
+    estoque_minimo = np.array([minimo for _, _, minimo in produtos], dtype=np.float64)
+
+    saidas = carregar_saidas_diarias(produto_ids, data_inicio, dias_historico)
+    consumo, cobertura, sugerida = calcular_previsoes(saidas, estoque_atual, estoque_minimo, janela)
+
+    agora = timezone.now()
+    previsoes = []
+    for i, produto_id in enumerate(produto_ids):
+        dias = float(cobertura[i])
+        previsivel = dias <= HORIZONTE_MAXIMO_DIAS  # inf (sem consumo) também cai aqui
+        previsoes.append(PrevisaoEstoque(
+            produto_id=produto_id,
+            estoque_atual=int(estoque_atual[i]),
+            consumo_medio_diario=round(float(consumo[i]), 3),
+            dias_cobertura=round(dias, 1) if previsivel else None,
+            data_ruptura=hoje + timedelta(days=int(dias)) if previsivel else None,
+            quantidade_sugerida=int(sugerida[i]),
+            calculado_em=agora,
+        ))
+
+    with transaction.atomic():
+        PrevisaoEstoque.objects.all().delete()
+        PrevisaoEstoque.objects.bulk_create(previsoes, batch_size=1000)
+    return len(previsoes)
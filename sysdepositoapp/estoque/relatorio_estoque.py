@@ -0,0 +1,211 @@
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from produto.models import Produto
+from .arquivo import agrupar_arquivo
+from .dashboard import CHAVE_GERACAO_RELATORIOS, CHAVE_GERACAO_RETROATIVA, geracao
+from .filtros import filtrar_movimentacoes
+from .models import MovimentacaoEstoque
+from .resumos import ENTRADA, SAIDA, resumo_movimentacoes
+from .saldos import saldos_periodo
+
+# Relatórios prontos ficam em cache pela combinação de parâmetros. A chave inclui uma
+# geração que avança a cada escrita no estoque; períodos já encerrados usam a geração
+# retroativa, que só avança com lançamentos em dias passados (estornos, arquivamento).
+TEMPO_CACHE_RELATORIO = 600  # segundos
+TEMPO_CACHE_PERIODO_FECHADO = 3600  # cobre mudanças de preço e categoria, que não avançam a geração
+LINHAS_POR_PAGINA = 50
+
+SEM_CATEGORIA = 'Sem categoria'
+STATUS_POR_TIPO = {'baixo_estoque': 'baixo', 'esgotado': 'esgotado'}
+MOTIVOS = dict(MovimentacaoEstoque.MOTIVO_CHOICES)
+STATUS = dict(Produto.STATUS_ESTOQUE_CHOICES)
+
+
+def parametros_relatorio(dados):
+    """Parâmetros do relatório a partir do cleaned_data do RelatorioEstoqueForm"""
+    return {
+        'tipo': dados['tipo_relatorio'],
+        'data_inicio': dados.get('data_inicio'),
+        'data_fim': dados.get('data_fim'),
+        'categoria_id': dados['categoria'].pk if dados.get('categoria') else None,
+        'classe_abc': dados.get('classe_abc') or None,
+        'classe_xyz': dados.get('classe_xyz') or None,
+    }
+
+
+def _filtra_produtos(parametros):
+    return bool(parametros['categoria_id'] or parametros['classe_abc'] or parametros['classe_xyz'])
+
+
+def _produtos(parametros):
+    # Categoria e classes ABC/XYZ valem para todos os tipos de relatório
+    produtos = Produto.objects.all()
+    if parametros['categoria_id']:
+        produtos = produtos.filter(categoria_id=parametros['categoria_id'])
+    if parametros['classe_abc']:
+        produtos = produtos.filter(classificacao__classe_abc=parametros['classe_abc'])
+    if parametros['classe_xyz']:
+        produtos = produtos.filter(classificacao__classe_xyz=parametros['classe_xyz'])
+    if parametros['tipo'] in STATUS_POR_TIPO:
+        produtos = produtos.filter(status_estoque=STATUS_POR_TIPO[parametros['tipo']])
+    return produtos
+
+
+def _movimentacoes(parametros):
+    movimentacoes = filtrar_movimentacoes(
+        MovimentacaoEstoque.objects.all(),
+        data_inicio=parametros['data_inicio'],
+        data_fim=parametros['data_fim'],
+    )
+    if _filtra_produtos(parametros):
+        movimentacoes = movimentacoes.filter(produto__in=_produtos(parametros))
+    return movimentacoes
+
+
+def linhas_detalhe(parametros):
+    """Queryset das linhas de detalhe, paginado pela view (só a página pedida é lida)"""
+    if parametros['tipo'] == 'movimentacoes':
+        return _movimentacoes(parametros).select_related('produto', 'usuario').order_by('-data_movimentacao', '-id')
+    return _produtos(parametros).select_related('categoria').order_by('nome', 'pk')
+
+
+# Cálculo
+
+def _relatorio_produtos(parametros):
+    produtos = _produtos(parametros)
+    valor = DecimalField(max_digits=16, decimal_places=2)
+    agregados = {
+        'produtos': Count('id'),
+        'unidades': Coalesce(Sum('estoque_atual'), 0),
+        'valor_custo': Coalesce(Sum(F('estoque_atual') * F('preco_custo'), output_field=valor), Decimal('0.00')),
+        'valor_venda': Coalesce(Sum(F('estoque_atual') * F('preco_venda'), output_field=valor), Decimal('0.00')),
+    }
+    por_status = list(produtos.values(grupo=F('status_estoque')).annotate(**agregados).order_by('grupo'))
+    for linha in por_status:
+        linha['status'] = STATUS.get(linha['grupo'], linha['grupo'])
+    return {
+        'totais': produtos.aggregate(**agregados),
+        'por_categoria': list(
+            produtos.values(grupo=Coalesce('categoria__nome', Value(SEM_CATEGORIA)))
+            .annotate(**agregados).order_by('grupo')
+        ),
+        'por_status': por_status,
+    }
+
+
+def _somar_arquivo(grupos, arquivados):
+    # Junta os totais arquivados ({chave: [e, s, qtd_e, qtd_s]}) às linhas agrupadas no banco
+    por_chave = {linha['grupo']: linha for linha in grupos}
+    for chave, (entradas, saidas, quantidade_entradas, quantidade_saidas) in arquivados.items():
+        linha = por_chave.setdefault(chave, {
+            'grupo': chave, 'entradas': 0, 'saidas': 0, 'quantidade_entradas': 0, 'quantidade_saidas': 0,
+        })
+        linha['entradas'] += entradas
+        linha['saidas'] += saidas
+        linha['quantidade_entradas'] += quantidade_entradas
+        linha['quantidade_saidas'] += quantidade_saidas
+    return sorted(por_chave.values(), key=lambda linha: linha['grupo'])
+
+
+def _relatorio_movimentacoes(parametros):
+    movimentacoes = _movimentacoes(parametros)
+    filtra_produtos = _filtra_produtos(parametros)
+    produtos = _produtos(parametros)
+    filtros_arquivo = {
+        'data_inicio': parametros['data_inicio'],
+        'data_fim': parametros['data_fim'],
+        'produto_ids': list(produtos.values_list('pk', flat=True)) if filtra_produtos else None,
+    }
+
+    lancamentos = movimentacoes.exclude(motivo=MovimentacaoEstoque.SALDO_ABERTURA)
+    agregados = {
+        'entradas': Count('id', filter=ENTRADA),
+        'saidas': Count('id', filter=SAIDA),
+        'quantidade_entradas': Coalesce(Sum('quantidade', filter=ENTRADA), 0),
+        'quantidade_saidas': Coalesce(Sum('quantidade', filter=SAIDA), 0),
+    }
+    por_motivo = _somar_arquivo(
+        lancamentos.values(grupo=F('motivo')).annotate(**agregados).order_by(),
+        agrupar_arquivo('motivo', **filtros_arquivo),
+    )
+    for linha in por_motivo:
+        linha['motivo'] = MOTIVOS.get(linha['grupo'], linha['grupo'])
+    por_dia = _somar_arquivo(
+        lancamentos.annotate(dia=TruncDate('data_movimentacao')).values(grupo=F('dia')).annotate(**agregados).order_by(),
+        agrupar_arquivo('dia', **filtros_arquivo),
+    )
+
+    # O arquivo agrupa por produto; a categoria vem do cadastro atual
+    arquivados = agrupar_arquivo('produto', **filtros_arquivo)
+    categorias = dict(
+        Produto.objects.filter(pk__in=list(arquivados))
+        .values_list('pk', Coalesce('categoria__nome', Value(SEM_CATEGORIA)))
+    )
+    por_categoria_arquivo = {}
+    for produto_id, totais in arquivados.items():
+        acumulado = por_categoria_arquivo.setdefault(categorias.get(produto_id, SEM_CATEGORIA), [0, 0, 0, 0])
+        for i, total in enumerate(totais):
+            acumulado[i] += total
+    por_categoria = _somar_arquivo(
+        lancamentos.values(grupo=Coalesce('produto__categoria__nome', Value(SEM_CATEGORIA)))
+        .annotate(**agregados).order_by(),
+        por_categoria_arquivo,
+    )
+
+    saldos = saldos_periodo(parametros['data_inicio'], parametros['data_fim'], produtos if filtra_produtos else None)
+    return {
+        'totais': resumo_movimentacoes(movimentacoes, filtros_arquivo),
+        'por_motivo': por_motivo,
+        'por_dia': por_dia,
+        'por_categoria': por_categoria,
+        'saldos': {'inicial': saldos['inicial'], 'final': saldos['final']},
+        'total_linhas': movimentacoes.count(),
+    }
+
+
+def calcular_relatorio(parametros):
+    if parametros['tipo'] == 'movimentacoes':
+        relatorio = _relatorio_movimentacoes(parametros)
+    else:
+        relatorio = _relatorio_produtos(parametros)
+        relatorio['total_linhas'] = relatorio['totais']['produtos']
+    relatorio['gerado_em'] = timezone.now()
+    return relatorio
+
+
+# Cache
+
+def periodo_fechado(parametros):
+    """Relatório de movimentações que termina antes de hoje: só muda com lançamentos retroativos"""
+    return (
+        parametros['tipo'] == 'movimentacoes'
+        and parametros['data_fim'] is not None
+        and parametros['data_fim'] < timezone.localdate()
+    )
+
+
+def chave_relatorio(parametros):
+    fechado = periodo_fechado(parametros)
+    versao = geracao(CHAVE_GERACAO_RETROATIVA if fechado else CHAVE_GERACAO_RELATORIOS)
+    assinatura = repr((sorted(parametros.items()), fechado, versao))
+    return 'estoque:relatorio:' + hashlib.md5(assinatura.encode()).hexdigest()
+
+
+def obter_relatorio(parametros):
+    """Totais e agrupamentos do relatório, do cache quando já calculados com os mesmos parâmetros"""
+    tempo = TEMPO_CACHE_PERIODO_FECHADO if periodo_fechado(parametros) else TEMPO_CACHE_RELATORIO
+    return cache.get_or_set(chave_relatorio(parametros), lambda: calcular_relatorio(parametros), tempo)
+
+
+def paginar_linhas(parametros, relatorio, pagina):
+    paginator = Paginator(linhas_detalhe(parametros), LINHAS_POR_PAGINA)
+    # A contagem já foi feita (e guardada) junto com o relatório
+    paginator.count = relatorio['total_linhas']
+    return paginator.get_page(pagina)
@@ -0,0 +1,42 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.utils import timezone
+
+from .arquivo import resumo_arquivo
+from .models import MovimentacaoEstoque
+
+ENTRADA = Q(tipo='E')
+SAIDA = Q(tipo='S')
+
+
+def resumo_movimentacoes(movimentacoes, filtros_arquivo=None):
+    """
+    Calcula contagens, quantidades, valores e movimentações dos últimos 7 dias
+    em uma única consulta com agregação condicional sobre o queryset filtrado.
+    Com filtros_arquivo (os mesmos de filtrar_movimentacoes), soma também as
+    movimentações arquivadas. Saldos de abertura não entram nos totais.
+    """
+    valor = DecimalField(max_digits=14, decimal_places=2)
+    resumo = movimentacoes.exclude(motivo=MovimentacaoEstoque.SALDO_ABERTURA).aggregate(
+        total=Count('id'),
+        entradas=Count('id', filter=ENTRADA),
+        saidas=Count('id', filter=SAIDA),
+        quantidade_entradas=Sum('quantidade', filter=ENTRADA),
+        quantidade_saidas=Sum('quantidade', filter=SAIDA),
+        valor_entradas=Sum(F('quantidade') * F('produto__preco_custo'), filter=ENTRADA, output_field=valor),
+        valor_saidas=Sum(F('quantidade') * F('produto__preco_venda'), filter=SAIDA, output_field=valor),
+        ultima_semana=Count('id', filter=Q(data_movimentacao__gte=timezone.now() - timedelta(days=7))),
+    )
+
+    if filtros_arquivo is not None:
+        for chave, total in resumo_arquivo(**filtros_arquivo).items():
+            resumo[chave] = (resumo[chave] or 0) + total
+
+    for chave in ('quantidade_entradas', 'quantidade_saidas'):
+        resumo[chave] = resumo[chave] or 0
+    for chave in ('valor_entradas', 'valor_saidas'):
+        resumo[chave] = resumo[chave] or Decimal('0.00')
+    resumo['saldo_quantidade'] = resumo['quantidade_entradas'] - resumo['quantidade_saidas']
+    return resumo
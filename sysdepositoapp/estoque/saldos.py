@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from produto.models import Produto
+from .dashboard import invalidar_periodos_fechados
+from .models import SaldoDiarioEstoque
+
+
+def agrupar_por_dia(lancamentos):
+    """
+    Agrupa lançamentos (produto_id, data_movimentacao, tipo, quantidade, sinal)
+    em {(produto_id, dia): [entradas, saidas]}. Sinal -1 representa um estorno.
+    """
+    grupos = defaultdict(lambda: [0, 0])
+    for produto_id, data_movimentacao, tipo, quantidade, sinal in lancamentos:
+        dia = timezone.localdate(data_movimentacao) if data_movimentacao else timezone.localdate()
+        if tipo == 'E':
+            grupos[(produto_id, dia)][0] += sinal * quantidade
+        elif tipo == 'S':
+            grupos[(produto_id, dia)][1] += sinal * quantidade
+    return grupos
+
+
+def registrar_saldos(lancamentos):
+    """
+    Atualiza a tabela de saldos diários a partir de lançamentos já aplicados
+    ao estoque. Deve rodar na mesma transação, depois do UPDATE em Produto.
+    """
+    hoje = timezone.localdate()
+    do_dia = defaultdict(dict)
+    for (produto_id, dia), (entradas, saidas) in agrupar_por_dia(lancamentos).items():
+        if not entradas and not saidas:
+            continue
+        if dia >= hoje:
+            do_dia[dia][produto_id] = (entradas, saidas)
+        else:
+            _registrar_retroativo(produto_id, dia, entradas, saidas)
+            transaction.on_commit(invalidar_periodos_fechados)
+
+    for dia, grupo in do_dia.items():
+        _registrar_no_dia(dia, grupo)
+
+
+def _registrar_no_dia(dia, grupo):
+    # Caso comum (movimentações de hoje): o saldo do dia é o próprio estoque atual
+    estoques = dict(Produto.objects.filter(pk__in=grupo).order_by().values_list('pk', 'estoque_atual'))
+    existentes = {
+        saldo.produto_id: saldo
+        for saldo in SaldoDiarioEstoque.objects.select_for_update().filter(data=dia, produto_id__in=grupo)
+    }
+
+    novos, alterados = [], []
+    for produto_id, (entradas, saidas) in grupo.items():
+        saldo = existentes.get(produto_id)
+        if saldo:
+            saldo.entradas += entradas
+            saldo.saidas += saidas
+            saldo.saldo = estoques[produto_id]
+            alterados.append(saldo)
+        else:
+            novos.append(SaldoDiarioEstoque(
+                produto_id=produto_id,
+                data=dia,
+                entradas=entradas,
+                saidas=saidas,
+                saldo=estoques[produto_id],
+            ))
+
+    SaldoDiarioEstoque.objects.bulk_create(novos)
+    SaldoDiarioEstoque.objects.bulk_update(alterados, ['entradas', 'saidas', 'saldo'])
+
+
+def _registrar_retroativo(produto_id, dia, entradas, saidas):
+    # Alteração em um dia passado desloca o saldo de todos os dias seguintes
+    delta = entradas - saidas
+    posteriores = SaldoDiarioEstoque.objects.filter(produto_id=produto_id, data__gt=dia)
+    if delta:
+        posteriores.update(saldo=F('saldo') + delta)
+
+    atualizados = SaldoDiarioEstoque.objects.filter(produto_id=produto_id, data=dia).update(
+        entradas=F('entradas') + entradas,
+        saidas=F('saidas') + saidas,
+        saldo=F('saldo') + delta,
+    )
+    if atualizados:
+        return
+
+    proximo = posteriores.order_by('data').first()
+    if proximo:
+        saldo = proximo.saldo_inicial
+    else:
+        saldo = Produto.objects.filter(pk=produto_id).values_list('estoque_atual', flat=True).get()
+    SaldoDiarioEstoque.objects.create(
+        produto_id=produto_id, data=dia, entradas=entradas, saidas=saidas, saldo=saldo
+    )
+
+
+def saldos_em(data, produtos=None):
+    """
+    Retorna {produto_id: saldo} no fechamento do dia informado.
+    Usa no máximo duas buscas indexadas por produto, sem reprocessar o histórico.
+    """
+    if produtos is None:
+        produtos = Produto.objects.all()
+    elif not hasattr(produtos, 'values_list'):
+        produtos = Produto.objects.filter(pk__in=produtos)
+    produtos = produtos.order_by()
+
+    if data >= timezone.localdate():
+        return dict(produtos.values_list('pk', 'estoque_atual'))
+
+    ate_a_data = SaldoDiarioEstoque.objects.filter(
+        produto=OuterRef('pk'), data__lte=data
+    ).order_by('-data').values('saldo')[:1]
+    # Sem registro até a data: o saldo é a abertura do primeiro dia seguinte
+    depois_da_data = SaldoDiarioEstoque.objects.filter(
+        produto=OuterRef('pk'), data__gt=data
+    ).order_by('data').annotate(
+        abertura=F('saldo') - F('entradas') + F('saidas')
+    ).values('abertura')[:1]
+
+    return dict(
+        produtos.annotate(
+            saldo_na_data=Coalesce(Subquery(ate_a_data), Subquery(depois_da_data), F('estoque_atual'))
+        ).values_list('pk', 'saldo_na_data')
+    )
+
+
+def saldos_periodo(data_inicio=None, data_fim=None, produtos=None):
+    """Retorna saldos inicial e final (somados) dos produtos em um período"""
+    inicio = (data_inicio - timedelta(days=1)) if data_inicio else date.min
+    fim = data_fim or timezone.localdate()
+
+    iniciais = saldos_em(inicio, produtos)
+    finais = saldos_em(fim, produtos)
+    return {
+        'inicial': sum(iniciais.values()),
+        'final': sum(finais.values()),
+        'por_produto': {pk: (iniciais.get(pk, 0), saldo) for pk, saldo in finais.items()},
+    }
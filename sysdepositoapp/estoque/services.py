@@ -0,0 +1,186 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from produto.contadores import ajustar_contadores, expressao_status_estoque, transicoes_de_status
+from produto.models import ConflitoEstoque, Produto
+from .dashboard import invalidar_dashboard_apos_commit
+from .models import MovimentacaoEstoque
+from .saldos import registrar_saldos
+
+# Novas leituras + compare-and-swap antes de desistir por conflito
+TENTATIVAS_CAS = 5
+# Produtos por UPDATE em aplicar_deltas (cada um entra no CASE e no filtro de versão)
+LOTE_UPDATE = 300
+
+
+def delta_movimentacao(tipo, quantidade):
+    """Retorna o efeito de uma movimentação sobre o estoque (+ entrada, - saída)"""
+    if tipo == 'E':
+        return quantidade
+    if tipo == 'S':
+        return -quantidade
+    return 0
+
+
+def aplicar_deltas(deltas, tentativas=TENTATIVAS_CAS):
+    """
+    Aplica deltas de estoque direto no banco com UPDATE atômico
+    (estoque_atual = estoque_atual + CASE pk WHEN ... THEN delta END), sem ler
+    e regravar o produto: um UPDATE por lote de produtos, qualquer que seja a
+    mistura de deltas, que também grava o novo status do estoque; os contadores
+    por status acompanham.
+
+    Sem travar os produtos: o UPDATE só vale para a versão lida. Se algum
+    produto mudou no meio, o savepoint é desfeito e tudo é relido e reaplicado.
+    """
+    deltas = {produto_id: delta for produto_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    for tentativa in range(tentativas):
+        try:
+            with transaction.atomic():
+                _aplicar_deltas_versionados(deltas)
+            return
+        except ConflitoEstoque:
+            if tentativa == tentativas - 1:
+                raise
+
+
+def _aplicar_deltas_versionados(deltas):
+    atuais = list(Produto.objects.filter(pk__in=deltas).order_by('pk').values_list(
+        'pk', 'categoria_id', 'estoque_atual', 'estoque_minimo', 'status_estoque', 'versao'
+    ))
+    versoes = {pk: versao for pk, *_, versao in atuais}
+    transicoes = transicoes_de_status(
+        (categoria_id, status, Produto.calcular_status_estoque(estoque + deltas[pk], minimo))
+        for pk, categoria_id, estoque, minimo, status, _versao in atuais
+    )
+
+    produto_ids = list(versoes)
+    agora = timezone.now()
+    for inicio in range(0, len(produto_ids), LOTE_UPDATE):
+        lote = produto_ids[inicio:inicio + LOTE_UPDATE]
+        # Cada produto só é atualizado se ainda estiver na versão lida
+        mesma_versao = Q()
+        for produto_id in lote:
+            mesma_versao |= Q(pk=produto_id, versao=versoes[produto_id])
+
+        novo_estoque = F('estoque_atual') + Case(
+            *(When(pk=produto_id, then=Value(deltas[produto_id])) for produto_id in lote),
+            output_field=IntegerField(),
+        )
+        atualizados = Produto.objects.filter(mesma_versao).update(
+            estoque_atual=novo_estoque,
+            status_estoque=expressao_status_estoque(novo_estoque),
+            versao=F('versao') + 1,
+            data_atualizacao=agora,
+        )
+        if atualizados != len(lote):
+            raise ConflitoEstoque('Estoque alterado por outra operação durante a gravação')
+
+    ajustar_contadores(transicoes)
+
+
+def postar_lancamentos(lancamentos):
+    """
+    Aplica lançamentos (produto_id, data_movimentacao, tipo, quantidade, sinal)
+    no estoque e na tabela de saldos diários. Sinal -1 estorna o lançamento.
+    """
+    lancamentos = list(lancamentos)
+    deltas = defaultdict(int)
+    for produto_id, _data, tipo, quantidade, sinal in lancamentos:
+        deltas[produto_id] += sinal * delta_movimentacao(tipo, quantidade)
+
+    aplicar_deltas(deltas)
+    registrar_saldos(lancamentos)
+    # bulk_create e UPDATE com F() não disparam signals
+    invalidar_dashboard_apos_commit()
+
+
+def lancar_movimentacoes(movimentacoes, batch_size=None):
+    """
+    Grava várias movimentações de uma vez: um bulk_create para as linhas
+    e um UPDATE agrupado por produto para o estoque.
+    """
+    movimentacoes = list(movimentacoes)
+    if not movimentacoes:
+        return []
+
+    with transaction.atomic():
+        criadas = MovimentacaoEstoque.objects.bulk_create(movimentacoes, batch_size=batch_size)
+        postar_lancamentos(
+            (mov.produto_id, mov.data_movimentacao, mov.tipo, mov.quantidade, 1)
+            for mov in movimentacoes
+        )
+    return criadas
+
+
+def estornar_movimentacoes(queryset):
+    """Exclui movimentações em lote revertendo o efeito delas no estoque"""
+    with transaction.atomic():
+        linhas = list(queryset.select_for_update().values_list(
+            'produto_id', 'data_movimentacao', 'tipo', 'quantidade'
+        ))
+
+        # QuerySet.delete() não chama Model.delete(), então o estorno não é duplicado
+        queryset.delete()
+        postar_lancamentos(linha + (-1,) for linha in linhas)
+    return len(linhas)
+
+
+def registrar_ajuste(ajuste, versao_esperada=None, tentativas=TENTATIVAS_CAS):
+    """
+    Grava um ajuste de inventário (ajuste ainda não salvo, com produto, estoque_novo,
+    motivo e usuário) sem travar o produto: lê estoque e versão, grava com
+    compare-and-swap e, se outra operação passou na frente, relê e tenta de novo.
+    Com versao_esperada (a versão que o usuário viu), qualquer alteração desde
+    então é reportada como ConflitoEstoque em vez de sobrescrita.
+    """
+    for _ in range(tentativas):
+        categoria_id, estoque, minimo, status, versao = Produto.objects.filter(pk=ajuste.produto_id).values_list(
+            'categoria_id', 'estoque_atual', 'estoque_minimo', 'status_estoque', 'versao'
+        ).get()
+        if versao_esperada is not None and versao != versao_esperada:
+            raise ConflitoEstoque(
+                f'O estoque mudou para {estoque} desde a contagem; confira e registre o ajuste novamente'
+            )
+
+        novo_status = Produto.calcular_status_estoque(ajuste.estoque_novo, minimo)
+        with transaction.atomic():
+            atualizados = Produto.objects.filter(pk=ajuste.produto_id, versao=versao).update(
+                estoque_atual=ajuste.estoque_novo,
+                status_estoque=novo_status,
+                versao=F('versao') + 1,
+                data_atualizacao=timezone.now(),
+            )
+            if not atualizados:
+                continue
+
+            ajustar_contadores(transicoes_de_status([(categoria_id, status, novo_status)]))
+            ajuste.estoque_anterior = estoque
+            ajuste.save()
+
+            diferenca = ajuste.estoque_novo - estoque
+            if diferenca:
+                # O estoque já foi gravado acima: a movimentação entra só no razão e nos saldos
+                movimentacao, = MovimentacaoEstoque.objects.bulk_create([MovimentacaoEstoque(
+                    produto_id=ajuste.produto_id,
+                    tipo='E' if diferenca > 0 else 'S',
+                    quantidade=abs(diferenca),
+                    motivo='ajuste',
+                    observacao=ajuste.motivo,
+                    usuario=ajuste.usuario,
+                )])
+                registrar_saldos([(
+                    movimentacao.produto_id, movimentacao.data_movimentacao, movimentacao.tipo,
+                    movimentacao.quantidade, 1,
+                )])
+            invalidar_dashboard_apos_commit()
+        return ajuste
+
+    raise ConflitoEstoque('O estoque do produto está sendo alterado por outras operações; tente novamente')
+
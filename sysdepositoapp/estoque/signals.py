@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from produto.models import Produto
+from .dashboard import invalidar_dashboard_apos_commit
+from .models import MovimentacaoEstoque
+
+
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=MovimentacaoEstoque)
+def invalidar_cache_dashboard(sender, **kwargs):
+    # Atualizações em massa (bulk_create / update com F()) não disparam signals;
+    # estoque.services.postar_lancamentos invalida o cache nesses casos.
+    invalidar_dashboard_apos_commit()
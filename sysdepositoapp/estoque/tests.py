@@ -1,3 +1,609 @@
-from django.test import TestCase
+import io
+import tempfile
+from datetime import date, datetime
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from produto.models import Categoria, Produto
+from relatorios import pdf as relatorios_pdf
+from . import arquivo, pdf, relatorio_estoque
+from .classificacao import classificar
+from .conciliacao import OBSERVACAO_CORRECAO, conciliar, corrigir, divergencias
+from .dashboard import CHAVE_GERACAO_ARQUIVO, CHAVE_GERACAO_RETROATIVA
+from .filtros import filtrar_movimentacoes
+from .models import AjusteEstoque, MovimentacaoEstoque, SaldoDiarioEstoque
+from .paginacao import estatisticas_estimadas, total_estimado
+from .previsao import calcular_previsoes
+from .services import (
+    TENTATIVAS_CAS, ConflitoEstoque, aplicar_deltas, estornar_movimentacoes, lancar_movimentacoes, registrar_ajuste,
+)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN é específico do SQLite')
+class PlanoConsultaMovimentacoesTest(TestCase):
+    """Garante que cada combinação de filtros da listagem usa um índice da movimentação"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produto = Produto.objects.create(nome='Caderno', sku='CAD-001', estoque_atual=100)
+
+    def plano(self, **filtros):
+        movimentacoes = filtrar_movimentacoes(
+            MovimentacaoEstoque.objects.select_related('produto', 'usuario').order_by('-data_movimentacao'),
+            **filtros
+        )
+        return movimentacoes.explain()
+
+    def assertUsaIndice(self, plano, indice):
+        self.assertIn(f'INDEX {indice}', plano)
+        self.assertNotRegex(plano, r'SCAN estoque_movimentacaoestoque(?! USING)')
+
+    def test_sem_filtros_ordena_pelo_indice_de_data(self):
+        self.assertUsaIndice(self.plano(), 'mov_data_idx')
+
+    def test_periodo(self):
+        plano = self.plano(data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31))
+        self.assertUsaIndice(plano, 'mov_data_idx')
+
+    def test_produto(self):
+        self.assertUsaIndice(self.plano(produto_id=self.produto.pk), 'mov_produto_data_idx')
+
+    def test_produto_e_periodo(self):
+        plano = self.plano(produto_id=self.produto.pk, data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31))
+        self.assertUsaIndice(plano, 'mov_produto_data_idx')
+
+    def test_produto_tipo_e_periodo(self):
+        plano = self.plano(
+            produto_id=self.produto.pk, tipo='E', data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31)
+        )
+        self.assertUsaIndice(plano, 'mov_produto_data_idx')
+
+    def test_tipo(self):
+        self.assertUsaIndice(self.plano(tipo='S'), 'mov_tipo_data_idx')
+
+    def test_tipo_e_periodo(self):
+        plano = self.plano(tipo='S', data_inicio=date(2025, 1, 1), data_fim=date(2025, 1, 31))
+        self.assertUsaIndice(plano, 'mov_tipo_data_idx')
+
+    def test_periodo_por_data_de_ocorrencia(self):
+        movimentacoes = filtrar_movimentacoes(
+            MovimentacaoEstoque.objects.order_by('-data_ocorrencia'),
+            data_inicio=date(2025, 1, 1),
+            data_fim=date(2025, 1, 31),
+            campo_data='data_ocorrencia',
+        )
+        self.assertUsaIndice(movimentacoes.explain(), 'mov_ocorrencia_idx')
+
+
+class LancamentoEstoqueTest(TestCase):
+    """Movimentações atualizam estoque_atual e o saldo do dia ao criar, editar e excluir"""
+
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Caderno', sku='CAD-001', estoque_atual=10)
+
+    def assertEstoque(self, estoque, entradas, saidas):
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, estoque)
+        saldo = SaldoDiarioEstoque.objects.get(produto=self.produto, data=timezone.localdate())
+        self.assertEqual((saldo.saldo, saldo.entradas, saldo.saidas), (estoque, entradas, saidas))
+
+    def test_criar_entrada_e_saida(self):
+        MovimentacaoEstoque.objects.create(produto=self.produto, tipo='E', quantidade=5)
+        self.assertEstoque(15, 5, 0)
+        MovimentacaoEstoque.objects.create(produto=self.produto, tipo='S', quantidade=3)
+        self.assertEstoque(12, 5, 3)
+
+    def test_editar_estorna_a_versao_gravada(self):
+        movimentacao = MovimentacaoEstoque.objects.create(produto=self.produto, tipo='E', quantidade=5)
+        movimentacao.quantidade = 2
+        movimentacao.save()
+        self.assertEstoque(12, 2, 0)
+
+        movimentacao.tipo = 'S'
+        movimentacao.save()
+        self.assertEstoque(8, 0, 2)
+
+    def test_excluir_reverte(self):
+        movimentacao = MovimentacaoEstoque.objects.create(produto=self.produto, tipo='S', quantidade=4)
+        self.assertEstoque(6, 0, 4)
+        movimentacao.delete()
+        self.assertEstoque(10, 0, 0)
+
+    def test_instancia_carregada_acompanha_o_banco(self):
+        movimentacao = MovimentacaoEstoque(produto=self.produto, tipo='E', quantidade=5)
+        movimentacao.save()
+        self.assertEqual(movimentacao.produto.estoque_atual, 15)
+
+    def test_lancar_movimentacoes_em_lote(self):
+        outro = Produto.objects.create(nome='Lápis', sku='LAP-001', estoque_atual=0)
+        criadas = lancar_movimentacoes([
+            MovimentacaoEstoque(produto=self.produto, tipo='E', quantidade=7),
+            MovimentacaoEstoque(produto=self.produto, tipo='S', quantidade=2),
+            MovimentacaoEstoque(produto=outro, tipo='E', quantidade=3),
+        ])
+        self.assertEqual(len(criadas), 3)
+        self.assertEstoque(15, 7, 2)
+        outro.refresh_from_db()
+        self.assertEqual(outro.estoque_atual, 3)
+        self.assertEqual(SaldoDiarioEstoque.objects.get(produto=outro).saldo, 3)
+
+    def test_lancar_movimentacoes_vazio(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(lancar_movimentacoes([]), [])
+
+    def test_estornar_movimentacoes(self):
+        lancar_movimentacoes([
+            MovimentacaoEstoque(produto=self.produto, tipo='E', quantidade=7),
+            MovimentacaoEstoque(produto=self.produto, tipo='S', quantidade=2),
+        ])
+        mantida = MovimentacaoEstoque.objects.create(produto=self.produto, tipo='E', quantidade=1)
+
+        estornadas = estornar_movimentacoes(MovimentacaoEstoque.objects.exclude(pk=mantida.pk))
+        self.assertEqual(estornadas, 2)
+        self.assertEqual(list(MovimentacaoEstoque.objects.values_list('pk', flat=True)), [mantida.pk])
+        self.assertEstoque(11, 1, 0)
+
+
+class PaginacaoCursorTest(TestCase):
+    """No modo cursor as estatísticas (e o total) vêm do cache a partir da segunda página"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('estoquista', password='senha')
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001')
+        lancar_movimentacoes([MovimentacaoEstoque(produto=produto, tipo='E', quantidade=1) for _ in range(30)])
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.usuario)
+
+    def test_paginas_seguintes_nao_agregam(self):
+        resposta = self.client.get('/estoque/movimentacoes/', {'paginacao': 'cursor'})
+        pagina = resposta.context['movimentacoes']
+        self.assertEqual(pagina.total_estimado, 30)
+        self.assertEqual(resposta.context['estatisticas']['quantidade_entradas'], 30)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/estoque/movimentacoes/', {'paginacao': 'cursor', 'cursor': pagina.cursor_proximo})
+        self.assertEqual(len(resposta.context['movimentacoes']), 5)
+        self.assertEqual(resposta.context['movimentacoes'].total_estimado, 30)
+        self.assertFalse([c['sql'] for c in consultas.captured_queries if 'COUNT(' in c['sql']])
+
+    def test_total_conta_as_linhas_listadas(self):
+        MovimentacaoEstoque.objects.filter(pk=MovimentacaoEstoque.objects.first().pk).update(
+            motivo=MovimentacaoEstoque.SALDO_ABERTURA
+        )
+        resposta = self.client.get('/estoque/movimentacoes/', {'paginacao': 'cursor'})
+        # O saldo de abertura fica fora das estatísticas, mas é uma das linhas da listagem
+        self.assertEqual(resposta.context['estatisticas']['total'], 29)
+        self.assertEqual(resposta.context['movimentacoes'].total_estimado, 30)
+
+    def test_total_e_estatisticas_em_chaves_separadas(self):
+        self.assertEqual(total_estimado(MovimentacaoEstoque.objects.all(), 'filtros'), 30)
+        self.assertEqual(estatisticas_estimadas('filtros', lambda: {'total': 1}), {'total': 1})
+        self.assertEqual(total_estimado(MovimentacaoEstoque.objects.none(), 'filtros'), 30)
+
+
+class ArquivamentoTest(TestCase):
+    """O saldo de abertura sai das linhas arquivadas, mesmo sem saldos diários gravados"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(ESTOQUE_ARQUIVO_DIR=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.addCleanup(cache.clear)
+
+        self.produto = Produto.objects.create(nome='Caderno', sku='CAD-001')
+        movimentacoes = [
+            (datetime(2020, 3, 1, 10), 'E', 10, 'compra'),
+            (datetime(2020, 6, 1, 10), 'S', 2, MovimentacaoEstoque.ENTREGA),
+            (datetime(2020, 7, 1, 10), 'E', 2, MovimentacaoEstoque.ENTREGA),
+            (datetime(2022, 5, 1, 10), 'S', 3, 'perda'),
+        ]
+        for data, tipo, quantidade, motivo in movimentacoes:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                produto=self.produto, tipo=tipo, quantidade=quantidade, motivo=motivo
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=timezone.make_aware(data)
+            )
+        # Estoque e razão batem, mas não há saldo diário nos dias das movimentações
+        SaldoDiarioEstoque.objects.all().delete()
+
+    def arquivar(self, ano):
+        with self.captureOnCommitCallbacks(execute=True):
+            return arquivo.arquivar_ano(ano)
+
+    def test_abertura_pelas_linhas_arquivadas(self):
+        self.assertEqual(self.arquivar(2020), (3, 1))
+        abertura = MovimentacaoEstoque.objects.get(motivo=MovimentacaoEstoque.SALDO_ABERTURA)
+        self.assertEqual((abertura.tipo, abertura.quantidade), ('E', 10))
+        self.assertEqual(divergencias(Produto.objects.all()), [])
+
+        # A abertura anterior entra no saldo do ano seguinte
+        self.assertEqual(self.arquivar(2022), (1, 1))
+        abertura = MovimentacaoEstoque.objects.get(motivo=MovimentacaoEstoque.SALDO_ABERTURA)
+        self.assertEqual((abertura.tipo, abertura.quantidade), ('E', 7))
+        self.assertEqual(divergencias(Produto.objects.all()), [])
+
+    def test_motivo_preservado(self):
+        self.arquivar(2020)
+        motivos = [registro[5] for registro in arquivo.registros_arquivo()]
+        self.assertEqual(motivos, [MovimentacaoEstoque.ENTREGA, MovimentacaoEstoque.ENTREGA, 'compra'])
+
+    def test_motivo_desconhecido_interrompe(self):
+        MovimentacaoEstoque.objects.filter(motivo='compra').update(motivo='doacao')
+        with self.assertRaises(ValueError):
+            self.arquivar(2020)
+        self.assertEqual(arquivo.anos_arquivados(), [])
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 4)
+
+    def test_arquivo_so_e_trocado_no_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            arquivo.arquivar_ano(2020)
+        self.assertEqual(arquivo.anos_arquivados(), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(arquivo.anos_arquivados(), [2020])
+
+    def test_resumo_em_cache_ate_novo_arquivamento(self):
+        self.arquivar(2020)
+        self.assertEqual(arquivo.resumo_arquivo()['quantidade_entradas'], 12)
+        with mock.patch.object(arquivo, '_contar_arquivo') as contar:
+            self.assertEqual(arquivo.resumo_arquivo()['quantidade_entradas'], 12)
+        contar.assert_not_called()  # a varredura vem do cache
+
+        self.arquivar(2022)
+        self.assertEqual(arquivo.resumo_arquivo()['quantidade_saidas'], 5)
+
+    def test_arquivamento_em_outro_processo_invalida_o_resumo(self):
+        self.arquivar(2020)
+        arquivo.resumo_arquivo()
+
+        # O comando archive_movements roda em outro processo, com a própria instância do cache
+        outro_processo = DatabaseCache(settings.CACHES['default']['LOCATION'], {})
+        outro_processo.incr(CHAVE_GERACAO_ARQUIVO)
+        with mock.patch.object(arquivo, '_contar_arquivo', wraps=arquivo._contar_arquivo) as contar:
+            arquivo.resumo_arquivo()
+        contar.assert_called_once()
+
+
+class RelatorioEstoqueTest(TestCase):
+    """Agrupamentos do relatório de movimentações, com e sem a parte arquivada"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(ESTOQUE_ARQUIVO_DIR=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        bebidas = Categoria.objects.create(nome='Bebidas')
+        self.suco = Produto.objects.create(nome='Suco', sku='SUC-001', categoria=bebidas, preco_custo=2, preco_venda=3)
+        self.copo = Produto.objects.create(nome='Copo', sku='COP-001', preco_custo=1, preco_venda=1)
+        movimentacoes = [
+            (self.suco, datetime(2022, 3, 1, 10), 'E', 100, 'compra'),
+            (self.suco, datetime(2022, 3, 1, 23, 30), 'S', 30, 'venda'),
+            (self.copo, datetime(2025, 5, 1, 10), 'E', 5, 'compra'),
+            (self.copo, datetime(2025, 5, 2, 10), 'S', 1, 'perda'),
+        ]
+        for produto, data, tipo, quantidade, motivo in movimentacoes:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                produto=produto, tipo=tipo, quantidade=quantidade, motivo=motivo
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=timezone.make_aware(data)
+            )
+        call_command('rebuild_stock_snapshots', stdout=io.StringIO())
+
+    def parametros(self, **parametros):
+        return dict({
+            'tipo': 'movimentacoes', 'data_inicio': None, 'data_fim': None,
+            'categoria_id': None, 'classe_abc': None, 'classe_xyz': None,
+        }, **parametros)
+
+    def quantidades(self, grupos):
+        return {linha['grupo']: (linha['quantidade_entradas'], linha['quantidade_saidas']) for linha in grupos}
+
+    def test_agrupamentos(self):
+        relatorio = relatorio_estoque.calcular_relatorio(self.parametros())
+
+        self.assertEqual(self.quantidades(relatorio['por_motivo']), {
+            'compra': (105, 0), 'venda': (0, 30), 'perda': (0, 1),
+        })
+        self.assertEqual(self.quantidades(relatorio['por_dia']), {
+            date(2022, 3, 1): (100, 30), date(2025, 5, 1): (5, 0), date(2025, 5, 2): (0, 1),
+        })
+        self.assertEqual(self.quantidades(relatorio['por_categoria']), {
+            'Bebidas': (100, 30), relatorio_estoque.SEM_CATEGORIA: (5, 1),
+        })
+        self.assertEqual(relatorio['totais']['total'], 4)
+        self.assertEqual(relatorio['total_linhas'], 4)
+
+    def test_arquivo_somado_aos_agrupamentos(self):
+        antes = relatorio_estoque.calcular_relatorio(self.parametros())
+        with self.captureOnCommitCallbacks(execute=True):
+            arquivo.arquivar_ano(2022)
+        depois = relatorio_estoque.calcular_relatorio(self.parametros())
+
+        for agrupamento in ('por_motivo', 'por_dia', 'por_categoria'):
+            self.assertEqual(
+                self.quantidades(depois[agrupamento]), self.quantidades(antes[agrupamento]), agrupamento
+            )
+        self.assertEqual(depois['totais']['total'], 4)
+        # Na tabela ficam as duas movimentações de 2025 e o saldo de abertura do suco
+        self.assertEqual(depois['total_linhas'], 3)
+
+    def test_paginar_linhas(self):
+        for i in range(60):
+            Produto.objects.create(nome=f'Produto {i:02d}', sku=f'PRD-{i:02d}')
+        parametros = self.parametros(tipo='geral')
+        relatorio = relatorio_estoque.calcular_relatorio(parametros)
+
+        pagina = relatorio_estoque.paginar_linhas(parametros, relatorio, 2)
+        self.assertEqual((pagina.paginator.count, pagina.paginator.num_pages), (62, 2))
+        self.assertEqual(len(pagina.object_list), 12)
+
+        # A contagem vem do relatório: a página não refaz o COUNT
+        with self.assertNumQueries(1):
+            nomes = [produto.nome for produto in relatorio_estoque.paginar_linhas(parametros, relatorio, 1)]
+        self.assertEqual(nomes[:2], ['Copo', 'Produto 00'])
+
+    def test_periodo_fechado_invalidado_por_outro_processo(self):
+        fechado = self.parametros(data_inicio=date(2022, 1, 1), data_fim=date(2022, 12, 31))
+        self.assertEqual(relatorio_estoque.obter_relatorio(fechado)['saldos'], {'inicial': 0, 'final': 70})
+        with mock.patch.object(relatorio_estoque, 'calcular_relatorio') as calcular:
+            relatorio_estoque.obter_relatorio(fechado)
+        calcular.assert_not_called()
+
+        # Lançamento retroativo gravado por outro processo (reconcile_stock --fix, por exemplo)
+        DatabaseCache(settings.CACHES['default']['LOCATION'], {}).incr(CHAVE_GERACAO_RETROATIVA)
+        with mock.patch.object(
+            relatorio_estoque, 'calcular_relatorio', wraps=relatorio_estoque.calcular_relatorio
+        ) as calcular:
+            relatorio_estoque.obter_relatorio(fechado)
+        calcular.assert_called_once()
+
+
+class ConciliacaoTest(TestCase):
+    """Divergências entre estoque registrado e razão, e a correção que não mexe no estoque"""
+
+    def setUp(self):
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', sku=f'PRD-{i}') for i in range(5)
+        ]
+        lancar_movimentacoes(
+            MovimentacaoEstoque(produto=produto, tipo='E', quantidade=10) for produto in self.produtos
+        )
+        # Estoque alterado por fora do razão
+        Produto.objects.filter(pk=self.produtos[1].pk).update(estoque_atual=F('estoque_atual') + 3)
+        Produto.objects.filter(pk=self.produtos[4].pk).update(estoque_atual=F('estoque_atual') - 2)
+
+    def estoques(self):
+        return list(Produto.objects.order_by('pk').values_list('estoque_atual', flat=True))
+
+    def test_detecta_divergencias_em_lotes(self):
+        divergentes = conciliar(tamanho_lote=2, threads=1)
+        self.assertEqual(
+            [(pk, estoque, razao) for pk, _sku, _nome, estoque, razao in divergentes],
+            [(self.produtos[1].pk, 13, 10), (self.produtos[4].pk, 8, 10)],
+        )
+
+    def test_corrigir_mantem_o_estoque(self):
+        self.assertEqual(corrigir([self.produtos[4].pk, self.produtos[1].pk]), 2)
+
+        self.assertEqual(self.estoques(), [10, 13, 10, 10, 8])
+        self.assertEqual(conciliar(threads=1), [])
+        correcoes = MovimentacaoEstoque.objects.filter(observacao=OBSERVACAO_CORRECAO).order_by('produto_id')
+        self.assertEqual(
+            [(m.produto_id, m.tipo, m.quantidade) for m in correcoes],
+            [(self.produtos[1].pk, 'E', 3), (self.produtos[4].pk, 'S', 2)],
+        )
+
+    def test_comando_com_fix(self):
+        saida = io.StringIO()
+        call_command('reconcile_stock', '--workers', '1', '--fix', stdout=saida)
+        self.assertIn('2 produto(s) divergente(s), 5 unidade(s) de diferença', saida.getvalue())
+        self.assertEqual(self.estoques(), [10, 13, 10, 10, 8])
+        self.assertEqual(conciliar(threads=1), [])
+
+
+class CompareAndSwapEstoqueTest(TestCase):
+    """Gravações de estoque com versão: outra operação entre a leitura e a gravação força nova leitura"""
+
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Caderno', sku='CAD-001', estoque_atual=10)
+
+    def concorrente(self, vezes):
+        """
+        Entre a leitura e a gravação (o status novo é calculado nesse meio), outra
+        operação soma 1 ao estoque nas `vezes` primeiras leituras.
+        """
+        calcular = Produto.calcular_status_estoque
+        leituras = []
+
+        def calcular_com_concorrencia(estoque_atual, estoque_minimo):
+            leituras.append(estoque_atual)
+            if len(leituras) <= vezes:
+                Produto.objects.filter(pk=self.produto.pk).update(
+                    estoque_atual=F('estoque_atual') + 1, versao=F('versao') + 1
+                )
+            return calcular(estoque_atual, estoque_minimo)
+
+        patch = mock.patch.object(Produto, 'calcular_status_estoque', side_effect=calcular_com_concorrencia)
+        patch.start()
+        self.addCleanup(patch.stop)
+        return leituras
+
+    # Em aplicar_deltas a leitura fica dentro do savepoint de cada tentativa: a gravação
+    # "concorrente" simulada aqui é desfeita junto com ele, então o estoque relido não muda
+
+    def test_aplicar_deltas_rele_e_reaplica(self):
+        leituras = self.concorrente(vezes=2)
+        aplicar_deltas({self.produto.pk: -4})
+        self.assertEqual(leituras, [6, 6, 6])
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.estoque_atual, self.produto.versao), (6, 1))
+
+    def test_aplicar_deltas_desiste_apos_as_tentativas(self):
+        leituras = self.concorrente(vezes=TENTATIVAS_CAS)
+        with self.assertRaises(ConflitoEstoque):
+            aplicar_deltas({self.produto.pk: -4})
+        self.assertEqual(len(leituras), TENTATIVAS_CAS)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 10)
+
+    def test_registrar_ajuste_usa_o_estoque_relido(self):
+        leituras = self.concorrente(vezes=1)
+        ajuste = registrar_ajuste(AjusteEstoque(produto=self.produto, estoque_novo=15, motivo='Inventário'))
+        self.assertEqual(len(leituras), 2)
+        self.assertEqual(ajuste.estoque_anterior, 11)
+        movimentacao = MovimentacaoEstoque.objects.get(motivo='ajuste')
+        self.assertEqual((movimentacao.tipo, movimentacao.quantidade), ('E', 4))
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 15)
+
+    def test_registrar_ajuste_desiste_apos_as_tentativas(self):
+        self.concorrente(vezes=TENTATIVAS_CAS)
+        with self.assertRaises(ConflitoEstoque):
+            registrar_ajuste(AjusteEstoque(produto=self.produto, estoque_novo=15, motivo='Inventário'))
+        self.assertFalse(AjusteEstoque.objects.exists())
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_registrar_ajuste_recusa_versao_vista_antiga(self):
+        versao_vista = self.produto.versao
+        MovimentacaoEstoque.objects.create(produto=self.produto, tipo='S', quantidade=2)
+        with self.assertRaises(ConflitoEstoque):
+            registrar_ajuste(
+                AjusteEstoque(produto=self.produto, estoque_novo=15, motivo='Inventário'), versao_esperada=versao_vista
+            )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 8)
+        self.assertFalse(AjusteEstoque.objects.exists())
+
+        registrar_ajuste(
+            AjusteEstoque(produto=self.produto, estoque_novo=15, motivo='Inventário'), versao_esperada=self.produto.versao
+        )
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque_atual, 15)
+
+    def test_produto_desatualizado_nao_sobrescreve_o_estoque(self):
+        carregado = Produto.objects.get(pk=self.produto.pk)
+        aplicar_deltas({self.produto.pk: -3})
+
+        carregado.estoque_minimo = 2
+        with self.assertRaises(ConflitoEstoque):
+            carregado.save()
+        # Campos que não dependem do estoque continuam podendo ser gravados
+        carregado.nome = 'Caderno grande'
+        carregado.save(update_fields=['nome'])
+
+        self.produto.refresh_from_db()
+        self.assertEqual((self.produto.nome, self.produto.estoque_atual, self.produto.estoque_minimo),
+                         ('Caderno grande', 7, 0))
+
+
+@override_settings(RELATORIOS_PDF_PROCESSOS=0, RELATORIOS_PDF_MAX_LINHAS=3)
+class PdfMovimentacoesTest(TestCase):
+    """O aviso de truncamento conta as mesmas linhas que vão para o PDF"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('pdf', password='senha')
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001')
+        lancar_movimentacoes([
+            MovimentacaoEstoque(produto=produto, tipo='E', quantidade=1, usuario=self.usuario) for _ in range(3)
+        ])
+        # Saldo de abertura fica fora do resumo, mas é listado no PDF
+        MovimentacaoEstoque.objects.filter(pk=MovimentacaoEstoque.objects.first().pk).update(
+            motivo=MovimentacaoEstoque.SALDO_ABERTURA
+        )
+
+    def primeira_parte(self, gerar):
+        partes = []
+
+        def converter(html_strings, *argumentos):
+            partes.extend(html_strings)
+            return b'%PDF'
+
+        with mock.patch.object(relatorios_pdf, '_converter', converter):
+            gerar({}, self.usuario)
+        return partes[0]
+
+    def test_truncado_pela_contagem_das_linhas_listadas(self):
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 3)
+        for gerar in (pdf.pdf_movimentacoes, pdf.pdf_relatorio_movimentacoes):
+            self.assertNotIn('Relatório limitado', self.primeira_parte(gerar))
+
+        MovimentacaoEstoque.objects.create(
+            produto=Produto.objects.get(), tipo='E', quantidade=1, usuario=self.usuario
+        )
+        for gerar in (pdf.pdf_movimentacoes, pdf.pdf_relatorio_movimentacoes):
+            self.assertIn('limitado às primeiras 3 de 4', self.primeira_parte(gerar))
+
+
+class CalcularPrevisoesTest(SimpleTestCase):
+    """Cobertura e sugestão de compra numa matriz pequena, com horizonte de 3 + 1 dias"""
+
+    def calcular(self, saidas, estoque_atual, estoque_minimo):
+        return calcular_previsoes(
+            np.array(saidas, dtype=np.float64), np.array(estoque_atual, dtype=np.float64),
+            np.array(estoque_minimo, dtype=np.float64), janela=2, ciclo_dias=3, prazo_entrega_dias=1,
+        )
+
+    def test_matriz(self):
+        consumo, cobertura, sugerida = self.calcular(
+            [[2, 2, 2, 2], [0, 0, 0, 0], [0, 4, 0, 4], [1, 1, 1, 1]],
+            [10, 5, 3, -2],
+            [0, 8, 0, 0],
+        )
+        np.testing.assert_allclose(consumo, [2, 0, 2, 1])
+        # Sem consumo a cobertura é infinita; estoque negativo não cobre nenhum dia
+        np.testing.assert_allclose(cobertura, [5, np.inf, 1.5, 0])
+        # Demanda constante não tem estoque de segurança; a irregular soma 1.65 * 2 * sqrt(4) = 6.6
+        self.assertEqual(sugerida.tolist(), [0, 3, 12, 6])
+
+    def test_janela_maior_que_o_historico(self):
+        consumo, cobertura, _sugerida = self.calcular([[3, 1]], [8], [0])
+        np.testing.assert_allclose(consumo, [2])
+        np.testing.assert_allclose(cobertura, [4])
+
+
+class ClassificarTest(SimpleTestCase):
+
+    def test_matriz(self):
+        saidas = np.array([
+            [175, 175, 175, 175],
+            [0, 100, 0, 100],
+            [0, 0, 0, 60],
+            [10, 10, 10, 10],
+            [0, 0, 0, 0],
+        ], dtype=np.float64)
+        valor, acumulado, coeficiente, classe_abc, classe_xyz = classificar(saidas, np.array([1, 1, 1, 1, 5.0]))
+
+        np.testing.assert_allclose(valor, [700, 200, 60, 40, 0])
+        np.testing.assert_allclose(acumulado, [0.7, 0.9, 0.96, 1.0, 1.0])
+        # A classe vem da participação antes do item: o segundo ainda começa abaixo de 80%
+        self.assertEqual(classe_abc.tolist(), ['A', 'A', 'B', 'C', 'C'])
+        np.testing.assert_allclose(coeficiente[:4], [0, 1, 3 ** 0.5, 0])
+        self.assertTrue(np.isnan(coeficiente[4]))
+        self.assertEqual(classe_xyz.tolist(), ['X', 'Y', 'Z', 'X', 'Z'])
+
+    def test_sem_demanda(self):
+        valor, acumulado, coeficiente, classe_abc, classe_xyz = classificar(np.zeros((2, 4)), np.array([1.0, 2.0]))
+        np.testing.assert_allclose(acumulado, [1, 1])
+        self.assertTrue(np.isnan(coeficiente).all())
+        self.assertEqual((classe_abc.tolist(), classe_xyz.tolist()), (['C', 'C'], ['Z', 'Z']))
@@ -10,10 +10,12 @@ urlpatterns = [
     path('ajuste/', views.ajuste_estoque, name='ajuste_estoque'),
     path('movimentacoes/', views.lista_movimentacoes, name='lista_movimentacoes'),
     path('relatorios/', views.relatorios_estoque, name='relatorios_estoque'),
+    path('sugestao-compra/', views.sugestao_compra, name='sugestao_compra'),
     path('exportar-csv/', views.exportar_estoque_csv, name='exportar_estoque_csv'),
     path('movimentacao/<int:movimentacao_id>/pdf/', views.gerar_pdf_movimentacao, name='gerar_pdf_movimentacao'),
     # ... suas URLs existentes
     path('movimentacoes/exportar-pdf/', views.exportar_movimentacoes_pdf, name='exportar_movimentacoes_pdf'),
+    path('movimentacoes/exportar-csv/', views.exportar_movimentacoes_csv, name='exportar_movimentacoes_csv'),
     path('movimentacao/<int:movimentacao_id>/pdf/', views.gerar_pdf_movimentacao, name='gerar_pdf_movimentacao'),
     #path('relatorios/estoque-pdf/', views.gerar_relatorio_estoque_pdf, name='gerar_relatorio_estoque_pdf'),
     #path('relatorios/estoque-csv/', views.gerar_relatorio_estoque_csv, name='gerar_relatorio_estoque_csv'),
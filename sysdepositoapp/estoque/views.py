@@ -1,23 +1,28 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.db.models import Q, Sum, Count, F  # Adicione models aqui
 from django.db import models  # Importação do models
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from django.utils import timezone
 from datetime import datetime, timedelta
-import csv
 from produto.models import Produto, Categoria
-from .models import MovimentacaoEstoque, AjusteEstoque
+from .models import MovimentacaoEstoque, AjusteEstoque, PrevisaoEstoque, ClassificacaoEstoque
 from .forms import MovimentacaoEstoqueForm, AjusteEstoqueForm, RelatorioEstoqueForm
+from .relatorio_estoque import obter_relatorio, paginar_linhas, parametros_relatorio
+from .filtros import converter_data, filtrar_movimentacoes, filtros_da_requisicao
+from .paginacao import estatisticas_estimadas, paginar_por_cursor
+from .resumos import resumo_movimentacoes
+from .services import ConflitoEstoque, registrar_ajuste
+from .dashboard import dados_dashboard
+from .exportacao import resposta_csv, linhas_movimentacoes, linhas_estoque, quer_gzip
+from .pdf import TEMPLATE_MOVIMENTACAO, buscar_movimentacao, contexto_movimentacao
+from relatorios.cache_pdf import resposta_em_cache
+from relatorios.fila import enfileirar_pdf
 
 # estoque/views.py
 #from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.utils.timezone import now, timedelta
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration
-from io import BytesIO
 from .models import MovimentacaoEstoque, Produto
 #from django.db.models import Count, Sum, Q
 
@@ -25,45 +30,19 @@ from django.db.models import Case, When, Value, IntegerField
 
 @login_required
 def dashboard_estoque(request):
-    """Dashboard do estoque"""
-    # Estatísticas
-    total_produtos = Produto.objects.count()
-    
-    # Usando annotate para contar produtos com estoque baixo
-    
-    produtos_estoque_baixo = Produto.objects.filter(
-        Q(estoque_atual__lte=models.F('estoque_minimo')) & 
-        Q(estoque_atual__gt=0)
-    ).count()
-    
-    produtos_esgotados = Produto.objects.filter(estoque_atual=0).count()
-    produtos_estoque_normal = total_produtos - produtos_estoque_baixo - produtos_esgotados
-    
-    # Movimentações recentes
-    movimentacoes_recentes = MovimentacaoEstoque.objects.select_related('produto').order_by('-data_movimentacao')[:10]
-    
-    # Produtos com estoque baixo
-    produtos_alerta = Produto.objects.filter(
-        Q(estoque_atual__lte=models.F('estoque_minimo')) | Q(estoque_atual=0)
-    ).order_by('estoque_atual')[:5]
-
-    context = {
-        'total_produtos': total_produtos,
-        'produtos_estoque_baixo': produtos_estoque_baixo,
-        'produtos_esgotados': produtos_esgotados,
-        'produtos_estoque_normal': produtos_estoque_normal,
-        'movimentacoes_recentes': movimentacoes_recentes,
-        'produtos_alerta': produtos_alerta,
-    }
+    """Dashboard do estoque (agregados em cache, invalidados por signals)"""
+    context = dados_dashboard()
     return render(request, 'estoque/dashboard_estoque.html', context)
 
 @login_required
 def lista_estoque(request):
-    produtos = Produto.objects.all().select_related('categoria')
+    produtos = Produto.objects.all().select_related('categoria', 'classificacao')
     
     # Parâmetros de filtro
     categoria_selecionada = request.GET.get('categoria', '')
     status_selecionado = request.GET.get('status_estoque', '')
+    abc_selecionada = request.GET.get('classe_abc', '')
+    xyz_selecionada = request.GET.get('classe_xyz', '')
     query = request.GET.get('q', '')  # Parâmetro de pesquisa
     
     # Aplicar filtro de pesquisa
@@ -78,14 +57,15 @@ def lista_estoque(request):
     if categoria_selecionada:
         produtos = produtos.filter(categoria_id=categoria_selecionada)
     
-    # Aplicar filtro de status
-    if status_selecionado:
-        if status_selecionado == 'esgotado':
-            produtos = produtos.filter(estoque_atual=0)
-        elif status_selecionado == 'baixo':
-            produtos = produtos.filter(estoque_atual__gt=0, estoque_atual__lte=F('estoque_minimo'))
-        elif status_selecionado == 'normal':
-            produtos = produtos.filter(estoque_atual__gt=F('estoque_minimo'))
+    # Aplicar filtro de status (campo gravado e indexado)
+    if status_selecionado in dict(Produto.STATUS_ESTOQUE_CHOICES):
+        produtos = produtos.filter(status_estoque=status_selecionado)
+    
+    # Filtros da classificação ABC/XYZ (gerada pelo comando classify_stock)
+    if abc_selecionada in dict(ClassificacaoEstoque.CLASSE_ABC_CHOICES):
+        produtos = produtos.filter(classificacao__classe_abc=abc_selecionada)
+    if xyz_selecionada in dict(ClassificacaoEstoque.CLASSE_XYZ_CHOICES):
+        produtos = produtos.filter(classificacao__classe_xyz=xyz_selecionada)
     
     categorias = Categoria.objects.all()
     
@@ -94,6 +74,10 @@ def lista_estoque(request):
         'categorias': categorias,
         'categoria_selecionada': categoria_selecionada,
         'status_selecionado': status_selecionado,
+        'abc_selecionada': abc_selecionada,
+        'xyz_selecionada': xyz_selecionada,
+        'classes_abc': ClassificacaoEstoque.CLASSE_ABC_CHOICES,
+        'classes_xyz': ClassificacaoEstoque.CLASSE_XYZ_CHOICES,
         'query': query,  # Passa a query de volta para o template
     }
     
@@ -107,10 +91,13 @@ def movimentacao_estoque(request):
         if form.is_valid():
             movimentacao = form.save(commit=False)
             movimentacao.usuario = request.user
-            movimentacao.save()
-            
-            messages.success(request, f'Movimentação registrada com sucesso! Estoque atual: {movimentacao.produto.estoque_atual}')
-            return redirect('estoque:lista_movimentacoes')
+            try:
+                movimentacao.save()
+            except ConflitoEstoque as erro:
+                messages.error(request, f'{erro}. Tente novamente.')
+            else:
+                messages.success(request, f'Movimentação registrada com sucesso! Estoque atual: {movimentacao.produto.estoque_atual}')
+                return redirect('estoque:lista_movimentacoes')
     else:
         form = MovimentacaoEstoqueForm()
     
@@ -125,26 +112,17 @@ def ajuste_estoque(request):
         if form.is_valid():
             ajuste = form.save(commit=False)
             ajuste.usuario = request.user
-            ajuste.estoque_anterior = ajuste.produto.estoque_atual
-            
-            # Criar movimentação correspondente
-            diferenca = ajuste.estoque_novo - ajuste.estoque_anterior
-            if diferenca != 0:
-                tipo = 'E' if diferenca > 0 else 'S'
-                MovimentacaoEstoque.objects.create(
-                    produto=ajuste.produto,
-                    tipo=tipo,
-                    quantidade=abs(diferenca),
-                    motivo='ajuste',
-                    observacao=ajuste.motivo,
-                    usuario=request.user
-                )
             
-            ajuste.save()
-            messages.success(request, f'Estoque ajustado com sucesso! Novo estoque: {ajuste.produto.estoque_atual}')
-            return redirect('estoque:lista_estoque')
+            # Estoque anterior, movimentação e novo estoque gravados com compare-and-swap
+            try:
+                registrar_ajuste(ajuste, versao_esperada=form.cleaned_data['versao'])
+            except ConflitoEstoque as erro:
+                messages.error(request, str(erro))
+            else:
+                messages.success(request, f'Estoque ajustado com sucesso! Novo estoque: {ajuste.estoque_novo}')
+                return redirect('estoque:lista_estoque')
     else:
-        form = AjusteEstoqueForm()
+        form = AjusteEstoqueForm(initial={'produto': request.GET.get('produto')})
     
     context = {'form': form, 'titulo': 'Ajuste de Estoque'}
     return render(request, 'estoque/ajuste_form.html', context)
@@ -162,433 +140,177 @@ def lista_movimentacoes(request):
     # Query inicial otimizada
     movimentacoes = MovimentacaoEstoque.objects.select_related('produto', 'usuario').order_by('-data_movimentacao')
     
-    # Filtros
-    produto_id = request.GET.get('produto')
-    tipo = request.GET.get('tipo')
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    
-    if produto_id:
-        movimentacoes = movimentacoes.filter(produto_id=produto_id)
-    if tipo:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
-    if data_inicio:
-        movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=data_inicio)
-    if data_fim:
-        movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=data_fim)
+    # Filtros (período como intervalo semiaberto para aproveitar os índices)
+    filtros = filtros_da_requisicao(request)
+    movimentacoes = filtrar_movimentacoes(movimentacoes, **filtros)
 
     # Produtos ativos para o filtro
     produtos = Produto.objects.filter(ativo=True)
     
-    # Paginação
-    page = request.GET.get('page', 1)
-    paginator = Paginator(movimentacoes, 25)  # 25 itens por página
-    
-    try:
-        movimentacoes_paginadas = paginator.page(page)
-    except PageNotAnInteger:
-        movimentacoes_paginadas = paginator.page(1)
-    except EmptyPage:
-        movimentacoes_paginadas = paginator.page(paginator.num_pages)
-    
-    # Calcular estatísticas na query original (não paginada)
-    estatisticas = {
-        'entradas': movimentacoes.filter(tipo='E').count(),
-        'saidas': movimentacoes.filter(tipo='S').count(),
-        'total': movimentacoes.count(),
-        'ultima_semana': movimentacoes.filter(
-            data_movimentacao__gte=timezone.now() - timedelta(days=7)
-        ).count(),
-    }
+    # Paginação: ?paginacao=cursor usa keyset (data_movimentacao, id) em vez de OFFSET
+    paginacao_cursor = request.GET.get('paginacao') == 'cursor'
+    if paginacao_cursor:
+        # Estatísticas e total em cache pelos filtros. O total conta as linhas listadas:
+        # o das estatísticas soma o arquivo e deixa de fora os saldos de abertura
+        chave = repr(sorted(filtros.items()))
+        estatisticas = estatisticas_estimadas(chave, lambda: resumo_movimentacoes(movimentacoes, filtros))
+        movimentacoes_paginadas = paginar_por_cursor(
+            movimentacoes,
+            token=request.GET.get('cursor'),
+            por_pagina=25,
+            chave_total=chave,
+        )
+        parametros = request.GET.copy()
+        parametros.pop('cursor', None)
+        parametros.pop('page', None)
+        querystring_cursor = parametros.urlencode()
+    else:
+        querystring_cursor = ''
+        page = request.GET.get('page', 1)
+        paginator = Paginator(movimentacoes, 25)  # 25 itens por página
+        
+        try:
+            movimentacoes_paginadas = paginator.page(page)
+        except PageNotAnInteger:
+            movimentacoes_paginadas = paginator.page(1)
+        except EmptyPage:
+            movimentacoes_paginadas = paginator.page(paginator.num_pages)
+
+        # Calcular estatísticas na query original (não paginada), em uma única consulta,
+        # somando o que já foi arquivado
+        estatisticas = resumo_movimentacoes(movimentacoes, filtros)
     
     context = {
         'movimentacoes': movimentacoes_paginadas,
         'produtos': produtos,
         'estatisticas': estatisticas,
-        'filtros_aplicados': any([produto_id, tipo, data_inicio, data_fim]),
+        'filtros_aplicados': any(filtros.values()),
+        'paginacao_cursor': paginacao_cursor,
+        'querystring_cursor': querystring_cursor,
     }
     
     return render(request, 'estoque/lista_movimentacoes.html', context)
 
 @login_required
 def relatorios_estoque(request):
-    """Relatórios de estoque"""
+    """Relatórios de estoque: totais e agrupamentos calculados no banco (em cache) e detalhe paginado"""
     form = RelatorioEstoqueForm(request.GET or None)
-    relatorio_data = None
+    relatorio = None
+    linhas = None
+    tipo_relatorio = None
     
     if form.is_valid():
-        tipo_relatorio = form.cleaned_data['tipo_relatorio']
-        data_inicio = form.cleaned_data['data_inicio']
-        data_fim = form.cleaned_data['data_fim']
-        categoria = form.cleaned_data['categoria']
-        
-        if tipo_relatorio == 'geral':
-            produtos = Produto.objects.all()
-            if categoria:
-                produtos = produtos.filter(categoria=categoria)
-            relatorio_data = produtos
-        
-        elif tipo_relatorio == 'baixo_estoque':
-            relatorio_data = Produto.objects.filter(
-                estoque_atual__lte=models.F('estoque_minimo'), 
-                estoque_atual__gt=0
-            )
-            if categoria:
-                relatorio_data = relatorio_data.filter(categoria=categoria)
-        
-        elif tipo_relatorio == 'esgotado':
-            relatorio_data = Produto.objects.filter(estoque_atual=0)
-            if categoria:
-                relatorio_data = relatorio_data.filter(categoria=categoria)
-        
-        elif tipo_relatorio == 'movimentacoes':
-            movimentacoes = MovimentacaoEstoque.objects.all()
-            if data_inicio:
-                movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=data_inicio)
-            if data_fim:
-                movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=data_fim)
-            if categoria:
-                movimentacoes = movimentacoes.filter(produto__categoria=categoria)
-            
-            relatorio_data = movimentacoes
+        parametros = parametros_relatorio(form.cleaned_data)
+        tipo_relatorio = parametros['tipo']
+        relatorio = obter_relatorio(parametros)
+        linhas = paginar_linhas(parametros, relatorio, request.GET.get('page'))
 
     context = {
         'form': form,
-        'relatorio_data': relatorio_data,
+        'relatorio': relatorio,
+        'linhas': linhas,
+        'tipo_relatorio': tipo_relatorio,
     }
     return render(request, 'estoque/relatorios.html', context)
 
 @login_required
 def exportar_estoque_csv(request):
-    """Exportar estoque para CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="estoque.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Produto', 'SKU', 'Categoria', 'Estoque Atual', 'Estoque Mínimo', 'Status', 'Preço Custo', 'Preço Venda'])
-    
-    produtos = Produto.objects.all().order_by('nome')
-    for produto in produtos:
-        writer.writerow([
-            produto.nome,
-            produto.sku,
-            produto.categoria.nome if produto.categoria else '',
-            produto.estoque_atual,
-            produto.estoque_minimo,
-            produto.status_estoque,
-            produto.preco_custo,
-            produto.preco_venda,
-        ])
-    
-    return response
-
-# estoque/views.py
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from django.conf import settings
-from django.utils.timezone import now
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration
-from io import BytesIO
-from .models import MovimentacaoEstoque
+    """Exportar estoque para CSV (streaming, opcionalmente com ?gzip=1)"""
+    cabecalho = ['Produto', 'SKU', 'Categoria', 'Estoque Atual', 'Estoque Mínimo', 'Status', 'Preço Custo', 'Preço Venda']
+    return resposta_csv(cabecalho, linhas_estoque(Produto.objects.all()), 'estoque.csv', compactar=quer_gzip(request))
 
+@login_required
 def gerar_pdf_movimentacao(request, movimentacao_id):
-    """Gera PDF de uma movimentação específica"""
-    movimentacao = get_object_or_404(MovimentacaoEstoque, id=movimentacao_id)
-    
-    context = {
-        'movimentacao': movimentacao,
-        'gerado_em': now(),
-    }
-    
-    # Renderiza o template HTML
-    html_string = render_to_string('estoque/movimentacao_pdf.html', context)
-    
-    # Configuração de fontes
-    font_config = FontConfiguration()
-    
-    # Gera o PDF
-    pdf_file = HTML(
-        string=html_string,
-        base_url=request.build_absolute_uri()
-    ).write_pdf(font_config=font_config)
-    
-    # Cria a resposta
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    filename = f"movimentacao_{movimentacao.id}_{now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
+    """PDF de uma movimentação: servido do cache quando já gerado, senão enfileirado"""
+    try:
+        movimentacao = buscar_movimentacao(movimentacao_id)
+    except MovimentacaoEstoque.DoesNotExist:
+        raise Http404('Movimentação não encontrada')
+
+    resposta = resposta_em_cache(
+        TEMPLATE_MOVIMENTACAO, contexto_movimentacao(movimentacao), f'movimentacao_{movimentacao.id}.pdf'
+    )
+    if resposta is not None:
+        return resposta
+    return enfileirar_pdf(request, 'movimentacao', {'movimentacao_id': movimentacao.id})
 
 
-# estoque/views.py
+@login_required
 def gerar_relatorio_movimentacoes(request):
-    """Gera PDF com múltiplas movimentações (filtradas)"""
-    # Obter parâmetros de filtro
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    tipo = request.GET.get('tipo')
-    produto_id = request.GET.get('produto')
-    
-    # Filtrar movimentações
-    movimentacoes = MovimentacaoEstoque.objects.all().select_related('produto')
-    
-    if data_inicio:
-        movimentacoes = movimentacoes.filter(data_ocorrencia__gte=data_inicio)
-    if data_fim:
-        movimentacoes = movimentacoes.filter(data_ocorrencia__lte=data_fim)
-    if tipo:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
-    if produto_id:
-        movimentacoes = movimentacoes.filter(produto_id=produto_id)
-    
-    movimentacoes = movimentacoes.order_by('-data_ocorrencia')
-    
-    context = {
-        'movimentacoes': movimentacoes,
-        'data_inicio': data_inicio,
-        'data_fim': data_fim,
-        'tipo': tipo,
-        'gerado_em': now(),
-        'total_entradas': movimentacoes.filter(tipo='E').count(),
-        'total_saidas': movimentacoes.filter(tipo='S').count(),
+    """Enfileira o PDF com múltiplas movimentações (filtradas)"""
+    parametros = {
+        chave: request.GET.get(chave)
+        for chave in ('data_inicio', 'data_fim', 'tipo', 'produto')
+        if request.GET.get(chave)
     }
-    
-    html_string = render_to_string('estoque/relatorio_movimentacoes_pdf.html', context)
-    
-    pdf_file = HTML(string=html_string).write_pdf()
-    
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    filename = f"relatorio_movimentacoes_{now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
+    return enfileirar_pdf(request, 'relatorio_movimentacoes', parametros)
 
 @login_required
 def exportar_movimentacoes_pdf(request):
-    """Exporta movimentações em PDF com filtros e estatísticas"""
-    from django.db.models import Sum, Count, F, DecimalField
-    from django.utils import timezone
-    from datetime import datetime
-    
-    # Query base com related
-    movimentacoes = MovimentacaoEstoque.objects.select_related('produto', 'usuario')
+    """Enfileira a exportação das movimentações em PDF com filtros e estatísticas"""
+    parametros = {}
 
-    # Inicializar variáveis
-    produto = None
-    data_inicio = None
-    data_fim = None
-    
-    # Aplicar filtros da query string
+    # Validar filtros aqui para avisar o usuário; o PDF é gerado pelo worker
     produto_id = request.GET.get('produto')
-    tipo = request.GET.get('tipo')
-    data_inicio_str = request.GET.get('data_inicio')
-    data_fim_str = request.GET.get('data_fim')
-
-    # Filtro de produto
     if produto_id:
-        try:
-            produto = Produto.objects.get(id=produto_id)
-            movimentacoes = movimentacoes.filter(produto=produto)
-        except (Produto.DoesNotExist, ValueError):
+        if produto_id.isdigit() and Produto.objects.filter(id=produto_id).exists():
+            parametros['produto'] = produto_id
+        else:
             messages.warning(request, 'Produto não encontrado')
 
-    # Filtro de tipo
+    tipo = request.GET.get('tipo')
     if tipo:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
+        parametros['tipo'] = tipo
 
-    # Filtro de data início
-    if data_inicio_str:
-        try:
-            data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
-            movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=data_inicio)
-        except ValueError:
-            messages.warning(request, 'Data inicial inválida')
+    for chave, aviso in (('data_inicio', 'Data inicial inválida'), ('data_fim', 'Data final inválida')):
+        valor = request.GET.get(chave)
+        if valor:
+            if converter_data(valor):
+                parametros[chave] = valor
+            else:
+                messages.warning(request, aviso)
 
-    # Filtro de data fim
-    if data_fim_str:
-        try:
-            data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
-            movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=data_fim)
-        except ValueError:
-            messages.warning(request, 'Data final inválida')
+    return enfileirar_pdf(request, 'movimentacoes', parametros)
 
-    # Ordenação
-    movimentacoes = movimentacoes.order_by('-data_movimentacao')
+@login_required
+def exportar_movimentacoes_csv(request):
+    """Exporta movimentações em CSV (streaming) com os mesmos filtros da listagem"""
+    filtros = filtros_da_requisicao(request)
+    movimentacoes = filtrar_movimentacoes(MovimentacaoEstoque.objects.all(), **filtros)
 
-    # Calcular estatísticas separadamente para evitar agregações aninhadas
-    movimentacoes_entrada = movimentacoes.filter(tipo='E')
-    movimentacoes_saida = movimentacoes.filter(tipo='S')
+    cabecalho = [
+        'Data/Hora', 'Produto', 'SKU', 'Tipo', 'Quantidade', 'Motivo', 'Usuário', 'Data Ocorrência', 'Observação'
+    ]
+    filename = f"movimentacoes_{timezone.now().strftime('%Y%m%d_%H%M')}.csv"
+    # As movimentações arquivadas seguem no fim do arquivo, depois das da tabela
+    return resposta_csv(cabecalho, linhas_movimentacoes(movimentacoes, filtros), filename, compactar=quer_gzip(request))
 
-    # Estatísticas de entrada
-    stats_entrada = {
-        'total': movimentacoes_entrada.count(),
-        'quantidade': movimentacoes_entrada.aggregate(
-            total=models.Sum('quantidade')
-        )['total'] or 0,
-        'valor': movimentacoes_entrada.aggregate(
-            total=models.Sum(
-                models.F('quantidade') * models.F('produto__preco_custo'),
-                output_field=models.DecimalField(max_digits=10, decimal_places=2)
-            )
-        )['total'] or 0
-    }
+@login_required
+def sugestao_compra(request):
+    """Produtos que precisam de compra, lidos da tabela gerada pelo comando forecast_stock"""
+    previsoes = PrevisaoEstoque.objects.select_related('produto', 'produto__categoria').filter(quantidade_sugerida__gt=0)
 
-    # Estatísticas de saída
-    stats_saida = {
-        'total': movimentacoes_saida.count(),
-        'quantidade': movimentacoes_saida.aggregate(
-            total=models.Sum('quantidade')
-        )['total'] or 0,
-        'valor': movimentacoes_saida.aggregate(
-            total=models.Sum(
-                models.F('quantidade') * models.F('produto__preco_venda'),
-                output_field=models.DecimalField(max_digits=10, decimal_places=2)
-            )
-        )['total'] or 0
-    }
+    categoria_selecionada = request.GET.get('categoria', '')
+    so_ruptura = request.GET.get('ruptura') == '1'
+
+    if categoria_selecionada.isdigit():
+        previsoes = previsoes.filter(produto__categoria_id=categoria_selecionada)
+
+    # Só o que acaba antes do próximo ciclo de compra
+    if so_ruptura:
+        previsoes = previsoes.filter(dias_cobertura__lt=settings.ESTOQUE_CICLO_COMPRA_DIAS)
+
+    previsoes = previsoes.order_by(F('dias_cobertura').asc(nulls_last=True), 'produto__nome')
+
+    paginator = Paginator(previsoes, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
 
-    # Preparar contexto
-    context = {
-        'movimentacoes': movimentacoes,
-        'filtros': {
-            'produto': produto.nome if produto else 'Todos',
-            'tipo': dict(MovimentacaoEstoque.TIPO_CHOICES).get(tipo, 'Todos'),
-            'data_inicio': data_inicio.strftime('%d/%m/%Y') if data_inicio else 'Início',
-            'data_fim': data_fim.strftime('%d/%m/%Y') if data_fim else 'Hoje',
-        },
-        'stats': {
-            'entradas': stats_entrada,
-            'saidas': stats_saida
-        },
-        'gerado_em': timezone.now(),
-        'usuario': request.user,
-    }
-    
-    # Renderizar o template
-    html_string = render_to_string('estoque/relatorio_movimentacoes_pdf.html', context)
-    
-    # Configurar fontes
-    font_config = FontConfiguration()
-    
-    # Gerar PDF
-    html = HTML(
-        string=html_string,
-        base_url=request.build_absolute_uri(),
-    )
-    
-    # Criar o PDF em memória
-    result = html.write_pdf(
-        font_config=font_config,
-        presentational_hints=True
-    )
-    
-    # Retornar como resposta HTTP
-    response = HttpResponse(result, content_type='application/pdf')
-    filename = f"movimentacoes_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
-    """Gera PDF com múltiplas movimentações baseado nos filtros"""
-    
-    # Aplicar os mesmos filtros da lista
-    movimentacoes = MovimentacaoEstoque.objects.all().select_related('produto', 'usuario')
-    
-    # Filtros da query string
-    produto_id = request.GET.get('produto')
-    tipo = request.GET.get('tipo')
-    data_inicio = request.GET.get('data_inicio')
-    data_fim = request.GET.get('data_fim')
-    
-    # Aplicar filtros
-    if produto_id:
-        movimentacoes = movimentacoes.filter(produto_id=produto_id)
-        produto = Produto.objects.get(id=produto_id)  # Para mostrar nome no relatório
-    else:
-        produto = None
-    
-    if tipo:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
-    
-    if data_inicio:
-        try:
-            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=data_inicio)
-        except (ValueError, TypeError):
-            messages.warning(request, 'Formato de data inicial inválido')
-    
-    if data_fim:
-        try:
-            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
-            movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=data_fim)
-        except (ValueError, TypeError):
-            messages.warning(request, 'Formato de data final inválido')
-    
-    # Ordenar por data mais recente
-    movimentacoes = movimentacoes.order_by('-data_movimentacao')
-    
-    # Calcular estatísticas para o relatório
-    stats_entrada = movimentacoes.filter(tipo='E').aggregate(
-        total=Count('id'),
-        quantidade=Sum('quantidade'),
-        valor=Sum(F('quantidade') * F('produto__preco_custo'), output_field=models.DecimalField())
-    )
-    
-    stats_saida = movimentacoes.filter(tipo='S').aggregate(
-        total=Count('id'),
-        quantidade=Sum('quantidade'),
-        valor=Sum(F('quantidade') * F('produto__preco_venda'), output_field=models.DecimalField())
-    )
-    quantidade_total_saidas = movimentacoes.filter(tipo='S').aggregate(Sum('quantidade'))['quantidade__sum'] or 0
-    
-    # Produto mais movimentado
-    produto_mais_movimentado = movimentacoes.values('produto__nome').annotate(
-        total=Count('id')
-    ).order_by('-total').first()
-    
     context = {
-        'movimentacoes': movimentacoes,
-        'filtros_aplicados': {
-            'produto': Produto.objects.filter(id=produto_id).first() if produto_id else None,
-            'tipo': tipo,
-            'data_inicio': data_inicio,
-            'data_fim': data_fim,
-        },
-        'estatisticas': {
-            'total_registros': movimentacoes.count(),
-            'total_entradas': total_entradas,
-            'total_saidas': total_saidas,
-            'quantidade_entradas': quantidade_total_entradas,
-            'quantidade_saidas': quantidade_total_saidas,
-            'saldo_quantidade': quantidade_total_entradas - quantidade_total_saidas,
-            'produto_mais_movimentado': produto_mais_movimentado,
-        },
-        'gerado_em': now(),
-        'usuario': request.user,
+        'previsoes': page_obj,
+        'categorias': Categoria.objects.all(),
+        'categoria_selecionada': categoria_selecionada,
+        'so_ruptura': so_ruptura,
+        'ciclo_dias': settings.ESTOQUE_CICLO_COMPRA_DIAS,
+        'calculado_em': PrevisaoEstoque.objects.aggregate(ultimo=models.Max('calculado_em'))['ultimo'],
     }
-    
-    # Renderizar template HTML
-    html_string = render_to_string('estoque/relatorio_movimentacoes_pdf.html', context)
-    
-    # Configuração de fontes
-    font_config = FontConfiguration()
-    
-    # Gerar PDF
-    pdf_file = HTML(
-        string=html_string,
-        base_url=request.build_absolute_uri()
-    ).write_pdf(font_config=font_config)
-    
-    # Criar resposta
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    
-    # Nome do arquivo
-    filename = f"relatorio_movimentacoes_{now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
-
-def exportar_movimentacoes_csv(request):
-    # Lógica para gerar CSV
-    pass
\ No newline at end of file
+    return render(request, 'estoque/sugestao_compra.html', context)
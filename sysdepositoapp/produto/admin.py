@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Categoria, Produto
+from .models import Categoria, ContadorStatusEstoque, Produto
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -20,7 +20,7 @@ class ProdutoAdmin(admin.ModelAdmin):
         'status_estoque',
         'ativo'
     ]
-    list_filter = ['categoria', 'ativo', 'unidade_medida', 'data_criacao']
+    list_filter = ['categoria', 'status_estoque', 'ativo', 'unidade_medida', 'data_criacao']
     search_fields = ['nome', 'sku', 'codigo_barras']
     readonly_fields = ['data_criacao', 'data_atualizacao']
     fieldsets = [
@@ -42,6 +42,18 @@ class ProdutoAdmin(admin.ModelAdmin):
         }),
     ]
 
+    def get_readonly_fields(self, request, obj=None):
+        # Depois do cadastro o estoque só muda por movimentação ou ajuste (com compare-and-swap)
+        if obj is not None:
+            return [*self.readonly_fields, 'estoque_atual']
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Estoque e versão gravados agora, não os de quando o formulário foi carregado
+            obj.refresh_from_db(fields=['estoque_atual', 'versao'])
+        super().save_model(request, obj, form, change)
+
     def status_estoque(self, obj):
         status = obj.status_estoque
         if status == 'esgotado':
@@ -50,4 +62,10 @@ class ProdutoAdmin(admin.ModelAdmin):
             return '🟡 Baixo'
         else:
             return '🟢 Normal'
-    status_estoque.short_description = 'Status Estoque'
\ No newline at end of file
+    status_estoque.short_description = 'Status Estoque'
+
+@admin.register(ContadorStatusEstoque)
+class ContadorStatusEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['categoria', 'status', 'total']
+    list_filter = ['status']
+    readonly_fields = ['categoria', 'status', 'total']
@@ -0,0 +1,88 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
+from django.db.models.lookups import Exact, LessThanOrEqual
+
+from .models import ContadorStatusEstoque, Produto
+
+STATUS_ESTOQUE = [status for status, _ in Produto.STATUS_ESTOQUE_CHOICES]
+
+
+def expressao_status_estoque(estoque_atual=None, estoque_minimo=None):
+    """
+    Regra de Produto.calcular_status_estoque em SQL. Aceita expressões para o novo
+    estoque, para ser usada no próprio UPDATE (ex.: F('estoque_atual') + 5).
+    """
+    estoque_atual = F('estoque_atual') if estoque_atual is None else estoque_atual
+    estoque_minimo = F('estoque_minimo') if estoque_minimo is None else estoque_minimo
+    return Case(
+        When(Exact(estoque_atual, 0), then=Value('esgotado')),
+        When(LessThanOrEqual(estoque_atual, estoque_minimo), then=Value('baixo')),
+        default=Value('normal'),
+        output_field=CharField(),
+    )
+
+
+def ajustar_contadores(transicoes):
+    """
+    Aplica {(categoria_id, status): delta} na tabela de contadores com
+    UPDATE total = total + delta, criando as linhas que ainda não existem.
+    """
+    transicoes = {chave: delta for chave, delta in transicoes.items() if delta}
+    if not transicoes:
+        return
+
+    ContadorStatusEstoque.objects.bulk_create(
+        [ContadorStatusEstoque(categoria_id=categoria_id, status=status) for categoria_id, status in transicoes],
+        ignore_conflicts=True,
+    )
+    for (categoria_id, status), delta in transicoes.items():
+        ContadorStatusEstoque.objects.filter(categoria_id=categoria_id, status=status).update(
+            total=F('total') + delta
+        )
+
+
+def contagem_por_status(categoria=None):
+    """{'esgotado': n, 'baixo': n, 'normal': n, 'total': n} lido da tabela de contadores"""
+    contadores = ContadorStatusEstoque.objects.all()
+    if categoria is not None:
+        contadores = contadores.filter(categoria=categoria)
+
+    contagem = dict.fromkeys(STATUS_ESTOQUE, 0)
+    for status, total in contadores.values('status').annotate(soma=Sum('total')).values_list('status', 'soma'):
+        contagem[status] = total
+    contagem['total'] = sum(contagem[status] for status in STATUS_ESTOQUE)
+    return contagem
+
+
+def recalcular_status_estoque():
+    """
+    Reparo completo: regrava o status de todos os produtos a partir de
+    estoque_atual/estoque_minimo e reconstrói os contadores com um GROUP BY.
+    Retorna quantos produtos tinham o status divergente.
+    """
+    with transaction.atomic():
+        status_correto = expressao_status_estoque()
+        divergentes = Produto.objects.exclude(status_estoque=status_correto).update(status_estoque=status_correto)
+
+        ContadorStatusEstoque.objects.all().delete()
+        ContadorStatusEstoque.objects.bulk_create(
+            ContadorStatusEstoque(categoria_id=categoria_id, status=status, total=total)
+            for categoria_id, status, total in Produto.objects.order_by().values(
+                'categoria_id', 'status_estoque'
+            ).annotate(total=Count('pk')).values_list('categoria_id', 'status_estoque', 'total')
+        )
+    return divergentes
+
+
+def transicoes_de_status(linhas):
+    """
+    Conta as mudanças de contador a partir de (categoria_id, status_anterior, status_novo).
+    """
+    transicoes = Counter()
+    for categoria_id, anterior, novo in linhas:
+        if anterior != novo:
+            transicoes[(categoria_id, anterior)] -= 1
+            transicoes[(categoria_id, novo)] += 1
+    return transicoes
@@ -26,6 +26,12 @@ class ProdutoForm(forms.ModelForm):
             'sku': forms.TextInput(attrs={'placeholder': 'SKU único do produto. Ex: NOME-CATEGORIA-MARCA-1234'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            # Depois do cadastro o estoque só muda por movimentação ou ajuste (com compare-and-swap)
+            del self.fields['estoque_atual']
+
 class CategoriaForm(forms.ModelForm):
     class Meta:
         model = Categoria
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from produto.contadores import contagem_por_status, recalcular_status_estoque
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o status do estoque de todos os produtos e reconstrói os contadores por status/categoria'
+
+    def handle(self, *args, **options):
+        divergentes = recalcular_status_estoque()
+        contagem = contagem_por_status()
+
+        self.stdout.write(
+            f"{divergentes} produto(s) com status corrigido. "
+            f"Esgotados: {contagem['esgotado']} | Baixo: {contagem['baixo']} | Normal: {contagem['normal']}"
+        )
+        self.stdout.write(self.style.SUCCESS('Contadores reconstruídos.'))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:58
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Value, When
+
+
+def preencher_status_e_contadores(apps, schema_editor):
+    # Mesma regra de Produto.calcular_status_estoque, aplicada aos produtos existentes
+    Produto = apps.get_model('produto', 'Produto')
+    ContadorStatusEstoque = apps.get_model('produto', 'ContadorStatusEstoque')
+
+    Produto.objects.update(status_estoque=Case(
+        When(estoque_atual=0, then=Value('esgotado')),
+        When(estoque_atual__lte=F('estoque_minimo'), then=Value('baixo')),
+        default=Value('normal'),
+    ))
+    ContadorStatusEstoque.objects.bulk_create(
+        ContadorStatusEstoque(categoria_id=categoria_id, status=status, total=total)
+        for categoria_id, status, total in Produto.objects.order_by().values(
+            'categoria_id', 'status_estoque'
+        ).annotate(total=Count('pk')).values_list('categoria_id', 'status_estoque', 'total')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('produto', '0003_categoria_status_ativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorStatusEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('esgotado', 'Esgotado'), ('baixo', 'Baixo'), ('normal', 'Normal')], max_length=10)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de Status do Estoque',
+                'verbose_name_plural': 'Contadores de Status do Estoque',
+            },
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='status_estoque',
+            field=models.CharField(choices=[('esgotado', 'Esgotado'), ('baixo', 'Baixo'), ('normal', 'Normal')], default='esgotado', editable=False, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['status_estoque', 'estoque_atual'], name='produto_status_estoque_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['categoria', 'status_estoque'], name='produto_categoria_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='contadorstatusestoque',
+            name='categoria',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='produto.categoria'),
+        ),
+        migrations.AddConstraint(
+            model_name='contadorstatusestoque',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('categoria', 0), models.F('status'), name='contador_status_categoria_unico'),
+        ),
+        migrations.RunPython(preencher_status_e_contadores, migrations.RunPython.noop),
+    ]
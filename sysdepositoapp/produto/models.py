@@ -1,6 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
+
+class ConflitoEstoque(Exception):
+    """O estoque do produto mudou entre a leitura e a gravação (versão diferente da lida)"""
+
+
 class Categoria(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     descricao = models.TextField(blank=True, null=True)
@@ -32,6 +38,12 @@ class Produto(models.Model):
         ('PCT', 'Pacote'),
     ]
 
+    STATUS_ESTOQUE_CHOICES = [
+        ('esgotado', 'Esgotado'),
+        ('baixo', 'Baixo'),
+        ('normal', 'Normal'),
+    ]
+
     nome = models.CharField(max_length=200)
     descricao = models.TextField(blank=True, null=True)
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
@@ -44,6 +56,13 @@ class Produto(models.Model):
     estoque_atual = models.IntegerField(default=0)
     localizacao = models.CharField(max_length=100, blank=True, null=True, help_text='Localização no depósito')
     ativo = models.BooleanField(default=True)
+    # Derivado de estoque_atual/estoque_minimo e gravado para filtros e contagens por índice
+    status_estoque = models.CharField(
+        max_length=10, choices=STATUS_ESTOQUE_CHOICES, default='esgotado', editable=False
+    )
+    # Incrementada a cada alteração do estoque: ajustes e movimentações gravam com
+    # compare-and-swap (UPDATE ... WHERE versao = lida) em vez de travar o produto
+    versao = models.PositiveIntegerField(default=0, editable=False)
     data_criacao = models.DateTimeField(auto_now_add=True)
     data_atualizacao = models.DateTimeField(auto_now=True)
 
@@ -51,6 +70,10 @@ class Produto(models.Model):
         verbose_name = 'Produto'
         verbose_name_plural = 'Produtos'
         ordering = ['nome']
+        indexes = [
+            models.Index(fields=['status_estoque', 'estoque_atual'], name='produto_status_estoque_idx'),
+            models.Index(fields=['categoria', 'status_estoque'], name='produto_categoria_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nome} ({self.sku})"
@@ -75,12 +98,83 @@ class Produto(models.Model):
         """Verifica se o estoque está abaixo do mínimo"""
         return self.estoque_atual <= self.estoque_minimo
 
-    @property
-    def status_estoque(self):
-        """Retorna o status do estoque"""
-        if self.estoque_atual == 0:
+    @staticmethod
+    def calcular_status_estoque(estoque_atual, estoque_minimo):
+        """Regra do status do estoque (a mesma de produto.contadores.expressao_status_estoque)"""
+        if estoque_atual == 0:
             return 'esgotado'
-        elif self.estoque_baixo:
+        elif estoque_atual <= estoque_minimo:
             return 'baixo'
         else:
-            return 'normal'
\ No newline at end of file
+            return 'normal'
+
+    def save(self, *args, **kwargs):
+        """
+        Grava o status do estoque junto e mantém os contadores por status/categoria.
+        Levanta ConflitoEstoque se a gravação levaria estoque_atual (ou um status
+        calculado a partir dele) de uma versão que já não é a gravada.
+        """
+        from .contadores import ajustar_contadores
+
+        update_fields = kwargs.get('update_fields')
+        grava_estoque = update_fields is None or bool(set(update_fields) & {'estoque_atual', 'estoque_minimo'})
+        if grava_estoque:
+            self.status_estoque = self.calcular_status_estoque(self.estoque_atual, self.estoque_minimo)
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if update_fields & {'estoque_atual', 'estoque_minimo'}:
+                update_fields |= {'status_estoque', 'versao'}
+            kwargs['update_fields'] = update_fields
+            if not update_fields & {'status_estoque', 'categoria'}:
+                super().save(*args, **kwargs)
+                return
+
+        with transaction.atomic():
+            anterior = None
+            if not self._state.adding and self.pk:
+                gravado = type(self).objects.select_for_update().filter(pk=self.pk).values_list(
+                    'categoria_id', 'status_estoque', 'versao'
+                ).first()
+                if gravado:
+                    *anterior, versao = gravado
+                    anterior = tuple(anterior)
+                    if not grava_estoque:
+                        # O estoque em memória pode estar defasado: o status continua o gravado
+                        self.status_estoque = anterior[1]
+                    elif versao != self.versao:
+                        # Movimentações gravadas depois da leitura seriam sobrescritas
+                        raise ConflitoEstoque(
+                            f'O estoque de {self.nome} foi alterado por outra operação; '
+                            'recarregue o produto e tente novamente'
+                        )
+                    # Quem leu o estoque antes desta gravação perde o compare-and-swap
+                    self.versao = versao + 1
+
+            super().save(*args, **kwargs)
+
+            atual = (self.categoria_id, self.status_estoque)
+            if anterior != atual:
+                transicoes = {atual: 1}
+                if anterior:
+                    transicoes[anterior] = -1
+                ajustar_contadores(transicoes)
+
+
+class ContadorStatusEstoque(models.Model):
+    """Quantidade de produtos por categoria e status do estoque, mantida incrementalmente"""
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Produto.STATUS_ESTOQUE_CHOICES)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Contador de Status do Estoque'
+        verbose_name_plural = 'Contadores de Status do Estoque'
+        constraints = [
+            # Coalesce para que "sem categoria" (NULL) também seja único por status
+            models.UniqueConstraint(
+                Coalesce('categoria', 0), 'status', name='contador_status_categoria_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.categoria or 'Sem categoria'} - {self.get_status_display()}: {self.total}"
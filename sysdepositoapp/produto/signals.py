@@ -0,0 +1,23 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .contadores import ajustar_contadores
+from .models import Categoria, ContadorStatusEstoque, Produto
+
+
+@receiver(pre_delete, sender=Produto)
+def descontar_produto_excluido(sender, instance, **kwargs):
+    # Lê o status gravado: a instância em memória pode estar desatualizada
+    # (o estoque é alterado por UPDATE direto no banco)
+    gravado = Produto.objects.filter(pk=instance.pk).values_list('categoria_id', 'status_estoque').first()
+    if gravado:
+        ajustar_contadores({gravado: -1})
+
+
+@receiver(pre_delete, sender=Categoria)
+def mover_contadores_para_sem_categoria(sender, instance, **kwargs):
+    # Os produtos da categoria ficam sem categoria (SET_NULL via UPDATE, sem signals)
+    ajustar_contadores({
+        (None, status): total
+        for status, total in ContadorStatusEstoque.objects.filter(categoria=instance).values_list('status', 'total')
+    })
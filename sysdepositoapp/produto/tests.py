@@ -1,3 +1,96 @@
 from django.test import TestCase
 
-# Create your tests here.
+from estoque.services import aplicar_deltas
+from .contadores import contagem_por_status, recalcular_status_estoque
+from .forms import ProdutoForm
+from .models import Categoria, ContadorStatusEstoque, Produto
+
+
+class ContadorStatusEstoqueTest(TestCase):
+    """Os contadores mantidos a cada gravação batem com a recontagem completa"""
+
+    def setUp(self):
+        self.papelaria = Categoria.objects.create(nome='Papelaria')
+        self.limpeza = Categoria.objects.create(nome='Limpeza')
+
+    def contadores(self):
+        return {
+            (categoria_id, status): total
+            for categoria_id, status, total in ContadorStatusEstoque.objects.values_list('categoria_id', 'status', 'total')
+            if total
+        }
+
+    def assertBateComRecontagem(self, esperado):
+        mantidos = self.contadores()
+        self.assertEqual(mantidos, esperado)
+        self.assertEqual(recalcular_status_estoque(), 0)
+        self.assertEqual(self.contadores(), mantidos)
+
+    def test_criacao_e_edicao(self):
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001', categoria=self.papelaria,
+                                         estoque_atual=10, estoque_minimo=5)
+        self.assertEqual(produto.status_estoque, 'normal')
+        self.assertBateComRecontagem({(self.papelaria.pk, 'normal'): 1})
+
+        produto.estoque_atual = 3
+        produto.save()
+        self.assertBateComRecontagem({(self.papelaria.pk, 'baixo'): 1})
+
+        produto.estoque_minimo = 2
+        produto.save(update_fields=['estoque_minimo'])
+        self.assertBateComRecontagem({(self.papelaria.pk, 'normal'): 1})
+
+    def test_aplicar_deltas(self):
+        caderno = Produto.objects.create(nome='Caderno', sku='CAD-001', categoria=self.papelaria,
+                                         estoque_atual=10, estoque_minimo=5)
+        lapis = Produto.objects.create(nome='Lápis', sku='LAP-001', estoque_atual=1)
+
+        aplicar_deltas({caderno.pk: -10, lapis.pk: 20})
+        caderno.refresh_from_db()
+        self.assertEqual((caderno.estoque_atual, caderno.status_estoque), (0, 'esgotado'))
+        self.assertBateComRecontagem({(self.papelaria.pk, 'esgotado'): 1, (None, 'normal'): 1})
+
+        aplicar_deltas({caderno.pk: 4})
+        self.assertBateComRecontagem({(self.papelaria.pk, 'baixo'): 1, (None, 'normal'): 1})
+        self.assertEqual(contagem_por_status(), {'esgotado': 0, 'baixo': 1, 'normal': 1, 'total': 2})
+
+    def test_troca_de_categoria(self):
+        produto = Produto.objects.create(nome='Detergente', sku='DET-001', categoria=self.papelaria, estoque_atual=5)
+        produto.categoria = self.limpeza
+        produto.save()
+        self.assertBateComRecontagem({(self.limpeza.pk, 'normal'): 1})
+
+        produto.categoria = None
+        produto.save(update_fields=['categoria'])
+        self.assertBateComRecontagem({(None, 'normal'): 1})
+
+    def test_troca_de_categoria_com_estoque_defasado(self):
+        produto = Produto.objects.create(nome='Detergente', sku='DET-001', categoria=self.papelaria, estoque_atual=5)
+        aplicar_deltas({produto.pk: -5})
+
+        # Instância lida antes da baixa: ainda vê estoque 5 e status normal
+        produto.categoria = self.limpeza
+        produto.save(update_fields=['categoria'])
+        self.assertEqual(produto.status_estoque, 'esgotado')
+        self.assertBateComRecontagem({(self.limpeza.pk, 'esgotado'): 1})
+
+    def test_exclusao(self):
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001', categoria=self.papelaria, estoque_atual=5)
+        Produto.objects.create(nome='Lápis', sku='LAP-001', categoria=self.papelaria)
+        # Estoque alterado direto no banco: a exclusão desconta o status gravado
+        aplicar_deltas({produto.pk: -5})
+        produto.delete()
+        self.assertBateComRecontagem({(self.papelaria.pk, 'esgotado'): 1})
+
+    def test_exclusao_da_categoria(self):
+        Produto.objects.create(nome='Caderno', sku='CAD-001', categoria=self.papelaria, estoque_atual=5)
+        self.papelaria.delete()
+        self.assertBateComRecontagem({(None, 'normal'): 1})
+
+
+class ProdutoFormTest(TestCase):
+
+    def test_estoque_so_no_cadastro(self):
+        self.assertIn('estoque_atual', ProdutoForm().fields)
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001', estoque_atual=5)
+        self.assertNotIn('estoque_atual', ProdutoForm(instance=produto).fields)
@@ -2,7 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from .models import Produto, Categoria
+from .models import ConflitoEstoque, Produto, Categoria
 from .forms import ProdutoForm, CategoriaForm, ProdutoSearchForm
 
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
@@ -81,9 +81,16 @@ def produto_editar(request, pk):
     if request.method == 'POST':
         form = ProdutoForm(request.POST, instance=produto)
         if form.is_valid():
-            produto = form.save()
-            messages.success(request, f'Produto "{produto.nome}" atualizado com sucesso!')
-            return redirect('produto:produto_detalhe', pk=produto.pk)
+            try:
+                produto = form.save()
+            except ConflitoEstoque as erro:
+                # Estoque movimentado durante a edição: reenviar grava sobre o produto atualizado
+                messages.error(request, str(erro))
+                produto.refresh_from_db()
+                form = ProdutoForm(request.POST, instance=produto)
+            else:
+                messages.success(request, f'Produto "{produto.nome}" atualizado com sucesso!')
+                return redirect('produto:produto_detalhe', pk=produto.pk)
     else:
         form = ProdutoForm(instance=produto)
     
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import TarefaRelatorio
+
+@admin.register(TarefaRelatorio)
+class TarefaRelatorioAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'status', 'usuario', 'tentativas', 'data_criacao', 'data_conclusao']
+    list_filter = ['status', 'tipo', 'data_criacao']
+    search_fields = ['nome_arquivo', 'usuario__username']
+    readonly_fields = ['data_criacao', 'data_inicio', 'data_conclusao', 'tentativas', 'erro']
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse
+from django.template.loader import render_to_string
+
+from .pdf import assinatura_estilos, estilos_do_template, renderizar_template_pdf
+
+# Incrementar quando algo fora do HTML e do CSS mudar o PDF (fontes, versão do WeasyPrint)
+VERSAO = '1'
+
+
+def diretorio():
+    return Path(settings.RELATORIOS_CACHE_PDF_DIR)
+
+
+def chave_do_html(template, context):
+    """
+    Hash do HTML renderizado, sem a data de geração: o mesmo conteúdo sempre gera
+    a mesma chave, e qualquer alteração no objeto (ou no template/CSS) gera outra.
+    """
+    html_string = render_to_string(template, dict(context, gerado_em=None))
+    estilos = assinatura_estilos(estilos_do_template(template))
+    return hashlib.sha256(f'{VERSAO}:{template}:{estilos}:{html_string}'.encode()).hexdigest()
+
+
+def caminho(chave):
+    return diretorio() / chave[:2] / f'{chave}.pdf'
+
+
+def obter(chave):
+    """Caminho do PDF em cache (ou None); o acesso atualiza o mtime usado no LRU"""
+    arquivo = caminho(chave)
+    try:
+        os.utime(arquivo)
+    except FileNotFoundError:
+        return None
+    return arquivo
+
+
+def gravar(chave, conteudo):
+    """Grava o PDF de forma atômica e poda o cache se passar do limite"""
+    arquivo = caminho(chave)
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temporario = tempfile.mkstemp(dir=arquivo.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(conteudo)
+    os.replace(temporario, arquivo)
+
+    podar()
+    return arquivo
+
+
+def podar(limite=None):
+    """
+    Remove os PDFs acessados há mais tempo até o cache caber no limite (em bytes).
+    Retorna (arquivos_removidos, bytes_restantes).
+    """
+    if limite is None:
+        limite = settings.RELATORIOS_CACHE_PDF_MAX_BYTES
+
+    arquivos = []
+    for arquivo in diretorio().glob('*/*.pdf'):
+        try:
+            info = arquivo.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((info.st_mtime, info.st_size, arquivo))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    removidos = 0
+    for _, tamanho, arquivo in sorted(arquivos):
+        if total <= limite:
+            break
+        arquivo.unlink(missing_ok=True)
+        total -= tamanho
+        removidos += 1
+    return removidos, total
+
+
+def limpar():
+    """Esvazia o cache"""
+    return podar(0)
+
+
+def renderizar_com_cache(template, context, base_url=None, **opcoes):
+    """Devolve os bytes do PDF, renderizando com o WeasyPrint só quando não houver cache"""
+    chave = chave_do_html(template, context)
+    arquivo = obter(chave)
+    if arquivo is not None:
+        try:
+            return arquivo.read_bytes()
+        except FileNotFoundError:
+            pass
+
+    conteudo = renderizar_template_pdf(template, context, base_url, **opcoes)
+    gravar(chave, conteudo)
+    return conteudo
+
+
+def resposta_em_cache(template, context, filename, as_attachment=False):
+    """FileResponse com o PDF já gerado para este conteúdo, ou None se não houver cache"""
+    arquivo = obter(chave_do_html(template, context))
+    if arquivo is None:
+        return None
+    try:
+        pdf = open(arquivo, 'rb')
+    except FileNotFoundError:
+        # Podado entre a consulta e a abertura
+        return None
+    return FileResponse(pdf, as_attachment=as_attachment, filename=filename, content_type='application/pdf')
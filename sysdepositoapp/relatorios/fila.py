@@ -0,0 +1,136 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.files.base import ContentFile
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThan
+from django.shortcuts import redirect
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TarefaRelatorio
+
+logger = logging.getLogger(__name__)
+
+# Cada tipo de tarefa aponta para a função que gera o PDF: f(parametros, usuario) -> (nome, bytes)
+RENDERIZADORES = {
+    'movimentacoes': 'estoque.pdf.pdf_movimentacoes',
+    'relatorio_movimentacoes': 'estoque.pdf.pdf_relatorio_movimentacoes',
+    'movimentacao': 'estoque.pdf.pdf_movimentacao',
+    'entrega': 'entrega.pdf.pdf_entrega',
+}
+
+ATIVAS = ('pendente', 'processando')
+
+
+class LimiteFilaExcedido(Exception):
+    pass
+
+
+def enfileirar(tipo, parametros, usuario=None):
+    """
+    Cria a tarefa na fila. Um pedido idêntico ainda em andamento é reaproveitado,
+    e cada usuário tem um limite de tarefas ativas para conter rajadas de relatórios.
+    """
+    if tipo not in RENDERIZADORES:
+        raise ValueError(f'Tipo de relatório desconhecido: {tipo}')
+
+    ativas = TarefaRelatorio.objects.filter(usuario=usuario, status__in=ATIVAS)
+    existente = ativas.filter(tipo=tipo, parametros=parametros).first()
+    if existente:
+        return existente
+
+    if ativas.count() >= settings.RELATORIOS_MAX_PENDENTES_POR_USUARIO:
+        raise LimiteFilaExcedido(
+            'Você já tem relatórios em processamento. Aguarde a conclusão antes de pedir outros.'
+        )
+    return TarefaRelatorio.objects.create(tipo=tipo, parametros=parametros, usuario=usuario)
+
+
+def enfileirar_pdf(request, tipo, parametros):
+    """Enfileira o PDF pedido na view e redireciona para a página de acompanhamento"""
+    parametros = dict(parametros, base_url=request.build_absolute_uri('/'))
+    try:
+        tarefa = enfileirar(tipo, parametros, request.user)
+    except LimiteFilaExcedido as e:
+        messages.warning(request, str(e))
+        return redirect('relatorios:lista_tarefas')
+    return redirect('relatorios:detalhe_tarefa', pk=tarefa.pk)
+
+
+def liberar_travadas():
+    """
+    Devolve à fila tarefas cujo worker morreu no meio do processamento. Quem já foi
+    reservada RELATORIOS_MAX_TENTATIVAS vezes (provavelmente derruba o worker) fica com erro.
+    """
+    agora = timezone.now()
+    travadas = TarefaRelatorio.objects.filter(
+        status='processando',
+        data_inicio__lt=agora - timedelta(seconds=settings.RELATORIOS_TEMPO_MAXIMO_PROCESSAMENTO),
+    )
+    esgotadas = travadas.filter(tentativas__gte=settings.RELATORIOS_MAX_TENTATIVAS).update(
+        status='erro',
+        erro=f'Processamento interrompido em {settings.RELATORIOS_MAX_TENTATIVAS} tentativas.',
+        data_conclusao=agora,
+    )
+    if esgotadas:
+        logger.error(f'{esgotadas} tarefa(s) de relatório marcada(s) com erro após esgotar as tentativas')
+    return travadas.update(status='pendente', data_inicio=None)
+
+
+def _abaixo_do_limite():
+    # Contagem de tarefas em processamento dentro do próprio UPDATE da reserva: o SQLite
+    # serializa as escritas, então dois workers não passam juntos pelo limite
+    em_processamento = TarefaRelatorio.objects.filter(status='processando').order_by().values('status').annotate(
+        total=Count('pk')
+    ).values('total')
+    return LessThan(Coalesce(Subquery(em_processamento), 0), settings.RELATORIOS_MAX_SIMULTANEOS)
+
+
+def reservar_proxima():
+    """
+    Reserva a tarefa pendente mais antiga com um UPDATE condicional (status='pendente'
+    e menos de RELATORIOS_MAX_SIMULTANEOS em processamento), sem travar a tabela.
+    """
+    liberar_travadas()
+
+    for _ in range(5):
+        candidata = TarefaRelatorio.objects.filter(status='pendente').order_by('data_criacao', 'pk').first()
+        if candidata is None:
+            return None
+
+        reservada = TarefaRelatorio.objects.filter(_abaixo_do_limite(), pk=candidata.pk, status='pendente').update(
+            status='processando',
+            data_inicio=timezone.now(),
+            tentativas=F('tentativas') + 1,
+        )
+        if reservada:
+            candidata.refresh_from_db()
+            return candidata
+        if TarefaRelatorio.objects.filter(status='processando').count() >= settings.RELATORIOS_MAX_SIMULTANEOS:
+            return None
+        # Outro worker pegou a mesma tarefa; tenta a próxima
+    return None
+
+
+def executar(tarefa):
+    """Gera o PDF da tarefa e grava o arquivo; erros ficam registrados na própria tarefa"""
+    try:
+        renderizador = import_string(RENDERIZADORES[tarefa.tipo])
+        nome, conteudo = renderizador(tarefa.parametros, tarefa.usuario)
+
+        tarefa.nome_arquivo = nome
+        tarefa.arquivo.save(nome, ContentFile(conteudo), save=False)
+        tarefa.status = 'concluida'
+        tarefa.erro = None
+    except Exception as e:
+        logger.error(f'Erro ao gerar relatório {tarefa.pk}: {str(e)}', exc_info=True)
+        tarefa.status = 'erro'
+        tarefa.erro = str(e)
+
+    tarefa.data_conclusao = timezone.now()
+    tarefa.save()
+    return tarefa
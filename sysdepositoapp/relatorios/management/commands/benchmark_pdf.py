@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from weasyprint import HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from relatorios.pdf import _converter, caminho_estilo, estilos_do_template
+
+# Documento pequeno (um comprovante de uma página), onde o custo fixo de preparação mais aparece
+HTML_EXEMPLO = '''
+<html><body>
+    <div class="header"><h1>Comprovante</h1><p class="subtitle">Pedido 202501010001</p></div>
+    <table>{linhas}</table>
+</body></html>
+'''
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência por documento com e sem o contexto de renderização pré-carregado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=20, help='PDFs gerados em cada cenário')
+        parser.add_argument('--template', default='entrega/entrega_pdf.html', help='Template cuja folha de estilo será usada')
+        parser.add_argument('--linhas', type=int, default=10, help='Linhas de tabela no documento de exemplo')
+
+    def handle(self, *args, **options):
+        estilos = estilos_do_template(options['template'])
+        html_string = HTML_EXEMPLO.format(
+            linhas=''.join(f'<tr><td>Item {i}</td><td>{i} un</td></tr>' for i in range(options['linhas']))
+        )
+        caminhos_css = tuple(caminho_estilo(nome) for nome in estilos)
+        css_textos = [open(caminho, encoding='utf-8').read() for caminho in caminhos_css]
+
+        def frio():
+            # Como era antes: fontes e CSS preparados do zero a cada documento
+            font_config = FontConfiguration()
+            html = '<style>' + ''.join(css_textos) + '</style>' + html_string
+            HTML(string=html).write_pdf(font_config=font_config)
+
+        def quente():
+            # A conversão usada pelo pool, chamada aqui mesmo: a medida não inclui o envio
+            # para o processo do pool, só o ganho do contexto pré-carregado
+            _converter([html_string], None, caminhos_css, {})
+
+        quente()  # aquece o cache do processo antes de medir
+        resultados = [('sem contexto pré-carregado', self._medir(frio, options['documentos'])),
+                      ('com contexto pré-carregado', self._medir(quente, options['documentos']))]
+
+        for nome, (media, minimo) in resultados:
+            self.stdout.write(f'{nome:>28}: média {media * 1000:8.1f} ms/doc | mínimo {minimo * 1000:8.1f} ms')
+
+        antes, depois = resultados[0][1][0], resultados[1][1][0]
+        if depois:
+            self.stdout.write(self.style.SUCCESS(f'Ganho: {antes / depois:.1f}x por documento'))
+
+    def _medir(self, funcao, vezes):
+        tempos = []
+        for _ in range(vezes):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+        return sum(tempos) / len(tempos), min(tempos)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from relatorios.fila import executar, reservar_proxima
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de relatórios em PDF fora das requisições web'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Processa o que houver na fila e encerra')
+        parser.add_argument('--max-tarefas', type=int, default=0, help='Encerra após N tarefas (0 = sem limite)')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera com a fila vazia')
+
+    def handle(self, *args, **options):
+        processadas = 0
+        while True:
+            close_old_connections()
+            tarefa = reservar_proxima()
+
+            if tarefa is None:
+                if options['once']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            tarefa = executar(tarefa)
+            processadas += 1
+            self.stdout.write(f'Tarefa {tarefa.pk} ({tarefa.tipo}): {tarefa.get_status_display()}')
+
+            if options['max_tarefas'] and processadas >= options['max_tarefas']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'{processadas} tarefa(s) processada(s).'))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from relatorios.cache_pdf import diretorio, limpar, podar
+
+
+class Command(BaseCommand):
+    help = 'Remove PDFs do cache em disco (os menos usados primeiro, ou todos com --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Esvazia o cache inteiro')
+        parser.add_argument(
+            '--max-mb', type=float,
+            help='Tamanho máximo a manter, em MB (padrão: RELATORIOS_CACHE_PDF_MAX_BYTES)'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            removidos, restante = limpar()
+        else:
+            limite = settings.RELATORIOS_CACHE_PDF_MAX_BYTES
+            if options['max_mb'] is not None:
+                limite = int(options['max_mb'] * 1024 * 1024)
+            removidos, restante = podar(limite)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{removidos} PDF(s) removido(s) de {diretorio()}; {restante / (1024 * 1024):.1f} MB em cache.'
+        ))
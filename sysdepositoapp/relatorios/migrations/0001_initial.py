@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('movimentacoes', 'Movimentações de Estoque'), ('relatorio_movimentacoes', 'Relatório de Movimentações'), ('movimentacao', 'Comprovante de Movimentação'), ('entrega', 'Comprovante de Entrega')], max_length=30)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Na Fila'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('arquivo', models.FileField(blank=True, upload_to='relatorios/%Y/%m/')),
+                ('nome_arquivo', models.CharField(blank=True, max_length=200)),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_inicio', models.DateTimeField(blank=True, null=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Relatório',
+                'verbose_name_plural': 'Tarefas de Relatório',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'data_criacao'], name='tarefa_status_criacao_idx'), models.Index(fields=['usuario', 'status'], name='tarefa_usuario_status_idx')],
+            },
+        ),
+    ]
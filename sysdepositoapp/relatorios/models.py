@@ -0,0 +1,47 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+
+class TarefaRelatorio(models.Model):
+    """Pedido de geração de PDF processado fora da requisição pelo worker"""
+    TIPO_CHOICES = [
+        ('movimentacoes', 'Movimentações de Estoque'),
+        ('relatorio_movimentacoes', 'Relatório de Movimentações'),
+        ('movimentacao', 'Comprovante de Movimentação'),
+        ('entrega', 'Comprovante de Entrega'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pendente', 'Na Fila'),
+        ('processando', 'Processando'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    parametros = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    arquivo = models.FileField(upload_to='relatorios/%Y/%m/', blank=True)
+    nome_arquivo = models.CharField(max_length=200, blank=True)
+    erro = models.TextField(blank=True, null=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Tarefa de Relatório'
+        verbose_name_plural = 'Tarefas de Relatório'
+        ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'data_criacao'], name='tarefa_status_criacao_idx'),
+            models.Index(fields=['usuario', 'status'], name='tarefa_usuario_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} - {self.get_status_display()}"
+
+    @property
+    def finalizada(self):
+        return self.status in ('concluida', 'erro')
@@ -0,0 +1,250 @@
+import hashlib
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+# Configuração de fontes e folhas de estilo são montadas uma vez por processo e
+# reaproveitadas em todos os PDFs; antes cada documento refazia esse trabalho.
+#
+# O layout do WeasyPrint é CPU-bound e segura o GIL, então a conversão HTML -> PDF
+# roda num pool de processos separado; a renderização do template continua aqui.
+
+
+class ErroRenderizacaoPDF(Exception):
+    pass
+
+
+class TempoEsgotado(Exception):
+    """Levantada dentro do processo do pool quando a conversão passa do tempo limite"""
+
+
+@lru_cache(maxsize=None)
+def configuracao_fontes():
+    return FontConfiguration()
+
+
+@lru_cache(maxsize=None)
+def caminho_estilo(nome):
+    # Os .css ficam ao lado dos templates, em RELATORIOS_PDF_ESTILOS_DIR
+    caminho = os.path.join(settings.RELATORIOS_PDF_ESTILOS_DIR, nome)
+    if not os.path.isfile(caminho):
+        raise ErroRenderizacaoPDF(f'Folha de estilo não encontrada: {nome}')
+    return caminho
+
+
+@lru_cache(maxsize=None)
+def folha_de_estilo(caminho):
+    """CSS já interpretado pelo WeasyPrint, a partir do caminho do arquivo"""
+    return CSS(filename=caminho, font_config=configuracao_fontes())
+
+
+@lru_cache(maxsize=None)
+def assinatura_estilos(estilos):
+    """Hash do conteúdo das folhas de estilo, para compor a chave do cache de PDFs"""
+    h = hashlib.sha256()
+    for nome in estilos:
+        with open(caminho_estilo(nome), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def estilos_do_template(template):
+    """'estoque/movimentacao_pdf.html' -> ('estoque/movimentacao_pdf.css',)"""
+    return (template.rsplit('.', 1)[0] + '.css',)
+
+
+def _converter(partes, base_url, caminhos_css, opcoes):
+    # Executada dentro do processo do pool: não depende do Django, só do WeasyPrint.
+    # `partes` pode ser um gerador: cada parte é diagramada antes da próxima ser lida,
+    # e do documento diagramado só as páginas prontas são mantidas até a gravação.
+    stylesheets = [folha_de_estilo(caminho) for caminho in caminhos_css]
+    primeiro, paginas = None, []
+    for html_string in partes:
+        documento = HTML(string=html_string, base_url=base_url).render(
+            stylesheets=stylesheets, font_config=configuracao_fontes(), **opcoes
+        )
+        html_string = None
+        paginas.extend(documento.pages)
+        if primeiro is None:
+            # Metadados do PDF vêm do primeiro documento
+            primeiro = documento
+        documento = None
+    if primeiro is None:
+        raise ErroRenderizacaoPDF('Nenhum conteúdo para gerar o PDF')
+    return primeiro.copy(paginas).write_pdf(**opcoes)
+
+
+def _ler_partes(caminhos):
+    # Uma parte em memória por vez; o arquivo sai do disco assim que é lido
+    for caminho in caminhos:
+        with open(caminho, encoding='utf-8') as f:
+            html_string = f.read()
+        os.remove(caminho)
+        yield html_string
+
+
+def _converter_arquivos(caminhos, base_url, caminhos_css, opcoes):
+    return _converter(_ler_partes(caminhos), base_url, caminhos_css, opcoes)
+
+
+def _gravar_partes(partes, diretorio):
+    caminhos = []
+    for i, html_string in enumerate(partes):
+        caminho = os.path.join(diretorio, f'parte_{i:05d}.html')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write(html_string)
+        caminhos.append(caminho)
+    return caminhos
+
+
+FOLGA_TEMPO_LIMITE = 30  # segundos além do limite antes de dar o processo do pool como travado
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.RELATORIOS_PDF_PROCESSOS,
+                # Recicla cada processo após N PDFs para limitar o crescimento de memória
+                max_tasks_per_child=settings.RELATORIOS_PDF_TAREFAS_POR_PROCESSO,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Abandona um pool travado ou quebrado; o próximo PDF cria outro"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _interromper(signum, frame):
+    raise TempoEsgotado()
+
+
+def _com_tempo_limite(limite, funcao, *argumentos):
+    # Executada no processo do pool: o alarme interrompe a própria conversão, e o
+    # processo continua disponível para o próximo PDF (sem SIGALRM, roda sem limite)
+    if not hasattr(signal, 'setitimer'):
+        return funcao(*argumentos)
+    anterior = signal.signal(signal.SIGALRM, _interromper)
+    signal.setitimer(signal.ITIMER_REAL, limite)
+    try:
+        return funcao(*argumentos)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, anterior)
+
+
+def renderizar_pdf(html_string, base_url=None, estilos=(), **opcoes):
+    """
+    Converte o HTML renderizado em bytes de PDF. Ponto único usado pelas views e pelo
+    worker da fila; com RELATORIOS_PDF_PROCESSOS = 0 a conversão roda no próprio processo.
+    """
+    caminhos_css = tuple(caminho_estilo(nome) for nome in estilos)
+    return _executar(_converter, [html_string], base_url, caminhos_css, opcoes)
+
+
+def renderizar_pdf_partes(partes, base_url=None, estilos=(), **opcoes):
+    """
+    Como renderizar_pdf, mas une as páginas de vários documentos HTML em um só PDF.
+    `partes` é consumido uma parte por vez e pode ser um gerador.
+    """
+    caminhos_css = tuple(caminho_estilo(nome) for nome in estilos)
+    if not settings.RELATORIOS_PDF_PROCESSOS:
+        return _converter(partes, base_url, caminhos_css, opcoes)
+
+    # Um gerador não atravessa para o processo do pool: cada parte vai para um arquivo
+    # temporário assim que é renderizada, e o processo do pool lê uma de cada vez
+    with tempfile.TemporaryDirectory(prefix='pdf_partes_') as diretorio:
+        caminhos = _gravar_partes(partes, diretorio)
+        return _executar(_converter_arquivos, caminhos, base_url, caminhos_css, opcoes)
+
+
+def _executar(funcao, *argumentos):
+    if not settings.RELATORIOS_PDF_PROCESSOS:
+        return funcao(*argumentos)
+
+    limite = settings.RELATORIOS_PDF_TEMPO_LIMITE
+    pool = _obter_pool()
+    try:
+        futuro = pool.submit(_com_tempo_limite, limite, funcao, *argumentos)
+        # A folga cobre a espera na fila do pool; passado dela o processo não respondeu
+        # nem ao alarme, e o pool é abandonado
+        return futuro.result(timeout=limite + FOLGA_TEMPO_LIMITE)
+    except TempoEsgotado:
+        raise ErroRenderizacaoPDF(f'A geração do PDF excedeu {limite} segundos')
+    except FuturesTimeoutError:
+        _descartar_pool(pool)
+        raise ErroRenderizacaoPDF(f'A geração do PDF excedeu {limite} segundos')
+    except BrokenProcessPool:
+        _descartar_pool(pool)
+        raise ErroRenderizacaoPDF('O processo de geração do PDF foi encerrado inesperadamente')
+
+
+def renderizar_template_pdf(template, context, base_url=None, **opcoes):
+    """Renderiza o template e gera o PDF com a folha de estilo que fica ao lado dele"""
+    return renderizar_pdf(
+        render_to_string(template, context), base_url, estilos=estilos_do_template(template), **opcoes
+    )
+
+
+def _em_blocos(linhas, tamanho):
+    linhas = iter(linhas)
+    while True:
+        bloco = list(islice(linhas, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+
+def renderizar_relatorio_em_blocos(template, template_continuacao, context, queryset, total,
+                                   nome_linhas='movimentacoes', base_url=None, **opcoes):
+    """
+    Relatórios com muitas linhas: o queryset é lido e renderizado em blocos de
+    RELATORIOS_PDF_LINHAS_POR_BLOCO linhas, cada bloco é diagramado separadamente e as
+    páginas são unidas em um único PDF. Acima de RELATORIOS_PDF_MAX_LINHAS o relatório
+    é truncado e o template principal recebe `truncado` para exibir o aviso.
+    """
+    limite = settings.RELATORIOS_PDF_MAX_LINHAS
+    tamanho = settings.RELATORIOS_PDF_LINHAS_POR_BLOCO
+    context = dict(context, truncado=total > limite, limite_linhas=limite, total_registros=total)
+    total_linhas = min(total, limite)
+
+    def partes():
+        # Gerador: só o bloco da vez fica em memória, como HTML, enquanto é diagramado
+        blocos = _em_blocos(queryset[:limite].iterator(chunk_size=tamanho), tamanho)
+        primeiro = next(blocos, [])
+        yield render_to_string(template, dict(context, **{nome_linhas: primeiro}))
+
+        renderizadas = len(primeiro)
+        for bloco in blocos:
+            yield render_to_string(template_continuacao, dict(
+                context,
+                primeira_linha=renderizadas + 1,
+                ultima_linha=renderizadas + len(bloco),
+                total_linhas=total_linhas,
+                **{nome_linhas: bloco}
+            ))
+            renderizadas += len(bloco)
+
+    return renderizar_pdf_partes(partes(), base_url, estilos_do_template(template), **opcoes)
@@ -0,0 +1,212 @@
+import os
+import shutil
+import signal
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from estoque.models import MovimentacaoEstoque
+from estoque.pdf import TEMPLATE_MOVIMENTACAO, contexto_movimentacao
+from produto.models import Produto
+from . import cache_pdf, pdf
+from .fila import LimiteFilaExcedido, enfileirar, liberar_travadas, reservar_proxima
+from .models import TarefaRelatorio
+
+
+@override_settings(RELATORIOS_MAX_SIMULTANEOS=2, RELATORIOS_MAX_PENDENTES_POR_USUARIO=3, RELATORIOS_MAX_TENTATIVAS=3)
+class FilaRelatoriosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('relatorios', password='senha')
+
+    def enfileirar(self, n):
+        return [enfileirar('movimentacao', {'movimentacao_id': i}, self.usuario) for i in range(n)]
+
+    def test_pedido_identico_reaproveitado(self):
+        tarefa = enfileirar('movimentacao', {'movimentacao_id': 1}, self.usuario)
+        self.assertEqual(enfileirar('movimentacao', {'movimentacao_id': 1}, self.usuario), tarefa)
+        self.assertEqual(TarefaRelatorio.objects.count(), 1)
+
+    def test_limite_por_usuario(self):
+        self.enfileirar(3)
+        with self.assertRaises(LimiteFilaExcedido):
+            enfileirar('movimentacao', {'movimentacao_id': 99}, self.usuario)
+
+    def test_reserva_em_ordem_e_respeita_limite_simultaneo(self):
+        primeira, segunda, _terceira = self.enfileirar(3)
+        self.assertEqual(reservar_proxima(), primeira)
+        self.assertEqual(reservar_proxima(), segunda)
+        self.assertIsNone(reservar_proxima())
+        self.assertEqual(TarefaRelatorio.objects.filter(status='processando').count(), 2)
+
+        TarefaRelatorio.objects.filter(pk=primeira.pk).update(status='concluida')
+        self.assertEqual(reservar_proxima().status, 'processando')
+
+    def test_travada_volta_para_a_fila(self):
+        tarefa, = self.enfileirar(1)
+        reservar_proxima()
+        TarefaRelatorio.objects.filter(pk=tarefa.pk).update(data_inicio=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(liberar_travadas(), 1)
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas), ('pendente', 1))
+
+    def test_travada_esgota_tentativas(self):
+        tarefa, = self.enfileirar(1)
+        for _ in range(3):
+            self.assertEqual(reservar_proxima(), tarefa)
+            TarefaRelatorio.objects.filter(pk=tarefa.pk).update(data_inicio=timezone.now() - timedelta(hours=1))
+
+        self.assertIsNone(reservar_proxima())
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas), ('erro', 3))
+        self.assertIsNotNone(tarefa.data_conclusao)
+
+
+class PDFEmPartesTest(SimpleTestCase):
+    """Partes de um PDF grande são diagramadas uma de cada vez, sem acumular o HTML"""
+
+    def setUp(self):
+        self.eventos = []
+        eventos = self.eventos
+
+        class HTMLFalso:
+            def __init__(self, string, base_url=None):
+                self.string = string
+
+            def render(self, **opcoes):
+                eventos.append(('diagramada', self.string))
+                return mock.Mock(pages=[f'página de {self.string}'])
+
+        html = mock.patch.object(pdf, 'HTML', HTMLFalso)
+        html.start()
+        self.addCleanup(html.stop)
+
+    def partes(self, n):
+        for i in range(n):
+            self.eventos.append(('lida', i))
+            yield f'parte {i}'
+
+    def test_gerador_consumido_parte_a_parte(self):
+        pdf._converter(self.partes(3), None, (), {})
+        self.assertEqual(self.eventos, [
+            ('lida', 0), ('diagramada', 'parte 0'),
+            ('lida', 1), ('diagramada', 'parte 1'),
+            ('lida', 2), ('diagramada', 'parte 2'),
+        ])
+
+    def test_paginas_unidas_no_primeiro_documento(self):
+        documentos = []
+        render = pdf.HTML.render
+
+        def guardar(html, **opcoes):
+            documentos.append(render(html, **opcoes))
+            return documentos[-1]
+
+        with mock.patch.object(pdf.HTML, 'render', guardar):
+            pdf._converter(['a', 'b'], None, (), {})
+        documentos[0].copy.assert_called_once_with(['página de a', 'página de b'])
+        documentos[1].copy.assert_not_called()
+
+    def test_partes_do_pool_lidas_de_arquivos(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminhos = pdf._gravar_partes(self.partes(2), diretorio)
+            self.eventos.clear()
+            pdf._converter_arquivos(caminhos, None, (), {})
+            self.assertEqual(os.listdir(diretorio), [])
+        self.assertEqual(self.eventos, [('diagramada', 'parte 0'), ('diagramada', 'parte 1')])
+
+    def test_sem_partes(self):
+        with self.assertRaises(pdf.ErroRenderizacaoPDF):
+            pdf._converter(iter(()), None, (), {})
+
+
+class CaminhoEstiloTest(SimpleTestCase):
+
+    def setUp(self):
+        pdf.caminho_estilo.cache_clear()
+        self.addCleanup(pdf.caminho_estilo.cache_clear)
+
+    def test_folha_ao_lado_do_template(self):
+        caminho = pdf.caminho_estilo('entrega/entrega_pdf.css')
+        self.assertEqual(caminho, os.path.join(settings.RELATORIOS_PDF_ESTILOS_DIR, 'entrega/entrega_pdf.css'))
+        self.assertTrue(os.path.isfile(caminho))
+
+    def test_folha_inexistente(self):
+        with self.assertRaises(pdf.ErroRenderizacaoPDF):
+            pdf.caminho_estilo('entrega/nao_existe.css')
+
+
+@skipUnless(hasattr(signal, 'setitimer'), 'o tempo limite no processo do pool usa SIGALRM')
+class TempoLimiteTest(SimpleTestCase):
+    """O tempo limite é aplicado dentro do processo que converte, e o alarme não fica armado"""
+
+    def test_interrompe_a_conversao(self):
+        with self.assertRaises(pdf.TempoEsgotado):
+            pdf._com_tempo_limite(0.05, time.sleep, 2)
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+
+    def test_devolve_o_resultado(self):
+        self.assertEqual(pdf._com_tempo_limite(5, sum, [1, 2]), 3)
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+
+
+class CachePDFTest(TestCase):
+    """Chave pelo conteúdo do PDF e poda pelos menos acessados"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        estilos = os.path.join(diretorio.name, 'estilos')
+        shutil.copytree(settings.RELATORIOS_PDF_ESTILOS_DIR, estilos)
+        self.css = os.path.join(estilos, 'estoque', 'movimentacao_pdf.css')
+        configuracao = override_settings(
+            RELATORIOS_CACHE_PDF_DIR=os.path.join(diretorio.name, 'cache'), RELATORIOS_PDF_ESTILOS_DIR=estilos
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.limpar_estilos()
+        self.addCleanup(self.limpar_estilos)
+
+        produto = Produto.objects.create(nome='Caderno', sku='CAD-001')
+        self.movimentacao = MovimentacaoEstoque.objects.create(produto=produto, tipo='E', quantidade=5)
+
+    def limpar_estilos(self):
+        pdf.caminho_estilo.cache_clear()
+        pdf.assinatura_estilos.cache_clear()
+
+    def chave(self, gerado_em=None):
+        return cache_pdf.chave_do_html(TEMPLATE_MOVIMENTACAO, contexto_movimentacao(self.movimentacao, gerado_em))
+
+    def test_chave_ignora_data_de_geracao(self):
+        chave = self.chave(timezone.now())
+        self.assertEqual(self.chave(timezone.now() - timedelta(days=3)), chave)
+
+        self.movimentacao.quantidade = 6
+        self.assertNotEqual(self.chave(), chave)
+
+    def test_chave_muda_com_a_folha_de_estilo(self):
+        chave = self.chave()
+        with open(self.css, 'a', encoding='utf-8') as f:
+            f.write('\nbody { margin: 0; }\n')
+        self.limpar_estilos()
+        self.assertNotEqual(self.chave(), chave)
+
+    def test_poda_os_menos_acessados(self):
+        for i, chave in enumerate(('aa01', 'bb02', 'cc03')):
+            arquivo = cache_pdf.gravar(chave, b'x' * 100)
+            os.utime(arquivo, (1000 + i, 1000 + i))
+        cache_pdf.obter('aa01')  # acesso recente: passa a ser o mais novo
+
+        self.assertEqual(cache_pdf.podar(250), (1, 200))
+        self.assertIsNone(cache_pdf.obter('bb02'))
+        self.assertIsNotNone(cache_pdf.obter('aa01'))
+        self.assertIsNotNone(cache_pdf.obter('cc03'))
+        self.assertEqual(cache_pdf.limpar(), (2, 0))
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+app_name = 'relatorios'
+
+urlpatterns = [
+    path('', views.lista_tarefas, name='lista_tarefas'),
+    path('tarefas/<int:pk>/', views.detalhe_tarefa, name='detalhe_tarefa'),
+    path('tarefas/<int:pk>/status/', views.status_tarefa, name='status_tarefa'),
+    path('tarefas/<int:pk>/download/', views.download_tarefa, name='download_tarefa'),
+]
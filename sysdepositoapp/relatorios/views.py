@@ -0,0 +1,60 @@
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+
+from .models import TarefaRelatorio
+
+# Tipos de PDF que eram baixados como anexo; os demais abrem no navegador
+TIPOS_ANEXO = {'entrega'}
+
+
+def _tarefa_do_usuario(request, pk):
+    tarefa = get_object_or_404(TarefaRelatorio, pk=pk)
+    if tarefa.usuario_id != request.user.id and not request.user.is_staff:
+        raise Http404
+    return tarefa
+
+
+@login_required
+def lista_tarefas(request):
+    """Relatórios pedidos pelo usuário (para baixar depois)"""
+    tarefas = TarefaRelatorio.objects.filter(usuario=request.user)[:50]
+    context = {'tarefas': tarefas}
+    return render(request, 'relatorios/lista_tarefas.html', context)
+
+
+@login_required
+def detalhe_tarefa(request, pk):
+    """Página de acompanhamento; recarrega sozinha até o PDF ficar pronto"""
+    tarefa = _tarefa_do_usuario(request, pk)
+    context = {'tarefa': tarefa}
+    return render(request, 'relatorios/detalhe_tarefa.html', context)
+
+
+@login_required
+def status_tarefa(request, pk):
+    """Status em JSON para consulta periódica (polling)"""
+    tarefa = _tarefa_do_usuario(request, pk)
+    return JsonResponse({
+        'id': tarefa.pk,
+        'status': tarefa.status,
+        'status_display': tarefa.get_status_display(),
+        'erro': tarefa.erro,
+        'download_url': reverse('relatorios:download_tarefa', args=[tarefa.pk]) if tarefa.status == 'concluida' else None,
+    })
+
+
+@login_required
+def download_tarefa(request, pk):
+    """Entrega o PDF gerado pelo worker"""
+    tarefa = _tarefa_do_usuario(request, pk)
+    if tarefa.status != 'concluida' or not tarefa.arquivo:
+        raise Http404('Relatório ainda não disponível')
+
+    return FileResponse(
+        tarefa.arquivo.open('rb'),
+        as_attachment=tarefa.tipo in TIPOS_ANEXO,
+        filename=tarefa.nome_arquivo,
+        content_type='application/pdf',
+    )
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'estoque',
     'entrega',
     'escola',
+    'relatorios',
 ]
 
 MIDDLEWARE = [
@@ -81,6 +82,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Banco de teste em arquivo: o SQLite em memória (cache compartilhado) não
+        # aceita escritas concorrentes, e os testes de concorrência usam threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Cache no banco, compartilhado entre os workers web e os comandos de manutenção:
+# as gerações que invalidam dashboard, relatórios e totais do arquivo precisam
+# avançar para todos os processos, não só para o que gravou. A tabela é criada
+# pela migração estoque.0008_tabela_cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'sysdeposito_cache',
     }
 }
 
@@ -122,10 +137,38 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
+# Arquivos gerados (PDFs da fila de relatórios)
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Login settings
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGIN_URL = '/login/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Previsão de ruptura e sugestão de compra (comando forecast_stock)
+ESTOQUE_CICLO_COMPRA_DIAS = 30  # intervalo entre compras
+ESTOQUE_PRAZO_ENTREGA_DIAS = 7  # do pedido ao recebimento
+
+# Arquivamento de movimentações antigas (comando archive_movements)
+ESTOQUE_ARQUIVO_DIR = BASE_DIR / 'arquivo' / 'movimentacoes'
+ESTOQUE_ARQUIVO_HORIZONTE_DIAS = 2 * 365  # anos inteiros antes disso saem da tabela
+
+# Fila de relatórios em PDF (processada pelo comando pdf_worker)
+RELATORIOS_MAX_SIMULTANEOS = 2  # PDFs em processamento ao mesmo tempo
+RELATORIOS_MAX_PENDENTES_POR_USUARIO = 5
+RELATORIOS_TEMPO_MAXIMO_PROCESSAMENTO = 600  # segundos até a tarefa voltar para a fila
+RELATORIOS_MAX_TENTATIVAS = 3  # reservas de uma tarefa travada antes de marcá-la com erro
+RELATORIOS_PDF_PROCESSOS = 2  # pool de processos para o WeasyPrint (0 = no próprio processo)
+RELATORIOS_PDF_TAREFAS_POR_PROCESSO = 50  # PDFs antes de reciclar o processo
+RELATORIOS_PDF_TEMPO_LIMITE = 120  # segundos por PDF
+RELATORIOS_PDF_LINHAS_POR_BLOCO = 2000  # linhas renderizadas e diagramadas de cada vez
+RELATORIOS_PDF_MAX_LINHAS = 20000  # acima disso o relatório é truncado com aviso
+RELATORIOS_PDF_ESTILOS_DIR = BASE_DIR / 'templates'  # folhas de estilo dos PDFs, ao lado dos templates
+
+# Cache em disco dos PDFs (comprovantes de entrega e de movimentação), endereçado pelo conteúdo
+RELATORIOS_CACHE_PDF_DIR = BASE_DIR / 'cache' / 'pdf'
+RELATORIOS_CACHE_PDF_MAX_BYTES = 200 * 1024 * 1024  # acima disso os menos usados são removidos
@@ -27,4 +27,5 @@ urlpatterns = [
     path('estoque/', include('estoque.urls')),
     path('entrega/', include('entrega.urls')),
     path('escola/', include('escola.urls')),
+    path('relatorios/', include('relatorios.urls')),
 ]